@@ -0,0 +1,138 @@
+import glob
+import os
+import re
+import sqlite3
+import pandas as pd
+from analyzers.prosody import FEATURE_COLUMNS, TRIM_COLUMNS, PRAAT_VERSION
+from analyzers.records import FeatureRecord, DUPLICATE_COLUMN, EXTRACTOR_COLUMN, typed
+
+
+# sqlite store of already extracted features, keyed by slug (TED) or video url (playlists) and
+# extractor version so that re-crawls only download and analyze new items
+class FeatureStore:
+    # check_same_thread=False lets other threads use the store, the caller serializes their calls
+    def __init__(self, path="../data/features.sqlite", check_same_thread=True):
+        new = not os.path.exists(path)
+        self.conn = sqlite3.connect(path, check_same_thread=check_same_thread)
+        columns = ", ".join(f'"{c}" REAL' for c in FEATURE_COLUMNS)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS features (key TEXT, version TEXT, {columns}, PRIMARY KEY (key, version))"
+        )
+        # the non-speech trimmed by the native extractor, mysptotal rows have none
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS trims (key TEXT, version TEXT, trimmed_seconds REAL, trimmed_spans TEXT, PRIMARY KEY (key, version))"
+        )
+        # items that weren't analyzed because they are copies of another item, see Deduplicator
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS duplicates (key TEXT, version TEXT, duplicate_of TEXT, PRIMARY KEY (key, version))"
+        )
+        self.conn.commit()
+
+        # the analyzed_*.csv files were made with mysptotal, so they seed the praat version
+        if new:
+            self.import_csvs()
+
+    # returns a DataFrame with the key, the features (and trimmed spans), the key of the original of
+    # a duplicate and the extractor version of the given keys that are in the store
+    def get(self, keys, version):
+        keys = list(keys)
+        rows = []
+        # sqlite limits the amount of query parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i : i + 500]
+            rows.extend(
+                self.conn.execute(
+                    f"SELECT f.*, t.trimmed_seconds, t.trimmed_spans, d.duplicate_of FROM features f LEFT JOIN trims t USING (key, version) LEFT JOIN duplicates d USING (key, version) WHERE f.version = ? AND f.key IN ({', '.join('?' * len(chunk))})",
+                    [version, *chunk],
+                ).fetchall()
+            )
+        df = pd.DataFrame(
+            rows,
+            columns=[
+                "key",
+                "version",
+                *FEATURE_COLUMNS,
+                *TRIM_COLUMNS,
+                DUPLICATE_COLUMN,
+            ],
+        )
+        df = df.drop(columns="version")
+        if df[TRIM_COLUMNS].isna().all(axis=None):
+            df = df.drop(columns=TRIM_COLUMNS)
+        df[EXTRACTOR_COLUMN] = version
+        return typed(df)
+
+    # like get, but every key gets the features of the first of versions that has them, so the
+    # seeded Praat features are reused for the talks that the native extractor hasn't analyzed
+    def get_first(self, keys, versions):
+        keys = list(keys)
+        frames = []
+        for version in versions:
+            df = self.get(keys, version)
+            if len(df):
+                frames.append(df)
+                found = set(df["key"])
+                keys = [key for key in keys if key not in found]
+        if not frames:
+            return self.get([], versions[0])
+        return typed(pd.concat(frames, ignore_index=True))
+
+    # the keys that have features of any version
+    def keys(self):
+        return {
+            key for (key,) in self.conn.execute("SELECT DISTINCT key FROM features")
+        }
+
+    # stores the features of a single item, features is a FeatureRecord, a dict or a one row DataFrame
+    def put(self, key, version, features):
+        if isinstance(features, FeatureRecord):
+            features = features.to_dict()
+        elif isinstance(features, pd.DataFrame):
+            features = features.iloc[0].to_dict()
+        values = [float(features[c]) for c in FEATURE_COLUMNS]
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO features VALUES (?, ?, {', '.join('?' * len(FEATURE_COLUMNS))})",
+            [key, version, *values],
+        )
+        if all(c in features for c in TRIM_COLUMNS):
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trims VALUES (?, ?, ?, ?)",
+                [key, version, *(features[c] for c in TRIM_COLUMNS)],
+            )
+        if features.get(DUPLICATE_COLUMN):
+            self.conn.execute(
+                "INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?)",
+                [key, version, features[DUPLICATE_COLUMN]],
+            )
+        self.conn.commit()
+
+    # stores every row of a DataFrame, keyed by key_column
+    def put_many(self, df, key_column, version):
+        df = df.dropna(subset=[key_column, *FEATURE_COLUMNS])
+        self.conn.executemany(
+            f"INSERT OR IGNORE INTO features VALUES (?, ?, {', '.join('?' * len(FEATURE_COLUMNS))})",
+            [
+                [key, version, *values]
+                for key, values in zip(
+                    df[key_column], df[FEATURE_COLUMNS].astype(float).values.tolist()
+                )
+            ],
+        )
+        self.conn.commit()
+
+    # imports the mysptotal features of the analyzed_*.csv files
+    def import_csvs(self, csv_dir="../data/csv"):
+        for f in glob.glob(os.path.join(csv_dir, "analyzed_*.csv")):
+            name = os.path.basename(f)
+            if re.match(r"^analyzed_speeches", name):
+                key_column = "slug"
+            elif re.match(r"^analyzed_playlist", name):
+                key_column = "url"
+            else:
+                continue
+            df = pd.read_csv(f)
+            if key_column in df.columns and set(FEATURE_COLUMNS) <= set(df.columns):
+                self.put_many(df, key_column, PRAAT_VERSION)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,274 @@
+import os
+import sqlite3
+import threading
+from collections import Counter
+import numpy as np
+from analyzers.prosody import (
+    read_pcm,
+    read_wav,
+    downsample,
+    speech_frames,
+    audio_name,
+    PCM_RATE,
+)
+from analyzers.feature_store import FeatureStore
+from analyzers.records import FeatureRecord
+from analyzers.run_report import report
+
+# seconds that are fingerprinted after the first speech in the first FINGERPRINT_SEARCH seconds, so
+# that a different amount of leading silence doesn't matter, and after a FINGERPRINT_LEAD_IN of that
+# speech: talks often open with the same intro or sponsor voice-over, which would match
+FINGERPRINT_LEAD_IN = 20
+FINGERPRINT_SECONDS = 60
+FINGERPRINT_SEARCH = 60
+
+# audios with less than this after the lead-in aren't fingerprinted
+MIN_FINGERPRINT_SECONDS = 10
+
+# a 32 bit sub-fingerprint per frame of 256 ms every 8 ms, from the energy differences of 33 bands
+# between 300 and 3000 Hz, like Haitsma & Kalker's fingerprint
+FRAME = 4096
+HOP = 128
+BANDS = np.geomspace(300, 3000, 34)
+
+# frames this many dB below the loud frames (pauses) have no sub-fingerprint (0), their bits would
+# only depend on the noise floor of the copy
+QUIET_DB = 25
+
+# the bits of a sub-fingerprint whose energy difference is the closest to 0 are the ones a re-encoded
+# copy flips, a query also looks up every combination of its FLIP_BITS weakest bits flipped
+FLIP_BITS = 5
+
+# two fingerprints are of the same audio when at most this share of their bits differ (unrelated
+# audios differ in about half) in at least MIN_AGREEMENT of their BLOCK_SECONDS blocks and overall,
+# a shared stretch of a few seconds brings the mean error down but not the share of agreeing blocks
+MAX_BIT_ERROR = 0.2
+BLOCK_SECONDS = 2
+MIN_AGREEMENT = 0.8
+
+# every INDEX_STEP:th sub-fingerprint is indexed, a query looks up all of its own so a copy that
+# starts at a different sample still has sub-fingerprints aligned with the indexed ones
+INDEX_STEP = 8
+
+# candidates (audio, offset) with the most matching sub-fingerprints that are compared bit by bit
+CANDIDATES = 5
+
+
+# the fingerprint of a mono signal as an array of uint32 sub-fingerprints and the positions of the
+# FLIP_BITS weakest bits of each, None if the signal has too little speech
+def fingerprint(x, sr):
+    x, sr = downsample(np.asarray(x, dtype=np.float32), sr)
+    x = x[: int((FINGERPRINT_SEARCH + FINGERPRINT_LEAD_IN + FINGERPRINT_SECONDS) * sr)]
+    speech, frame = speech_frames(x, sr)
+    start = int(np.argmax(speech)) * frame if speech.any() else 0
+    start += int(FINGERPRINT_LEAD_IN * sr)
+    x = x[start : start + int(FINGERPRINT_SECONDS * sr)]
+    if len(x) < MIN_FINGERPRINT_SECONDS * sr:
+        return None
+
+    frames = np.lib.stride_tricks.sliding_window_view(x, FRAME)[::HOP]
+    w = np.hanning(FRAME).astype(np.float32)
+    edges = np.round(BANDS * FRAME / sr).astype(np.int64)
+    energy = np.empty((len(frames), len(BANDS) - 1))
+    for i in range(0, len(frames), 256):
+        spec = np.abs(np.fft.rfft(frames[i : i + 256] * w, axis=1)) ** 2
+        energy[i : i + 256] = np.add.reduceat(spec, edges, axis=1)[:, :-1]
+    d = energy[:, :-1] - energy[:, 1:]
+    dd = d[1:] - d[:-1]
+    fp = np.packbits(dd > 0, axis=1, bitorder="little").view("<u4").ravel()
+    weak = np.argsort(np.abs(dd), axis=1)[:, :FLIP_BITS].astype(np.uint32)
+
+    db = 10 * np.log10(np.maximum(energy.sum(axis=1), 1e-12))
+    quiet = db < np.quantile(db, 0.95) - QUIET_DB
+    fp[quiet[1:] | quiet[:-1]] = 0
+    return fp, weak
+
+
+# every sub-fingerprint with every combination of its weak bits flipped, as a len(fp) x
+# 2**FLIP_BITS array whose first column is fp
+def flip_variants(fp, weak):
+    masks = np.zeros((len(fp), 1 << weak.shape[1]), dtype=np.uint32)
+    for combo in range(1, masks.shape[1]):
+        for bit in range(weak.shape[1]):
+            if combo >> bit & 1:
+                masks[:, combo] |= np.uint32(1) << weak[:, bit]
+    return fp[:, None] ^ masks
+
+
+# the fingerprint of a wav path or a (name, pcm) pair from decode_audio, only the part fingerprint
+# looks at is read so the download thread never holds a whole recording as floats
+def audio_fingerprint(audio):
+    seconds = FINGERPRINT_SEARCH + FINGERPRINT_LEAD_IN + FINGERPRINT_SECONDS
+    if isinstance(audio, str):
+        x, sr = read_wav(audio, seconds)
+    else:
+        x, sr = read_pcm(audio[1], seconds), PCM_RATE
+    return fingerprint(x, sr)
+
+
+# share of the differing bits of the overlapping parts of a and b, with a[i] aligned to
+# b[i - offset] and the quiet frames of either left out, and the share of the blocks of the overlap
+# with at most MAX_BIT_ERROR, (1, 0) if less than half of the shorter one overlaps
+def bit_error(a, b, offset):
+    start = max(0, offset)
+    end = min(len(a), len(b) + offset)
+    if end - start < min(len(a), len(b)) / 2:
+        return 1.0, 0.0
+    a = a[start:end]
+    b = b[start - offset : end - offset]
+    both = (a != 0) & (b != 0)
+    if both.sum() < (end - start) / 4:
+        return 1.0, 0.0
+    diff = np.bitwise_xor(a, b).view(np.uint8)
+    bits = np.unpackbits(diff).reshape(-1, 32).sum(axis=1)
+
+    # blocks with too few frames that aren't quiet in both count as disagreeing
+    block = int(BLOCK_SECONDS * PCM_RATE / HOP)
+    edges = np.arange(0, len(a), block)
+    frames = np.add.reduceat(both, edges)
+    errors = np.add.reduceat(np.where(both, bits, 0), edges) / (32 * frames.clip(1))
+    agreeing = (frames >= block / 4) & (errors <= MAX_BIT_ERROR)
+    return float(bits[both].sum() / (32 * both.sum())), float(agreeing.mean())
+
+
+# sqlite index of the fingerprints of analyzed audios, keyed like the feature store by slug (TED)
+# or video url (playlists), safe to use from the download threads
+class FingerprintIndex:
+    def __init__(self, path="../data/fingerprints.sqlite"):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (key TEXT PRIMARY KEY, fingerprint BLOB)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS subprints (value INTEGER, key TEXT, position INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS subprints_value ON subprints (value)"
+        )
+        self.conn.commit()
+
+    def add(self, key, fp):
+        with self.lock:
+            self.conn.execute("DELETE FROM subprints WHERE key = ?", [key])
+            self.conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?)",
+                [key, fp.astype("<u4").tobytes()],
+            )
+            self.conn.executemany(
+                "INSERT INTO subprints VALUES (?, ?, ?)",
+                [
+                    (int(fp[i]), key, i)
+                    for i in range(0, len(fp), INDEX_STEP)
+                    if 0 < fp[i] < 0xFFFFFFFF
+                ],
+            )
+            self.conn.commit()
+
+    # the (key, bit error) of the indexed audio that fp (with the weak bits of fingerprint) is a copy
+    # of, None if there is none, the audio's own key is never matched
+    def match(self, fp, weak, exclude=None):
+        positions = {}
+        variants = flip_variants(fp, weak)
+        variants[fp == 0] = 0
+        for i, row in enumerate(variants.tolist()):
+            for value in row:
+                if 0 < value < 0xFFFFFFFF:
+                    positions.setdefault(value, []).append(i)
+
+        votes = Counter()
+        values = list(positions)
+        with self.lock:
+            # sqlite limits the amount of query parameters
+            for i in range(0, len(values), 500):
+                chunk = values[i : i + 500]
+                for value, key, position in self.conn.execute(
+                    f"SELECT value, key, position FROM subprints WHERE value IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ):
+                    if key != exclude:
+                        for q in positions[value]:
+                            votes[(key, q - position)] += 1
+
+            best = None
+            for (key, offset), _ in votes.most_common(CANDIDATES):
+                (blob,) = self.conn.execute(
+                    "SELECT fingerprint FROM fingerprints WHERE key = ?", [key]
+                ).fetchone()
+                error, agreement = bit_error(
+                    fp, np.frombuffer(blob, dtype="<u4"), offset
+                )
+                if (
+                    error <= MAX_BIT_ERROR
+                    and agreement >= MIN_AGREEMENT
+                    and (best is None or error < best[1])
+                ):
+                    best = (key, error)
+        return best
+
+    def close(self):
+        self.conn.close()
+
+
+# skips the analysis of audios that are copies of an already analyzed audio (the same talk in
+# several playlists, TED's dubbing variants), a minute of speech of every downloaded audio is
+# fingerprinted and looked up in the index before the prosody extraction
+# a copy of an audio that is still being analyzed (or failed) is analyzed too, an audio is only
+# indexed once its features are stored
+class Deduplicator:
+    def __init__(
+        self, version, index_path="../data/fingerprints.sqlite", store_path=None
+    ):
+        self.version = version
+        self.index = FingerprintIndex(index_path)
+        # the download threads read the original's features with their own connection
+        self.store = FeatureStore(
+            store_path or "../data/features.sqlite", check_same_thread=False
+        )
+        self.lock = threading.Lock()
+        # fingerprints of the audios being analyzed, by key
+        self.pending = {}
+
+    # called by pipeline.stream in a download thread for the audio of key, returns the record of
+    # the original's features with duplicate_of set when the audio is a copy, or None to analyze it
+    def skip(self, key, audio):
+        name = audio_name(audio) if isinstance(audio, str) else audio[0]
+        with report.stage("fingerprint", name):
+            result = audio_fingerprint(audio)
+            if result is None:
+                return None
+            fp, weak = result
+            match = self.index.match(fp, weak, exclude=key)
+        if match is None:
+            with self.lock:
+                self.pending[key] = fp
+            return None
+        original, error = match
+        with self.lock:
+            cached = self.store.get([original], self.version)
+        if not len(cached):
+            return None
+
+        print(
+            f"Skipping {name}: duplicate of {original} ({error:.0%} of the bits differ)"
+        )
+        return FeatureRecord.from_features(
+            name, cached.iloc[0].to_dict(), duplicate_of=original
+        )
+
+    # called once the features of key are stored, its audio can be matched from now on
+    def indexed(self, key):
+        with self.lock:
+            fp = self.pending.pop(key, None)
+        if fp is not None:
+            self.index.add(key, fp)
+
+    # called when the analysis of key failed, a copy of its audio is analyzed again
+    def discard(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def close(self):
+        self.index.close()
+        self.store.close()
@@ -0,0 +1,100 @@
+import json
+import os
+
+FETCHED = "fetched"
+DOWNLOADED = "downloaded"
+ANALYZED = "analyzed"
+FAILED = "failed"
+
+
+# checkpoint of a crawl: the status of every slug, the analysis CSVs written so far and the index
+# the next CSV starts from, so that an interrupted run can be resumed
+class Manifest:
+    def __init__(self, path="../data/manifest.json", resume=False):
+        self.path = path
+        self.data = {
+            "status": {},
+            "csvs": [],
+            "next_idx": 0,
+            "merged_size": None,
+            "merged_columns": None,
+        }
+        if resume and os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = json.load(f)
+
+    @property
+    def fetched(self):
+        return bool(self.data["status"])
+
+    @property
+    def next_idx(self):
+        return self.data["next_idx"]
+
+    @property
+    def csvs(self):
+        return self.data["csvs"]
+
+    # the name of the merged CSV of the crawl when it isn't given by its arguments (delta crawls)
+    @property
+    def name(self):
+        return self.data.get("name")
+
+    @name.setter
+    def name(self, name):
+        self.data["name"] = name
+
+    # size of the partial merged CSV at the last checkpoint
+    @property
+    def merged_size(self):
+        return self.data.get("merged_size")
+
+    # header of the partial merged CSV at the last checkpoint
+    @property
+    def merged_columns(self):
+        return self.data.get("merged_columns")
+
+    # checkpoints the partial merged CSV alone, after it was rewritten with new columns
+    def set_merged(self, size, columns):
+        self.data["merged_size"] = size
+        self.data["merged_columns"] = columns
+        self.save()
+
+    def status(self, key):
+        return self.data["status"].get(key)
+
+    def set(self, key, status):
+        self.data["status"][key] = status
+
+    # records an analysis CSV of the rows start-end and marks its keys as analyzed, merged_size and
+    # merged_columns are the size and header of the partial merged CSV after the rows were appended
+    def add_csv(self, path, keys, end, merged_size=None, merged_columns=None):
+        if path and path not in self.data["csvs"]:
+            self.data["csvs"].append(path)
+        for key in keys:
+            self.set(key, ANALYZED)
+        self.data["next_idx"] = end + 1
+        if merged_size is not None:
+            self.data["merged_size"] = merged_size
+            self.data["merged_columns"] = merged_columns
+        self.save()
+
+    # writes the manifest atomically so a crash can't leave a half written file
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# loads the manifest of a finished or interrupted crawl, None if there isn't one
+def load_manifest(path="../data/manifest.json"):
+    if not os.path.exists(path):
+        return None
+    return Manifest(path, resume=True)
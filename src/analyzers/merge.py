@@ -0,0 +1,149 @@
+import json
+import os
+import pandas as pd
+from analyzers.shard import find_shards, shard_of
+
+
+# loads speeches.json/playlist_data.json as a table indexed by key, duplicate keys are dropped so
+# that joining a batch with it can never multiply rows
+def load_metadata(path, key):
+    with open(path, "r", encoding="utf-8") as f:
+        df = pd.DataFrame(json.load(f))
+    if df.empty:
+        return pd.DataFrame(index=pd.Index([], name=key))
+    duplicated = df[key].duplicated()
+    if duplicated.any():
+        print(f"Dropping {duplicated.sum()} rows with a duplicate {key} from {path}")
+    return df[~duplicated].set_index(key)
+
+
+# the in-progress version of a merged CSV, renamed to the final name once the run is done
+def partial_path(path):
+    return os.path.join(os.path.dirname(path), "partial_" + os.path.basename(path))
+
+
+# the merged CSV of a run, every analyzed batch is joined with the metadata and appended to it as
+# soon as it's saved so only one batch is ever in memory
+# size and columns are the size and header the file had at the last checkpoint, a resumed run cuts
+# off anything written after it, without a size the file is started from scratch
+# on_widen(size, columns) is called when new columns were added to the file, to checkpoint it
+class MergedOutput:
+    def __init__(self, path, metadata, key, size=None, columns=None, on_widen=None):
+        self.path = partial_path(path)
+        self.final_path = path
+        self.metadata = metadata
+        self.key = key
+        self.columns = None
+        self.on_widen = on_widen
+
+        if size is None:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        elif os.path.exists(self.path):
+            header = list(pd.read_csv(self.path, nrows=0).columns) if size else []
+            # a file that was widened after the checkpoint holds only the checkpointed rows, with
+            # longer lines, see widen
+            if columns is None or header == columns:
+                with open(self.path, "r+b") as f:
+                    f.truncate(size)
+            else:
+                print(f"{self.path} was widened after the last checkpoint, keeping it")
+            if size:
+                self.columns = header
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    # joins a batch with the metadata by key and appends it, returns the new size of the file
+    def append(self, df):
+        columns = [c for c in self.metadata.columns if c not in df.columns]
+        joined = pd.merge(
+            df,
+            self.metadata[columns],
+            left_on=self.key,
+            right_index=True,
+            how="left",
+            validate="many_to_one",
+        )
+        # every batch is written in the column order of the first one, columns that a later batch
+        # brings (the trim columns, duplicate_of) are added to the end of the file's columns
+        if self.columns is None or self.size == 0:
+            self.columns = list(joined.columns)
+            header = True
+        else:
+            new = [c for c in joined.columns if c not in self.columns]
+            if new:
+                self.widen(new)
+            joined = joined.reindex(columns=self.columns)
+            header = False
+        joined.to_csv(self.path, mode="a", header=header, index=False)
+        return self.size
+
+    # rewrites the file with the new columns added, empty in the rows already written, the values
+    # are read as text so they are written back unchanged, it's only called before the rows of a
+    # batch are appended so the file holds the rows of the last checkpoint
+    def widen(self, new):
+        print(f"Adding the columns {new} to {self.path}")
+        written = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+        self.columns = self.columns + new
+        tmp = self.path + ".tmp"
+        written.reindex(columns=self.columns, fill_value="").to_csv(tmp, index=False)
+        os.replace(tmp, self.path)
+        # the size of the last checkpoint doesn't fit the rewritten file
+        if self.on_widen:
+            self.on_widen(self.size, self.columns)
+
+    def finish(self):
+        return finish_merged(self.final_path)
+
+
+# moves the partial merged CSV of path to its final name, returns False if there is none
+def finish_merged(path):
+    if not os.path.exists(partial_path(path)):
+        return False
+    os.replace(partial_path(path), path)
+    return True
+
+
+# combines the shard CSVs of a sharded crawl (see shard_path) into the canonical CSV at path
+# all N shards must be there, rows whose key doesn't hash to their shard are reported and a key
+# that is in several shards (or twice in one) is kept only once, the shard CSVs are removed after
+# the canonical CSV is written, returns the amount of rows in it
+def merge_shards(path, key):
+    shards = find_shards(path)
+    if not shards:
+        raise FileNotFoundError(f"No shard CSVs of {path}")
+    counts = {n for _, n in shards}
+    if len(counts) > 1:
+        raise ValueError(
+            f"Shards of {path} were crawled with different N: {sorted(counts)}"
+        )
+    n = counts.pop()
+    missing = [i for i in range(1, n + 1) if (i, n) not in shards]
+    if missing:
+        raise ValueError(f"Missing shards {missing} of {n} for {path}")
+
+    frames = []
+    for (i, _), shard_csv in sorted(shards.items()):
+        df = pd.read_csv(shard_csv, index_col=False)
+        misplaced = df[key].map(lambda k: shard_of(str(k), n) != i)
+        if misplaced.any():
+            print(f"{misplaced.sum()} rows of {shard_csv} belong to other shards")
+        frames.append(df)
+    merged = pd.concat(frames, ignore_index=True)
+
+    duplicated = merged[key].duplicated()
+    if duplicated.any():
+        keys = merged.loc[duplicated, key].unique()
+        print(
+            f"Dropping {duplicated.sum()} rows with a duplicate {key}: {list(keys[:10])}"
+        )
+        merged = merged[~duplicated]
+
+    merged.to_csv(partial_path(path), index=False)
+    os.replace(partial_path(path), path)
+    for shard_csv in shards.values():
+        os.remove(shard_csv)
+    print(f"Merged {n} shards to {path}, {len(merged)} rows")
+    return len(merged)
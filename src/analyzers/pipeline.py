@@ -0,0 +1,344 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from analyzers.prosody import (
+    extract_file,
+    extract_features,
+    read_pcm,
+    audio_name,
+    read_wav,
+    speech_signal,
+    speech_features,
+    trim_columns,
+    split_signal,
+    extract_stats,
+    combine_stats,
+    PCM_RATE,
+    CHUNK_SECONDS,
+)
+from analyzers.records import FeatureRecord
+from analyzers.run_report import report
+from analyzers.scheduler import scheduler
+
+# analyses a worker process runs before it is recycled
+MAX_TASKS_PER_CHILD = 200
+
+
+# runs fn(*args) in a pool worker and returns the result with the seconds it took
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# analyzes a single file with the native extractor
+def analyze_file(wav, c):
+    try:
+        print(f"\n>>> Analyzing: {wav}")
+        features = extract_file(os.path.join(c, "dataset", "audioFiles", wav))
+        if features is None:
+            print(f"Failed {wav}, skipping.")
+            return None
+
+        return FeatureRecord.from_features(audio_name(wav), features)
+
+    except Exception as e:
+        print(f"Error: {wav}: {e} (file skipped)")
+    return None
+
+
+# analyzes a single in-memory pcm buffer from decode_audio with the native extractor
+def analyze_pcm(name, pcm):
+    try:
+        print(f"\n>>> Analyzing: {name}")
+        features = extract_features(read_pcm(pcm), PCM_RATE)
+        if features is None:
+            print(f"Failed {name}, skipping.")
+            return None
+
+        return FeatureRecord.from_features(name, features)
+
+    except Exception as e:
+        print(f"Error: {name}: {e} (file skipped)")
+    return None
+
+
+# the duration in seconds of a wav path or a (name, pcm) pair from decode_audio, from the wav header
+# or the length of the buffer without reading the samples
+def audio_seconds(audio):
+    if isinstance(audio, str):
+        with wave.open(audio, "rb") as w:
+            return w.getnframes() / w.getframerate()
+    return len(audio[1]) / 2 / PCM_RATE
+
+
+# the pool tasks of an audio, (fn, args) pairs, and merge(results), which returns its result or a Split
+class Split:
+    __slots__ = ("tasks", "merge")
+
+    def __init__(self, tasks, merge):
+        self.tasks = tasks
+        self.merge = merge
+
+
+# the first pool task of a long audio, trims it once and returns its record or its windows
+def speech_windows(audio):
+    if isinstance(audio, str):
+        name = audio_name(audio)
+        x, sr = read_wav(audio)
+    else:
+        name, pcm = audio
+        x, sr = read_pcm(pcm), PCM_RATE
+    x, sr, spans = speech_signal(x, sr)
+    # the extract_stats arguments of the windows, the speech duration and the trimmed spans
+    windows = split_signal(x, sr)
+    if windows is not None:
+        return windows, len(x) / sr, spans
+
+    print(f"\n>>> Analyzing: {name}")
+    features = speech_features(x, sr, spans)
+    if features is None:
+        print(f"Failed {name}, skipping.")
+        return None
+    return FeatureRecord.from_features(name, features)
+
+
+# the Split of an audio longer than CHUNK_SECONDS, None for a shorter one (analyze_fn runs on it)
+def split_audio(audio):
+    if audio_seconds(audio) <= CHUNK_SECONDS:
+        return None
+    name = audio_name(audio) if isinstance(audio, str) else audio[0]
+
+    # the windows of the trimmed audio are analyzed in parallel
+    def windows(results):
+        if not isinstance(results[0], tuple):
+            return results[0]
+        windows, duration, spans = results[0]
+        print(f"\n>>> Analyzing: {name} in {len(windows)} windows")
+
+        def merge(stats):
+            features = combine_stats(stats, duration)
+            if features is None:
+                print(f"Failed {name}, skipping.")
+                return None
+            return FeatureRecord.from_features(
+                name, {**features, **trim_columns(spans)}
+            )
+
+        return Split([(extract_stats, window) for window in windows], merge)
+
+    return Split([(speech_windows, (audio,))], windows)
+
+
+# downloads jobs in a thread pool and analyzes them in a persistent process pool, yields a (job,
+# result) pair for every job in completion order, result is None if the download or analysis failed
+def stream(
+    jobs,
+    # returns a wav path, analyzed with analyze_fn(wav, c), or a (name, pcm) pair from decode_audio
+    download,
+    analyze_fn,
+    c,
+    # workers, queue_depth and download_workers only cap what the scheduler allows
+    workers=None,
+    queue_depth=None,
+    download_workers=None,
+    # called with a job once its audio is ready
+    on_download=None,
+    initializer=None,
+    initargs=(),
+    max_tasks_per_child=MAX_TASKS_PER_CHILD,
+    # split(audio) can return a Split to analyze a long audio in parallel
+    split=None,
+    # dedup(job, audio) can return the result of a copy that isn't analyzed, it's yielded as is
+    dedup=None,
+):
+    # recycling workers doesn't work with fork, a fork server started with the analysis module
+    # imported keeps the start of a new worker cheap, spawn is used where there is no fork server
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        mp_context.set_forkserver_preload([analyze_fn.__module__])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+
+    workers = min(workers or scheduler.cpus, scheduler.max_workers("extract"))
+    download_workers = download_workers or scheduler.max_workers("download")
+    cap = threading.BoundedSemaphore(queue_depth) if queue_depth else None
+    events = queue.Queue()
+    # (fn, args, future list index, audio state) of the tasks waiting for a place in the pool
+    pending = deque()
+
+    # an audio's place in the scheduler's "audio" limit is taken before its download and freed once
+    # it's analyzed or has failed
+    def take_place():
+        if cap:
+            cap.acquire()
+        scheduler.start("audio")
+
+    def free_place():
+        scheduler.finish("audio")
+        if cap:
+            cap.release()
+
+    def fetch(job):
+        take_place()
+        audio = None
+        plan = None
+        try:
+            audio = download(*job)
+        except Exception as e:
+            print(f"Skipping {job}: {e}")
+        # dedup and split run in the download thread, split only reads the duration
+        if audio and dedup:
+            skipped = None
+            try:
+                skipped = dedup(job, audio)
+            except Exception as e:
+                print(f"Couldn't fingerprint {job}, analyzing it: {e}")
+            if skipped is not None:
+                if isinstance(audio, str):
+                    try:
+                        os.remove(audio)
+                    except OSError:
+                        pass
+                free_place()
+                events.put(("skipped", job, skipped))
+                return
+        if audio and split:
+            try:
+                plan = split(audio)
+            except Exception as e:
+                print(f"Couldn't split {job}, analyzing it whole: {e}")
+        if not audio or (isinstance(audio, str) and not os.path.exists(audio)):
+            free_place()
+            audio = None
+        events.put(("downloaded", job, (audio, plan)))
+
+    # seconds is the time the workers already spent on the audio in the earlier Splits
+    def analyzed(futures, merge, job, audio, seconds):
+        is_file = isinstance(audio, str)
+        name = os.path.basename(audio) if is_file else audio[0]
+        error = None
+        try:
+            results = []
+            for future in futures:
+                result, took = future.result()
+                results.append(result)
+                seconds += took
+            result = merge(results) if merge else results[0]
+            if isinstance(result, Split):
+                # its tasks are queued by the main loop
+                events.put(("split", job, (audio, result, seconds)))
+                return
+            if result is None:
+                error = "no features extracted"
+        except Exception as e:
+            print(f"Error: {name}: {e} (file skipped)")
+            result = None
+            error = f"{type(e).__name__}: {e}"
+        # the time the workers spent on the audio, the tasks of a split audio are summed
+        report.record("extract", name, seconds, error=error)
+        # a wav is deleted as soon as it's analyzed
+        if is_file:
+            try:
+                os.remove(audio)
+            except OSError:
+                pass
+        free_place()
+        events.put(("analyzed", job, result))
+
+    # runs in the pool worker's result thread when a task is done, frees its place and wakes the
+    # main loop up to submit more
+    def task_done(future):
+        try:
+            seconds = future.result()[1]
+        except Exception:
+            seconds = None
+        scheduler.finish("extract", seconds)
+        events.put(("task_done", None, None))
+
+    def submit_pending(pool):
+        while (
+            pending
+            and (
+                scheduler.in_flight["extract"]
+                < min(workers, scheduler.limits["extract"])
+            )
+            and scheduler.try_start("extract")
+        ):
+            fn, args, i, state = pending.popleft()
+            future = pool.submit(timed, fn, *args)
+            future.add_done_callback(task_done)
+            state["futures"][i] = future
+            future.add_done_callback(state["done"])
+
+    # queues the tasks of an audio, merge (None for a single task) is called with their results once
+    # the last of them is done
+    def enqueue(pool, job, audio, tasks, merge, seconds=0):
+        futures = [None] * len(tasks)
+        left = [len(tasks)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                left[0] -= 1
+                last = left[0] == 0
+            if last:
+                analyzed(futures, merge, job, audio, seconds)
+
+        if not tasks:
+            analyzed(futures, merge, job, audio, seconds)
+            return
+        state = {"futures": futures, "done": done}
+        for i, (fn, args) in enumerate(tasks):
+            pending.append((fn, args, i, state))
+        submit_pending(pool)
+
+    downloads_left = len(jobs)
+    analyses_left = 0
+    with (
+        ThreadPoolExecutor(max_workers=download_workers) as downloader,
+        ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_context,
+            initializer=initializer,
+            initargs=initargs,
+            max_tasks_per_child=max_tasks_per_child,
+        ) as pool,
+    ):
+        for job in jobs:
+            downloader.submit(fetch, job)
+
+        while downloads_left or analyses_left:
+            kind, job, value = events.get()
+            if kind == "task_done":
+                submit_pending(pool)
+            elif kind == "skipped":
+                downloads_left -= 1
+                yield job, value
+            elif kind == "downloaded":
+                downloads_left -= 1
+                audio, plan = value
+                if audio is None:
+                    yield job, None
+                else:
+                    if on_download:
+                        on_download(job)
+                    analyses_left += 1
+                    if plan:
+                        enqueue(pool, job, audio, plan.tasks, plan.merge)
+                    elif isinstance(audio, str):
+                        tasks = [(analyze_fn, (os.path.basename(audio), c))]
+                        enqueue(pool, job, audio, tasks, None)
+                    else:
+                        enqueue(pool, job, audio, [(analyze_fn, audio)], None)
+            elif kind == "split":
+                audio, plan, seconds = value
+                enqueue(pool, job, audio, plan.tasks, plan.merge, seconds)
+            else:
+                analyses_left -= 1
+                yield job, value
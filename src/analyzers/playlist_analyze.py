@@ -1,13 +1,18 @@
 import myprosody as mysp
 import os
-import pandas as pd
 import io
 import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from analyzers.prosody import warm_up, EXTRACTOR_VERSION, PRAAT_VERSION
+from analyzers.feature_store import FeatureStore
+from analyzers.records import FeatureRecord, records_frame
+from analyzers.fingerprint import Deduplicator
+from analyzers.pipeline import stream, analyze_file, analyze_pcm, split_audio
+from analyzers.merge import MergedOutput, load_metadata
+from analyzers.shard import shard_path
 from scrapers.playlist_scraper import PlaylistScraper
 
 
-# parses the output string of mysptotal
+# parses the output string of mysptotal to a FeatureRecord, the printed values become floats
 def parse_mysptotal_output(output, wav):
     lines = [line.strip() for line in output.splitlines() if line.strip()]
 
@@ -26,15 +31,14 @@ def parse_mysptotal_output(output, wav):
             rows.append((metric, value))
 
         if rows:
-            df = pd.DataFrame([dict(rows)])
-            df["title"] = os.path.splitext(os.path.basename(wav))[0]
-            return df
+            name = os.path.splitext(os.path.basename(wav))[0]
+            return FeatureRecord.from_features(name, dict(rows))
 
     return None
 
 
-# analyzes a single file
-def analyze_file(wav, c):
+# analyzes a single file by running myspsolution.praat through mysptotal
+def analyze_file_praat(wav, c):
     p = os.path.splitext(wav)[0]
     try:
         print(f"\n>>> Analyzing: {wav}")
@@ -55,41 +59,117 @@ def analyze_file(wav, c):
     return None
 
 
-# analyzes audios
-def analyze(url, n_per_time=5):
+# saves the records of the audios start-end made by the extractor version with their urls to a
+# CSV, returns the saved rows
+def save_results(results, urls, start, end, total, version):
+    if results:
+        final_df = records_frame(results, "title", version)
+        final_df["url"] = urls
+        final_df.to_csv(f"../data/csv/analysis_{start}_{end}.csv", index=False)
+        print(f"\nResults of range {start}-{end} put together to a CSV-file")
+        print(f"Progress {(end + 1) / total * 100}%")
+        return final_df
+    print("No results")
+    return None
+
+
+# analyzes audios, downloads overlap with the analysis and the scheduler decides how many audios are in
+# flight at once, a CSV is saved every n_per_time analyzed audios
+# with pcm the audios are decoded to 16 kHz buffers in memory and no wavs are written, praat needs the wavs
+# with cache the feature store is consulted first and only items that aren't in it are downloaded
+# with the current extractor's features or else the seeded Praat ones, only the former with reanalyze
+# long videos are analyzed in windows in parallel, only praat still skips videos longer than an hour
+# with shard (i, N) only the videos of the i:th of N disjoint shards are analyzed, to
+# analyzed_playlist_<id>_shard<i>of<N>.csv, see merge_shards
+# with dedup videos whose audio is a copy of an analyzed video (the same talk in several playlists)
+# get its features and its url in duplicate_of instead of being analyzed, see Deduplicator
+def analyze(
+    url,
+    n_per_time=5,
+    praat=False,
+    pcm=True,
+    cache=True,
+    shard=None,
+    dedup=True,
+    reanalyze=False,
+):
     c = os.path.abspath("../myprosody")
-    # AudioFiles-folder
-    audio_dir = os.path.join(c, "dataset", "audioFiles")
-
-    workers = n_per_time if n_per_time <= 20 else 20  # limit workers to 20 for now
-
-    s = PlaylistScraper(url)
-    n = s.last_idx
-
-    # analyze n_per_time audios per time (because of space constraints)
-    for start in range(0, n, n_per_time):
-        end = min(start + n_per_time - 1, n - 1)
-        s.get_audios(n_per_time)
-        wav_files = [f for f in os.listdir(audio_dir) if f.lower().endswith(".wav")]
-        results = []
-
-        # Process files in parallel
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            future_to_wav = {
-                executor.submit(analyze_file, wav, c): wav for wav in wav_files
-            }
-            for future in as_completed(future_to_wav):
-                df = future.result()
-                if df is not None:
-                    results.append(df)
-
-        # Save combined results to a CSV
-        if results:
-            final_df = pd.concat(results, ignore_index=True)
-            final_df.to_csv(f"../data/csv/analysis_{start}_{end}.csv", index=False)
-            print(f"\nResults of range {start}-{end} put together to a CSV-file")
-            print(f"Progress {(end + 1) / n * 100}%")
-        else:
-            print("No results")
-
-        s.clear_audios()
+
+    pcm = pcm and not praat
+    if pcm:
+        analyze_fn = analyze_pcm
+    else:
+        analyze_fn = analyze_file_praat if praat else analyze_file
+
+    s = PlaylistScraper(url, max_duration=3600 if praat else None, shard=shard)
+    jobs = s.audio_jobs()
+
+    # every saved batch is also appended to the merged CSV, joined with the playlist data by url
+    # because titles aren't unique
+    playlist_id = url.split("list=")[-1]
+    merged = MergedOutput(
+        shard_path(f"../data/csv/analyzed_playlist_{playlist_id}.csv", shard),
+        load_metadata("../data/playlist_data.json", "url"),
+        "url",
+    )
+
+    store = FeatureStore()
+    version = PRAAT_VERSION if praat else EXTRACTOR_VERSION
+    # without reanalyze the Praat features of the existing CSVs are reused
+    versions = [version] if praat or reanalyze else [version, PRAAT_VERSION]
+    if cache:
+        cached = store.get_first([u for _, u in jobs], versions)
+        if len(cached):
+            known = set(cached["key"])
+            titles = {u: t for t, u in jobs}
+            cached["title"] = cached["key"].map(titles)
+            cached["url"] = cached.pop("key")
+            cached.to_csv("../data/csv/analysis_cached.csv", index=False)
+            merged.append(cached)
+            print(f"{len(cached)} vids found in the feature store, skipping them")
+            jobs = [job for job in jobs if job[1] not in known]
+
+    deduplicator = Deduplicator(version) if dedup else None
+    results = []
+    urls = []
+    start = 0
+    done = 0
+    download = s.decode_audio if pcm else s.download_audio
+    for (_, vid_url), record in stream(
+        jobs,
+        download,
+        analyze_fn,
+        c,
+        initializer=warm_up,
+        initargs=(praat,),
+        split=None if praat else split_audio,
+        dedup=(lambda job, audio: deduplicator.skip(job[1], audio)) if dedup else None,
+    ):
+        done += 1
+        if record is not None:
+            results.append(record)
+            urls.append(vid_url)
+            store.put(vid_url, version, record)
+            if deduplicator:
+                deduplicator.indexed(vid_url)
+        elif deduplicator:
+            deduplicator.discard(vid_url)
+
+        # save a CSV every n_per_time analyzed audios
+        if done - start == n_per_time:
+            batch = save_results(results, urls, start, done - 1, len(jobs), version)
+            if batch is not None:
+                merged.append(batch)
+            results = []
+            urls = []
+            start = done
+
+    if done > start:
+        batch = save_results(results, urls, start, done - 1, len(jobs), version)
+        if batch is not None:
+            merged.append(batch)
+
+    if deduplicator:
+        deduplicator.close()
+    store.close()
+    s.clear_audios()
@@ -0,0 +1,552 @@
+import os
+import subprocess
+import wave
+import numpy as np
+
+# bump this whenever the output of extract_features changes
+EXTRACTOR_VERSION = "native-2"
+# the version of the features computed by myprosody's mysptotal
+PRAAT_VERSION = "myspsolution"
+
+# the same columns (and order) that mysptotal prints
+FEATURE_COLUMNS = [
+    "number_ of_syllables",
+    "number_of_pauses",
+    "rate_of_speech",
+    "articulation_rate",
+    "speaking_duration",
+    "original_duration",
+    "balance",
+    "f0_mean",
+    "f0_std",
+    "f0_median",
+    "f0_min",
+    "f0_max",
+    "f0_quantile25",
+    "f0_quan75",
+]
+
+# the columns extract_features adds after FEATURE_COLUMNS, see trim_non_speech
+TRIM_COLUMNS = ["trimmed_seconds", "trimmed_spans"]
+
+# recordings longer than this are analyzed in windows of this many seconds, with this much overlap
+CHUNK_SECONDS = 600
+CHUNK_OVERLAP = 10
+
+# the parameters myprosody passes to myspsolution.praat
+SILENCE_DB = -20
+MIN_DIP = 2
+MIN_PAUSE = 0.3
+MIN_SOUNDING = 0.1
+PITCH_FLOOR = 80
+PITCH_CEILING = 400
+PITCH_TIME_STEP = 0.01
+
+# audio is block-averaged down to roughly this rate before analysis, prosody doesn't need more
+ANALYSIS_RATE = 16000
+
+# sample rate of the in-memory mono int16 buffers decoded by decode_pcm
+PCM_RATE = 16000
+
+# how many analysis frames are materialized at once
+FRAME_CHUNK = 256
+
+# voice activity detection that trims intro music, applause and silent tails before the analysis
+# frames are VAD_FRAME seconds long, a frame is active when it's at most VAD_RANGE_DB below the loud
+# level of the recording and tonal when its spectral flatness is below VAD_FLATNESS
+VAD_FRAME = 0.03
+VAD_RANGE_DB = 35
+VAD_FLATNESS = 0.3
+# speech has tonal (voiced) frames in a VAD_CONTEXT seconds window but not only them, and a
+# fluctuating level from syllable to syllable, unlike applause (no tonal frames) or music (steady)
+VAD_CONTEXT = 1.0
+VAD_MIN_VOICED = 0.15
+VAD_MAX_VOICED = 0.9
+VAD_MIN_MODULATION_DB = 3
+# speech is padded by VAD_PAD seconds, non-speech is trimmed from the ends when it's longer than
+# VAD_MIN_EDGE seconds and from between speech when it's longer than VAD_MIN_GAP (shorter gaps are pauses)
+VAD_PAD = 0.5
+VAD_MIN_EDGE = 1.0
+VAD_MIN_GAP = 5.0
+
+
+# reads a pcm wav (or its first seconds) into a mono float array scaled to [-1, 1]
+def read_wav(path, seconds=None):
+    with wave.open(path, "rb") as w:
+        sr = w.getframerate()
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        n = w.getnframes()
+        raw = w.readframes(n if seconds is None else min(n, int(seconds * sr)))
+
+    if width == 1:
+        x = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        x = (
+            b[:, 0].astype(np.int32)
+            | (b[:, 1].astype(np.int32) << 8)
+            | (b[:, 2].astype(np.int8).astype(np.int32) << 16)
+        ).astype(np.float32) / 2**23
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[width]
+        x = np.frombuffer(raw, dtype=dtype).astype(np.float32) / 2 ** (8 * width - 1)
+
+    if channels > 1:
+        x = x.reshape(-1, channels).mean(axis=1)
+    return x, sr
+
+
+# decodes any audio ffmpeg can read to a mono PCM_RATE int16 buffer without writing a wav
+def decode_pcm(path):
+    return subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(PCM_RATE),
+            "-f",
+            "s16le",
+            "-acodec",
+            "pcm_s16le",
+            "-",
+        ],
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+# turns a decode_pcm buffer (or its first seconds) into a float array scaled to [-1, 1]
+def read_pcm(pcm, seconds=None):
+    if seconds is not None:
+        pcm = pcm[: 2 * int(seconds * PCM_RATE)]
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 2**15
+
+
+# decimates by an integer factor with a boxcar average, good enough below 500 Hz
+def downsample(x, sr):
+    factor = sr // ANALYSIS_RATE
+    if factor <= 1:
+        return x, sr
+    n = len(x) // factor * factor
+    return x[:n].reshape(-1, factor).mean(axis=1), sr / factor
+
+
+# frame start indices and centre times, frames are centred in the signal like praat does
+def frame_positions(n_samples, sr, win, step):
+    duration = n_samples / sr
+    n_frames = int((duration - win / sr) / step) + 1
+    if n_frames < 1:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    t1 = (duration - (n_frames - 1) * step) / 2
+    times = t1 + np.arange(n_frames) * step
+    starts = np.clip(
+        np.round(times * sr - win / 2).astype(np.int64), 0, n_samples - win
+    )
+    return starts, times
+
+
+# yields (slice, frames) with frames as a chunk_size x win matrix
+def iter_frames(x, starts, win):
+    view = np.lib.stride_tricks.sliding_window_view(x, win)
+    for i in range(0, len(starts), FRAME_CHUNK):
+        yield slice(i, i + FRAME_CHUNK), view[starts[i : i + FRAME_CHUNK]]
+
+
+# intensity contour in dB, like praat's "To Intensity... min_pitch 0 yes"
+def intensity(x, sr, min_pitch=50):
+    win = int(round(6.4 / min_pitch * sr))
+    step = 0.8 / min_pitch
+    starts, times = frame_positions(len(x), sr, win, step)
+    w = np.kaiser(win, 20).astype(np.float32)
+    w /= w.sum()
+
+    db = np.empty(len(starts))
+    for sl, frames in iter_frames(x, starts, win):
+        mean = frames.mean(axis=1)
+        power = (frames * frames) @ w - 2 * mean * (frames @ w) + mean * mean
+        db[sl] = 10 * np.log10(np.maximum(power, 1e-30) / 4e-10)
+    return db, times
+
+
+# autocorrelation pitch, a vectorized per-frame version of praat's "To Pitch (ac)" without the path finder
+# global_peak is the peak of the whole recording when x is a window of it
+def pitch(
+    x,
+    sr,
+    time_step,
+    floor,
+    ceiling,
+    voicing_threshold=0.45,
+    silence_threshold=0.03,
+    global_peak=None,
+):
+    win = int(round(3 / floor * sr))
+    starts, times = frame_positions(len(x), sr, win, time_step)
+    nfft = 1 << int(np.ceil(np.log2(2 * win)))
+    w = np.hanning(win).astype(np.float32)
+    r_w = np.fft.irfft(np.abs(np.fft.rfft(w, nfft)) ** 2, nfft)
+    r_w /= r_w[0]
+
+    min_lag = max(int(np.floor(sr / ceiling)), 2)
+    max_lag = min(int(np.ceil(sr / floor)), win // 2)
+    lags = np.arange(min_lag - 1, max_lag + 2)
+    octave_bonus = 0.01 * np.log2(sr / lags[1:-1] / floor)
+    if global_peak is None:
+        global_peak = np.abs(x).max() if len(x) else 0
+
+    f0 = np.full(len(starts), np.nan)
+    for sl, frames in iter_frames(x, starts, win):
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        local_peak = np.abs(frames).max(axis=1)
+        spec = np.fft.rfft(frames * w, nfft, axis=1)
+        r = np.fft.irfft(spec.real**2 + spec.imag**2, nfft, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = r[:, lags] / r_w[lags] / r[:, :1]
+
+        centre = r[:, 1:-1]
+        is_peak = (centre >= r[:, :-2]) & (centre >= r[:, 2:])
+        score = np.where(is_peak, centre + octave_bonus, -np.inf)
+        best = np.argmax(score, axis=1)
+        rows = np.arange(len(best))
+
+        # parabolic interpolation of the best lag
+        a, b, c = r[rows, best], r[rows, best + 1], r[rows, best + 2]
+        denom = a - 2 * b + c
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shift = np.where(denom < 0, 0.5 * (a - c) / denom, 0)
+        strength = b - 0.25 * (a - c) * shift
+        lag = lags[best + 1] + shift
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unvoiced = voicing_threshold + np.maximum(
+                0,
+                2
+                - (local_peak / global_peak)
+                / (silence_threshold / (1 + voicing_threshold)),
+            )
+        voiced = np.isfinite(score[rows, best]) & (strength > unvoiced)
+        f0[sl] = np.where(voiced, sr / lag, np.nan)
+    return f0, times
+
+
+# boolean run boundaries of a mask as (starts, ends) index arrays, ends exclusive
+def runs(mask):
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+# praat's "To TextGrid (silences)", returns a per-frame sounding mask of the frames above threshold dB
+def sounding_mask(db, step, threshold):
+    mask = db >= threshold
+
+    # fill silences that are too short, then drop sounding bits that are too short
+    s, e = runs(~mask)
+    for a, b in zip(s, e):
+        if (b - a) * step < MIN_PAUSE and a > 0 and b < len(mask):
+            mask[a:b] = True
+    s, e = runs(mask)
+    for a, b in zip(s, e):
+        if (b - a) * step < MIN_SOUNDING:
+            mask[a:b] = False
+    return mask
+
+
+# interval boundaries in seconds for the runs of a frame mask
+def interval_times(starts, ends, times, step, duration):
+    edges = np.concatenate(([0], times[:-1] + step / 2, [duration]))
+    return edges[starts], edges[ends]
+
+
+# moving average of a frame feature over k frames, centred
+def moving_mean(v, k):
+    c = np.concatenate(([0], np.cumsum(v, dtype=np.float64)))
+    half = k // 2
+    lo = np.clip(np.arange(len(v)) - half, 0, len(v))
+    hi = np.clip(np.arange(len(v)) + k - half, 0, len(v))
+    return (c[hi] - c[lo]) / np.maximum(hi - lo, 1)
+
+
+# per-frame speech mask of a downsampled signal from the frame energy, spectral flatness and
+# syllabic level fluctuation, returns the mask and the frame length in samples
+def speech_frames(x, sr):
+    frame = int(round(VAD_FRAME * sr))
+    n = len(x) // frame
+    if n < 1:
+        return np.zeros(0, dtype=bool), frame
+    frames = x[: n * frame].reshape(n, frame)
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    db = 10 * np.log10(np.maximum((frames * frames).mean(axis=1), 1e-12))
+    active = db > np.quantile(db, 0.99) - VAD_RANGE_DB
+
+    nfft = 1 << int(np.ceil(np.log2(frame)))
+    w = np.hanning(frame).astype(np.float32)
+    # 100 - 4000 Hz carries the harmonics of the voice
+    band = slice(int(100 * nfft / sr), int(4000 * nfft / sr) + 1)
+    flatness = np.ones(n)
+    for i in range(0, n, FRAME_CHUNK * 16):
+        chunk = frames[i : i + FRAME_CHUNK * 16]
+        spec = np.abs(np.fft.rfft(chunk * w, nfft, axis=1)[:, band]) ** 2 + 1e-12
+        flatness[i : i + len(chunk)] = np.exp(np.log(spec).mean(axis=1)) / spec.mean(
+            axis=1
+        )
+    voiced = active & (flatness < VAD_FLATNESS)
+
+    k = max(int(round(VAD_CONTEXT / VAD_FRAME)), 1)
+    voiced_ratio = moving_mean(voiced, k)
+    active_ratio = moving_mean(active, k)
+    mean_db = moving_mean(np.where(active, db, 0), k) / np.maximum(active_ratio, 1e-9)
+    mean_db2 = moving_mean(np.where(active, db * db, 0), k) / np.maximum(
+        active_ratio, 1e-9
+    )
+    modulation = np.sqrt(np.maximum(mean_db2 - mean_db * mean_db, 0))
+
+    speech = (
+        (voiced_ratio >= VAD_MIN_VOICED)
+        & (voiced_ratio <= VAD_MAX_VOICED)
+        & (modulation >= VAD_MIN_MODULATION_DB)
+    )
+    # the whole window around speech counts, then it's padded
+    speech = moving_mean(speech, k) > 0
+    pad = int(round(VAD_PAD / VAD_FRAME))
+    return moving_mean(speech, 2 * pad + 1) > 0, frame
+
+
+# trims the non-speech parts of a downsampled signal, returns the remaining signal and the trimmed
+# (start, end) spans in seconds of the original, a signal without any detected speech is kept whole
+def trim_non_speech(x, sr):
+    speech, frame = speech_frames(x, sr)
+    if not speech.any():
+        return x, []
+
+    keep = np.ones(len(x), dtype=bool)
+    spans = []
+    s, e = runs(~speech)
+    for a, b in zip(s, e):
+        edge = a == 0 or b == len(speech)
+        if b == len(speech):
+            # the samples after the last whole frame go with it
+            b_sample = len(x)
+        else:
+            b_sample = b * frame
+        if (b_sample - a * frame) / sr > (VAD_MIN_EDGE if edge else VAD_MIN_GAP):
+            keep[a * frame : b_sample] = False
+            spans.append(
+                (round(float(a * frame / sr), 2), round(float(b_sample / sr), 2))
+            )
+    if not spans:
+        return x, []
+    return x[keep], spans
+
+
+# the trimmed spans of trim_non_speech as the TRIM_COLUMNS, the spans as "start-end" seconds
+def trim_columns(spans):
+    return {
+        "trimmed_seconds": round(sum(end - start for start, end in spans), 2),
+        "trimmed_spans": ";".join(f"{start}-{end}" for start, end in spans),
+    }
+
+
+# downsamples a signal and, with vad, trims its non-speech parts, returns the signal, its rate and
+# the trimmed spans
+def speech_signal(x, sr, vad=True):
+    x, sr = downsample(np.asarray(x, dtype=np.float32), sr)
+    if not vad:
+        return x, sr, []
+    x, spans = trim_non_speech(x, sr)
+    return x, sr, spans
+
+
+# the loudness levels of a whole (downsampled) signal that the thresholds are relative to, windows of
+# a long recording use the levels of the whole recording so they are analyzed like one file
+def signal_levels(x, sr):
+    db, _ = intensity(x, sr)
+    if len(db) < 3:
+        return None
+    return {
+        "min_int": float(db.min()),
+        "max_int": float(db.max()),
+        "max99_int": float(np.quantile(db, 0.99)),
+        "peak": float(np.abs(x).max()),
+    }
+
+
+# the additive statistics of the part core = (start, end) seconds of a downsampled signal, with
+# context on both sides so that intervals and peaks at the edges of the core are detected like in
+# the whole recording, returns None if there is nothing usable in the signal
+def extract_stats(x, sr, levels=None, core=None):
+    duration = len(x) / sr
+    core_start, core_end = core if core else (0, duration)
+
+    db, times = intensity(x, sr)
+    if len(db) < 3:
+        return None
+    step = times[1] - times[0]
+    if levels is None:
+        levels = signal_levels(x, sr)
+
+    min_int = levels["min_int"]
+    max_int = levels["max_int"]
+    max99_int = levels["max99_int"]
+    threshold = max(max99_int + SILENCE_DB, min_int)
+    threshold3 = SILENCE_DB - (max_int - max99_int)
+
+    # pauses and speaking time
+    mask = sounding_mask(db, step, max_int + threshold3)
+    s, e = runs(mask)
+    n_intervals = len(s) + len(runs(~mask)[0])
+    if n_intervals < 2 or not len(s):
+        return None
+    begin, end = interval_times(s, e, times, step, duration)
+    speaking_total = float(
+        (
+            np.clip(end, core_start, core_end) - np.clip(begin, core_start, core_end)
+        ).sum()
+    )
+    # an interval belongs to the core its start is in
+    n_sounding = int(np.count_nonzero((begin >= core_start) & (begin < core_end)))
+
+    # intensity peaks above the threshold
+    peaks = np.flatnonzero((db[1:-1] > db[:-2]) & (db[1:-1] >= db[2:])) + 1
+    peaks = peaks[db[peaks] > threshold]
+    if len(peaks) < 2:
+        return None
+
+    # peaks need a dip of at least MIN_DIP dB before the following peak
+    dips = np.minimum.reduceat(db, peaks)[:-1]
+    valid = peaks[:-1][np.abs(db[peaks[:-1]] - dips) > MIN_DIP]
+    valid = valid[(times[valid] >= core_start) & (times[valid] < core_end)]
+
+    # only peaks that are voiced and inside a sounding interval are syllables
+    f0_syl, syl_times = pitch(
+        x, sr, 0.02, 30, 450, voicing_threshold=0.25, global_peak=levels["peak"]
+    )
+    if not len(syl_times):
+        return None
+    nearest = np.clip(
+        np.round((times[valid] - syl_times[0]) / 0.02).astype(np.int64),
+        0,
+        len(syl_times) - 1,
+    )
+    voiced_count = int(np.count_nonzero(~np.isnan(f0_syl[nearest]) & mask[valid]))
+
+    # voiced f0 values of the core
+    f0, f0_times = pitch(
+        x, sr, PITCH_TIME_STEP, PITCH_FLOOR, PITCH_CEILING, global_peak=levels["peak"]
+    )
+    f0 = f0[(f0_times >= core_start) & (f0_times < core_end)]
+    f0 = f0[~np.isnan(f0)]
+
+    return {
+        "syllables": voiced_count,
+        "sounding": n_sounding,
+        "speaking": speaking_total,
+        "f0": f0,
+    }
+
+
+# turns the stats of the windows of a recording into the mysptotal features, counts and speaking time
+# are summed and the f0 statistics are computed over the f0 values of all windows
+def combine_stats(stats, duration):
+    stats = [st for st in stats if st is not None]
+    voiced_count = sum(st["syllables"] for st in stats)
+    n_sounding = sum(st["sounding"] for st in stats)
+    speaking_total = sum(st["speaking"] for st in stats)
+    if not voiced_count or not n_sounding or not speaking_total:
+        return None
+
+    f0 = np.concatenate([st["f0"] for st in stats])
+    if len(f0) < 2:
+        return None
+    q25, median, q75 = np.quantile(f0, [0.25, 0.5, 0.75])
+
+    return {
+        "number_ of_syllables": voiced_count,
+        "number_of_pauses": n_sounding - 1,
+        "rate_of_speech": round(voiced_count / duration),
+        "articulation_rate": round(voiced_count / speaking_total),
+        "speaking_duration": round(speaking_total, 1),
+        "original_duration": round(duration, 1),
+        "balance": round(speaking_total / duration, 1),
+        "f0_mean": round(float(f0.mean()), 2),
+        "f0_std": round(float(f0.std(ddof=1)), 2),
+        "f0_median": round(float(median), 1),
+        "f0_min": round(float(f0.min())),
+        "f0_max": round(float(f0.max())),
+        "f0_quantile25": round(float(q25)),
+        "f0_quan75": round(float(q75)),
+    }
+
+
+# extracts the mysptotal features from a mono signal, returns a dict or None if the audio is unusable
+# non-speech is trimmed first unless vad is False, so the durations are those of the speech, and
+# recordings that are still longer than CHUNK_SECONDS are analyzed window by window
+def extract_features(x, sr, vad=True):
+    x, sr, spans = speech_signal(x, sr, vad)
+    return speech_features(x, sr, spans)
+
+
+# the features of a signal that speech_signal already downsampled and trimmed, spans are its
+# trimmed spans
+def speech_features(x, sr, spans):
+    duration = len(x) / sr
+    windows = split_signal(x, sr)
+    if windows is None:
+        features = combine_stats([extract_stats(x, sr)], duration)
+    else:
+        features = combine_stats([extract_stats(*w) for w in windows], duration)
+    if features is None:
+        return None
+    return {**features, **trim_columns(spans)}
+
+
+# splits a downsampled signal longer than CHUNK_SECONDS into extract_stats argument tuples of
+# CHUNK_SECONDS long cores with CHUNK_OVERLAP seconds of context on both sides, None for short signals
+def split_signal(x, sr):
+    duration = len(x) / sr
+    if duration <= CHUNK_SECONDS:
+        return None
+    levels = signal_levels(x, sr)
+    if levels is None:
+        return None
+
+    windows = []
+    for core_start in np.arange(0, duration, CHUNK_SECONDS):
+        core_end = min(core_start + CHUNK_SECONDS, duration)
+        start = max(0, int((core_start - CHUNK_OVERLAP) * sr))
+        end = min(len(x), int((core_end + CHUNK_OVERLAP) * sr))
+        offset = start / sr
+        windows.append(
+            (x[start:end], sr, levels, (core_start - offset, core_end - offset))
+        )
+    return windows
+
+
+# extracts the features of a wav file on disk
+def extract_file(path, vad=True):
+    x, sr = read_wav(path)
+    return extract_features(x, sr, vad)
+
+
+# the name the analyzers use as the slug/title of an audio file
+def audio_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# process pool initializer, runs the extractor once on a second of noise so that a worker has its
+# imports and FFT plans ready before the first real audio, with praat myprosody is loaded instead
+def warm_up(praat=False):
+    if praat:
+        import myprosody  # noqa: F401
+
+        return
+    rng = np.random.default_rng(0)
+    extract_features(
+        rng.standard_normal(ANALYSIS_RATE).astype(np.float32), ANALYSIS_RATE
+    )
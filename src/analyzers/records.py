@@ -0,0 +1,105 @@
+import math
+import numpy as np
+import pandas as pd
+from analyzers.prosody import FEATURE_COLUMNS, TRIM_COLUMNS
+
+# the dtypes of the analyzed datasets, used for the batches the analysis assembles, the feature
+# store's rows and the parquet files the models read, columns not in it keep the dtype pandas infers
+SCHEMA = {
+    **{c: "float32" for c in FEATURE_COLUMNS},
+    "trimmed_seconds": "float32",
+    "type_name": "category",
+    "language": "category",
+    "extractor": "category",
+}
+
+# the column with the key of the audio a skipped duplicate is a copy of, empty for analyzed audios
+DUPLICATE_COLUMN = "duplicate_of"
+
+# the column with the version of the extractor that made a row (EXTRACTOR_VERSION or PRAAT_VERSION),
+# the CSVs from before it were all made with mysptotal
+EXTRACTOR_COLUMN = "extractor"
+
+
+# casts the columns of df that are in SCHEMA to their dtype
+def typed(df):
+    return df.astype({c: t for c, t in SCHEMA.items() if c in df.columns})
+
+
+# the features of one analyzed audio as a worker returns it, the values are in the order of
+# FEATURE_COLUMNS (NaN for a feature that wasn't extracted) and the trims are None when the audio
+# wasn't trimmed (praat), a record pickles to a fraction of a one row DataFrame
+# duplicate_of is the key of the audio whose features a skipped copy got
+class FeatureRecord:
+    __slots__ = ("name", "values", "trimmed_seconds", "trimmed_spans", "duplicate_of")
+
+    def __init__(
+        self,
+        name,
+        values,
+        trimmed_seconds=None,
+        trimmed_spans=None,
+        duplicate_of=None,
+    ):
+        self.name = name
+        self.values = values
+        self.trimmed_seconds = trimmed_seconds
+        self.trimmed_spans = trimmed_spans
+        self.duplicate_of = duplicate_of
+
+    # a record of a features dict from extract_features or combine_stats, or a feature store row
+    @classmethod
+    def from_features(cls, name, features, duplicate_of=None):
+        trimmed_seconds = features.get("trimmed_seconds")
+        if trimmed_seconds is not None and math.isnan(trimmed_seconds):
+            trimmed_seconds = None
+        return cls(
+            name,
+            tuple(float(features.get(c, math.nan)) for c in FEATURE_COLUMNS),
+            trimmed_seconds,
+            features.get("trimmed_spans") if trimmed_seconds is not None else None,
+            duplicate_of,
+        )
+
+    @property
+    def trimmed(self):
+        return self.trimmed_seconds is not None
+
+    # the features as a dict of FEATURE_COLUMNS and, if the audio was trimmed, TRIM_COLUMNS
+    def to_dict(self):
+        features = dict(zip(FEATURE_COLUMNS, self.values))
+        if self.trimmed:
+            features["trimmed_seconds"] = self.trimmed_seconds
+            features["trimmed_spans"] = self.trimmed_spans
+        if self.duplicate_of is not None:
+            features[DUPLICATE_COLUMN] = self.duplicate_of
+        return features
+
+
+# assembles records into a typed DataFrame with the names in key_column, the features are written
+# into one preallocated float32 array instead of concatenating a frame per audio, the TRIM_COLUMNS
+# are there if any of the records was trimmed, DUPLICATE_COLUMN and EXTRACTOR_COLUMN always are
+# (like in FeatureStore.get)
+def records_frame(records, key_column, extractor):
+    n = len(records)
+    values = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float32)
+    names = np.empty(n, dtype=object)
+    trimmed_seconds = np.full(n, np.nan, dtype=np.float32)
+    trimmed_spans = np.full(n, None, dtype=object)
+    duplicate_of = np.full(n, None, dtype=object)
+    for i, record in enumerate(records):
+        values[i] = record.values
+        names[i] = record.name
+        if record.trimmed:
+            trimmed_seconds[i] = record.trimmed_seconds
+            trimmed_spans[i] = record.trimmed_spans
+        duplicate_of[i] = record.duplicate_of
+
+    df = pd.DataFrame(values, columns=FEATURE_COLUMNS)
+    if any(record.trimmed for record in records):
+        df[TRIM_COLUMNS[0]] = trimmed_seconds
+        df[TRIM_COLUMNS[1]] = trimmed_spans
+    df[DUPLICATE_COLUMN] = duplicate_of
+    df[EXTRACTOR_COLUMN] = extractor
+    df[key_column] = names
+    return df
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from tabulate import tabulate
+from analyzers.scheduler import scheduler
+
+# the stages of a scrape-and-analyze run in the order they happen
+STAGES = ["metadata", "download", "convert", "fingerprint", "extract", "merge"]
+
+
+# per item timings, transferred bytes and failure reasons of every stage of a run, shared by the
+# threads of the run, the process pool workers report their time back through pipeline.stream
+class RunReport:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.items = []
+            self.started = time.time()
+
+    def record(self, stage, key, seconds, nbytes=0, error=None):
+        with self.lock:
+            self.items.append(
+                {
+                    "stage": stage,
+                    "key": str(key),
+                    "seconds": round(seconds, 4),
+                    "bytes": int(nbytes),
+                    "error": str(error) if error else None,
+                }
+            )
+
+    # times the body of the with block as one item of the stage, the body can set item["bytes"] and
+    # item["error"], an exception is recorded as the failure reason and re-raised
+    @contextmanager
+    def stage(self, stage, key):
+        item = {"bytes": 0, "error": None}
+        start = time.perf_counter()
+        try:
+            yield item
+        except Exception as e:
+            item["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(
+                stage, key, time.perf_counter() - start, item["bytes"], item["error"]
+            )
+
+    # count, failures, total time, p50/p95 and megabytes per stage
+    def summary(self):
+        with self.lock:
+            items = list(self.items)
+        rows = []
+        stages = STAGES + sorted({i["stage"] for i in items} - set(STAGES))
+        for stage in stages:
+            stage_items = [i for i in items if i["stage"] == stage]
+            if not stage_items:
+                continue
+            seconds = np.array([i["seconds"] for i in stage_items])
+            rows.append(
+                {
+                    "stage": stage,
+                    "items": len(stage_items),
+                    "failed": sum(1 for i in stage_items if i["error"]),
+                    "total_s": round(float(seconds.sum()), 2),
+                    "p50_s": round(float(np.percentile(seconds, 50)), 3),
+                    "p95_s": round(float(np.percentile(seconds, 95)), 3),
+                    "MB": round(sum(i["bytes"] for i in stage_items) / 1e6, 2),
+                }
+            )
+        return rows
+
+    # writes the report to a JSON in out_dir and prints the summary table, returns the path
+    def write(self, name, out_dir="../data/reports"):
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started))
+        path = os.path.join(out_dir, f"run_{name}_{stamp}.json")
+        summary = self.summary()
+        with self.lock:
+            data = {
+                "name": name,
+                "started": self.started,
+                "wall_seconds": round(time.time() - self.started, 2),
+                "summary": summary,
+                "scheduler": scheduler.summary(),
+                "items": self.items,
+            }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=4)
+
+        print(tabulate(summary, headers="keys"))
+        print(f"Wall time {data['wall_seconds']} s, run report written to {path}")
+        return path
+
+
+# the report of the current run
+report = RunReport()
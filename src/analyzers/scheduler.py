@@ -0,0 +1,174 @@
+import math
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+# downloads wait on the network, conversions (ffmpeg) and extractions (the process pool) take a core each
+# an audio holds a place in "audio" from the start of its download until its analysis is done
+STAGES = ["download", "convert", "extract", "audio"]
+
+# weight of the newest item in the running average of a stage's time per item
+SMOOTHING = 0.2
+
+# share of the cores that conversions get before their time per item has been observed
+CONVERT_SHARE = 0.25
+
+# downloads are throttled to one at a time when the disk has less free space than this
+MIN_FREE_DISK = 2 * 1024**3
+
+# memory budgeted for an audio in flight, its decoded buffer and the worker's arrays while it's
+# analyzed (an hour of 16 kHz pcm is 115 MB)
+AUDIO_MEMORY = 512 * 1024**2
+
+
+# the cores this process may run on
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# the memory that is available to new processes, None where it can't be read
+def available_memory():
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+# sizes the stages of a run from the machine and the observed time per item of every stage
+class Scheduler:
+    def __init__(
+        self,
+        cpus=None,
+        disk_path="..",
+        min_free_disk=MIN_FREE_DISK,
+        audio_memory=AUDIO_MEMORY,
+    ):
+        self.cond = threading.Condition()
+        self.cpus = cpus or available_cpus()
+        self.disk_path = disk_path
+        self.min_free_disk = min_free_disk
+        self.audio_memory = audio_memory
+        self.in_flight = {stage: 0 for stage in STAGES}
+        self.seconds = {}
+        self.limits = {}
+        with self.cond:
+            self.rebalance()
+
+    # the size a thread or process pool of the stage needs so that it never limits the stage
+    def max_workers(self, stage):
+        if stage == "download":
+            return 4 * self.cpus
+        return self.cpus
+
+    # concurrency of the metadata requests, they only wait on the network
+    def network_workers(self):
+        return clamp(4 * self.cpus, 16, 64)
+
+    def free_disk(self):
+        try:
+            return shutil.disk_usage(self.disk_path).free
+        except OSError:
+            return None
+
+    # recomputes the limits of the stages, called with cond held
+    def rebalance(self):
+        convert_s = self.seconds.get("convert")
+        extract_s = self.seconds.get("extract")
+        # the cores are split between conversions and extractions by their time per audio
+        share = CONVERT_SHARE
+        if convert_s and extract_s:
+            share = convert_s / (convert_s + extract_s)
+        if self.cpus > 1:
+            convert = clamp(round(self.cpus * share), 1, self.cpus - 1)
+            extract = self.cpus - convert
+        else:
+            convert = extract = 1
+
+        # enough downloads to keep the extractions fed
+        download_s = self.seconds.get("download")
+        if download_s and extract_s:
+            download = math.ceil(extract * download_s / extract_s)
+        else:
+            download = extract
+        download = clamp(download, 1, self.max_workers("download"))
+        free = self.free_disk()
+        low_disk = free is not None and free < self.min_free_disk
+        if low_disk:
+            download = 1
+
+        # enough audios to keep every stage busy with one waiting per extraction, as far as the
+        # memory allows, the memory of the audios already in flight counts as available for them
+        audio = download + convert + 2 * extract
+        memory = available_memory()
+        if memory is not None:
+            held = self.in_flight["audio"] * self.audio_memory
+            audio = min(audio, (memory + held) // self.audio_memory)
+        if low_disk:
+            audio = min(audio, extract + 1)
+        audio = max(audio, 1)
+
+        self.limits = {
+            "download": download,
+            "convert": convert,
+            "extract": extract,
+            "audio": audio,
+        }
+
+    # takes a place in the stage if one is free, returns whether it did
+    def try_start(self, stage):
+        with self.cond:
+            if self.in_flight[stage] >= self.limits[stage]:
+                return False
+            self.in_flight[stage] += 1
+            return True
+
+    # waits for a free place in the stage and takes it
+    def start(self, stage):
+        with self.cond:
+            self.cond.wait_for(lambda: self.in_flight[stage] < self.limits[stage])
+            self.in_flight[stage] += 1
+
+    # frees the place of an item that took seconds, None if it failed before doing any work
+    def finish(self, stage, seconds=None):
+        with self.cond:
+            self.in_flight[stage] -= 1
+            if seconds:
+                previous = self.seconds.get(stage, seconds)
+                self.seconds[stage] = (1 - SMOOTHING) * previous + SMOOTHING * seconds
+            self.rebalance()
+            self.cond.notify_all()
+
+    # runs the body of the with block as an item of the stage
+    @contextmanager
+    def slot(self, stage):
+        self.start(stage)
+        start = time.perf_counter()
+        seconds = None
+        try:
+            yield
+            seconds = time.perf_counter() - start
+        finally:
+            self.finish(stage, seconds)
+
+    def summary(self):
+        with self.cond:
+            return {
+                stage: {
+                    "limit": self.limits[stage],
+                    "seconds": round(self.seconds.get(stage, 0), 2),
+                }
+                for stage in STAGES
+            }
+
+
+# the scheduler of the current process
+scheduler = Scheduler()
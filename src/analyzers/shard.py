@@ -0,0 +1,65 @@
+import hashlib
+import os
+import re
+
+
+# parses "i/N" of --shard, shards are numbered from 1 to N
+def parse_shard(text):
+    match = re.fullmatch(r"(\d+)/(\d+)", text)
+    if match is None:
+        raise ValueError(f"Invalid shard {text!r}, use i/N like 1/4")
+    i, n = int(match.group(1)), int(match.group(2))
+    if not 1 <= i <= n:
+        raise ValueError(f"Invalid shard {text!r}, i must be between 1 and N")
+    return i, n
+
+
+# the shard (1 to n) of a slug or video url, from a hash of it so that every machine assigns a key
+# to the same shard (python's hash() is randomized per process)
+def shard_of(key, n):
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n + 1
+
+
+# whether key belongs to shard, every key belongs to shard None
+def in_shard(key, shard):
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+# the output path of a shard of the CSV at path, analyzed_speeches_4000_popular_shard1of4.csv
+def shard_path(path, shard):
+    if shard is None:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_shard{shard[0]}of{shard[1]}{ext}"
+
+
+# the shard CSVs of the CSV at path in its directory, as {(i, N): path}
+def find_shards(path):
+    directory = os.path.dirname(path) or "."
+    stem, ext = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(rf"{re.escape(stem)}_shard(\d+)of(\d+){re.escape(ext)}")
+    shards = {}
+    for filename in sorted(os.listdir(directory)):
+        match = pattern.fullmatch(filename)
+        if match:
+            shards[(int(match.group(1)), int(match.group(2)))] = os.path.join(
+                directory, filename
+            )
+    return shards
+
+
+# takes --shard i/N (or --shard=i/N) out of the command line arguments of the scrape scripts,
+# returns the parsed shard (None without one) and the rest of the arguments
+def shard_arg(argv):
+    args = []
+    shard = None
+    rest = iter(argv)
+    for arg in rest:
+        if arg == "--shard":
+            shard = parse_shard(next(rest, ""))
+        elif arg.startswith("--shard="):
+            shard = parse_shard(arg.split("=", 1)[1])
+        else:
+            args.append(arg)
+    return shard, args
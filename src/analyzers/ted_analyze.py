@@ -3,11 +3,21 @@ import os
 import pandas as pd
 import io
 import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import json
+import time
+from analyzers.prosody import warm_up, EXTRACTOR_VERSION, PRAAT_VERSION
+from analyzers.feature_store import FeatureStore
+from analyzers.records import FeatureRecord, records_frame
+from analyzers.fingerprint import Deduplicator
+from analyzers.pipeline import stream, analyze_file, analyze_pcm, split_audio
+from analyzers.merge import MergedOutput, load_metadata
+from analyzers.shard import shard_path
+from analyzers.manifest import Manifest, FETCHED, DOWNLOADED, ANALYZED, FAILED
 from scrapers.ted_scraper import Scraper
 
 
-# parses the output string of mysptotal
+# parses the output string of mysptotal to a FeatureRecord, the printed values become floats
 def parse_mysptotal_output(output, wav):
     lines = [line for line in output.splitlines() if line.strip()]
     if len(lines) > 1:
@@ -17,14 +27,13 @@ def parse_mysptotal_output(output, wav):
             metric = " ".join(parts[:-1])
             value = parts[-1]
             rows.append((metric, value))
-        df = pd.DataFrame([dict(rows)])
-        df["slug"] = os.path.splitext(os.path.basename(wav))[0]
-        return df
+        name = os.path.splitext(os.path.basename(wav))[0]
+        return FeatureRecord.from_features(name, dict(rows))
     return None
 
 
-# analyzes a single file
-def analyze_file(wav, c):
+# analyzes a single file by running myspsolution.praat through mysptotal
+def analyze_file_praat(wav, c):
     p = os.path.splitext(wav)[0]
     try:
         print(f"\n>>> Analyzing: {wav}")
@@ -45,40 +54,166 @@ def analyze_file(wav, c):
     return None
 
 
-# analyzes audios
-def analyze(n=10, n_per_time=5, sorting="popular"):
+# saves the results of the audios start-end, a DataFrame from records_frame or the feature store,
+# to a CSV, returns the path of the CSV
+def save_results(results, start, end, total):
+    if len(results):
+        path = f"../data/csv/analysis_{start}_{end}.csv"
+        results.to_csv(path, index=False)
+        print(f"\nResults of range {start}-{end} put together to a CSV-file")
+        print(f"Progress {(end + 1) / total * 100}%")
+        return path
+    print("No results")
+    return None
+
+
+# the slugs of the talks that are already in the dataset, in an analyzed CSV or the feature store
+def known_slugs(store, csv_dir="../data/csv"):
+    known = store.keys()
+    for f in glob.glob(os.path.join(csv_dir, "analyzed_speeches_*.csv")):
+        df = pd.read_csv(f, usecols=lambda column: column == "slug")
+        if "slug" in df.columns:
+            known.update(df["slug"].dropna())
+    return known
+
+
+# analyzes audios, downloads overlap with the analysis and the scheduler decides how many audios are in
+# flight at once, a CSV is saved every n_per_time analyzed audios
+# with pcm the audios are decoded to 16 kHz buffers in memory and no wavs are written, praat needs the wavs
+# with cache the feature store is consulted first and only items that aren't in it are downloaded
+# with the current extractor's features or else the seeded Praat ones, only the former with reanalyze
+# the status of every slug is checkpointed to ../data/manifest.json, with resume an interrupted run
+# continues from it instead of starting from zero
+# the batches are merged with the speech data as they finish, merge_and_join only finalizes the CSV
+# with delta only the talks published after the newest talk already in the dataset are crawled
+# (n and sorting are ignored) and they go to analyzed_speeches_new_<time>.csv
+# with dedup talks whose audio is a copy of an analyzed talk (a dubbing variant under another slug)
+# get its features and its slug in duplicate_of instead of being analyzed, see Deduplicator
+# with shard (i, N) only the talks of the i:th of N disjoint shards are analyzed, to
+# analyzed_speeches_<n>_<sorting>_shard<i>of<N>.csv, see merge_shards
+# returns the name of the merged CSV, analyzed_speeches_<name>.csv, or None if there was nothing new
+def analyze(
+    n=10,
+    n_per_time=5,
+    sorting="popular",
+    praat=False,
+    pcm=True,
+    cache=True,
+    resume=False,
+    delta=False,
+    shard=None,
+    dedup=True,
+    reanalyze=False,
+):
+    if delta and shard is not None:
+        raise ValueError("A delta crawl can't be sharded")
     c = os.path.abspath("../myprosody")
-    # AudioFiles-folder
-    audio_dir = os.path.join(c, "dataset", "audioFiles")
-
-    workers = n_per_time if n_per_time <= 20 else 20  # limit workers to 20 for now
-
-    s = Scraper(n, sorting)
-
-    # analyze n_per_time audios per time (because of space constraints)
-    for start in range(0, n, n_per_time):
-        end = min(start + n_per_time - 1, n - 1)
-        s.get_audios(n_per_time)
-        wav_files = [f for f in os.listdir(audio_dir) if f.lower().endswith(".wav")]
-        results = []
-
-        # Process files in parallel
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            future_to_wav = {
-                executor.submit(analyze_file, wav, c): wav for wav in wav_files
-            }
-            for future in as_completed(future_to_wav):
-                df = future.result()
-                if df is not None:
-                    results.append(df)
-
-        # Save combined results to a CSV
-        if results:
-            final_df = pd.concat(results, ignore_index=True)
-            final_df.to_csv(f"../data/csv/analysis_{start}_{end}.csv", index=False)
-            print(f"\nResults of range {start}-{end} put together to a CSV-file")
-            print(f"Progress {end / n * 100}%")
+
+    pcm = pcm and not praat
+    if pcm:
+        analyze_fn = analyze_pcm
+    else:
+        analyze_fn = analyze_file_praat if praat else analyze_file
+
+    manifest = Manifest(resume=resume)
+    if manifest.fetched:
+        print(f"Resuming from {manifest.path}")
+
+    store = FeatureStore()
+    # the speech data is already in speeches.json when resuming
+    fetch = not (resume and manifest.fetched)
+    if not delta:
+        name = shard_path(f"{n}_{sorting}", shard)
+        s = Scraper(n, sorting, fetch=fetch, shard=shard)
+    elif fetch:
+        s = Scraper(fetch=False)
+        if not s.get_new_slugs(known_slugs(store)):
+            store.close()
+            return None
+        s.get_speech_data()
+        name = manifest.name = f"new_{time.strftime('%Y%m%d_%H%M%S')}"
+    else:
+        with open("../data/speeches.json", "r") as f:
+            s = Scraper(len(json.load(f)), fetch=False)
+        name = manifest.name
+    jobs = s.audio_jobs()
+    total = len(jobs)
+    for _, slug in jobs:
+        if manifest.status(slug) is None:
+            manifest.set(slug, FETCHED)
+    jobs = [job for job in jobs if manifest.status(job[1]) != ANALYZED]
+    manifest.save()
+
+    # every saved batch is also joined with the speech data and appended to the merged CSV
+    merged = MergedOutput(
+        f"../data/csv/analyzed_speeches_{name}.csv",
+        load_metadata("../data/speeches.json", "slug"),
+        "slug",
+        manifest.merged_size if resume else None,
+        manifest.merged_columns if resume else None,
+        on_widen=manifest.set_merged,
+    )
+
+    def flush(results, slugs, start, end):
+        path = save_results(results, start, end, total)
+        size = merged.append(results) if path else None
+        manifest.add_csv(path, slugs, end, size, merged.columns)
+
+    version = PRAAT_VERSION if praat else EXTRACTOR_VERSION
+    # without reanalyze the Praat features of the existing CSVs are reused
+    versions = [version] if praat or reanalyze else [version, PRAAT_VERSION]
+    if cache:
+        cached = store.get_first([slug for _, slug in jobs], versions)
+        if len(cached):
+            cached = cached.rename(columns={"key": "slug"})
+            print(f"{len(cached)} speeches found in the feature store, skipping them")
+            start = manifest.next_idx
+            end = start + len(cached) - 1
+            flush(cached, cached["slug"], start, end)
+            known = set(cached["slug"])
+            jobs = [job for job in jobs if job[1] not in known]
+
+    deduplicator = Deduplicator(version) if dedup else None
+    results = []
+    slugs = []
+    start = manifest.next_idx
+    done = start
+    download = s.decode_audio if pcm else s.download_audio
+    for (_, slug), record in stream(
+        jobs,
+        download,
+        analyze_fn,
+        c,
+        on_download=lambda job: manifest.set(job[1], DOWNLOADED),
+        initializer=warm_up,
+        initargs=(praat,),
+        split=None if praat else split_audio,
+        dedup=(lambda job, audio: deduplicator.skip(job[1], audio)) if dedup else None,
+    ):
+        done += 1
+        if record is None:
+            manifest.set(slug, FAILED)
+            if deduplicator:
+                deduplicator.discard(slug)
         else:
-            print("No results")
+            results.append(record)
+            slugs.append(slug)
+            store.put(slug, version, record)
+            if deduplicator:
+                deduplicator.indexed(slug)
+
+        # save a CSV every n_per_time analyzed audios
+        if done - start == n_per_time:
+            flush(records_frame(results, "slug", version), slugs, start, done - 1)
+            results = []
+            slugs = []
+            start = done
+
+    if done > start:
+        flush(records_frame(results, "slug", version), slugs, start, done - 1)
 
-        s.clear_audios()
+    if deduplicator:
+        deduplicator.close()
+    store.close()
+    s.clear_audios()
+    return name
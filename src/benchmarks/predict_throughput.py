@@ -0,0 +1,69 @@
+import sys
+import time
+from pathlib import Path
+import pandas as pd
+
+# makes models importable when this file is run directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models.logreg import LogReg  # noqa: E402
+from models.randomforest import RandomForest  # noqa: E402
+
+SIZES = [1, 1_000, 1_000_000]
+
+
+# rows drawn from the training data of the model, so the trees take realistic paths
+def sample_rows(model, n, seed=0):
+    x = pd.concat([model.x_playlists, model.x_teds], ignore_index=True)
+    return x.sample(n=n, replace=True, random_state=seed).reset_index(drop=True)
+
+
+# best of repeat runs of fn in seconds
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# prints the rows/sec of predict_proba for every model and size, as a DataFrame and as an array
+def run(sizes=SIZES, chunk_size=100_000):
+    rows = []
+    for model in (LogReg(), RandomForest()):
+        for n in sizes:
+            x = sample_rows(model, n)
+            repeat = 5 if n < 100_000 else 1
+            for kind, data in (
+                ("DataFrame", x),
+                ("array", x[model.features].to_numpy()),
+            ):
+                seconds = best_time(
+                    lambda: (
+                        model.predict_proba(data)
+                        if isinstance(model, LogReg)
+                        else model.predict_proba(data, chunk_size=chunk_size)
+                    ),
+                    repeat,
+                )
+                rows.append(
+                    {
+                        "model": model.__class__.__name__,
+                        "rows": n,
+                        "input": kind,
+                        "seconds": round(seconds, 4),
+                        "rows_per_sec": round(n / seconds),
+                    }
+                )
+                print(rows[-1])
+    df = pd.DataFrame(rows)
+    print(df.to_string(index=False))
+    return df
+
+
+# Usage: python benchmarks/predict_throughput.py [sizes: int,int,... (amounts of rows, default 1,1000,1000000)]
+if __name__ == "__main__":
+    sizes = SIZES
+    if len(sys.argv) > 1:
+        sizes = [int(n) for n in sys.argv[1].split(",")]
+    run(sizes)
@@ -0,0 +1,263 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+import numpy as np
+from joblib import Memory
+
+# makes analyzers, models and generate_plots_and_stats importable when this file is run directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import models.cv as cv  # noqa: E402
+import models.dataset as dataset  # noqa: E402
+import models.randomforest as randomforest  # noqa: E402
+from analyzers.pipeline import analyze_file  # noqa: E402
+from analyzers.ted_analyze import parse_mysptotal_output  # noqa: E402
+from analyzers.prosody import FEATURE_COLUMNS  # noqa: E402
+from models.logreg import LogReg  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# durations in seconds of the synthetic audios analyze_file is timed on
+DURATIONS = [30, 120, 600]
+
+# a result is a regression when it's this many times slower than its baseline, and slower by at
+# least MIN_SLOWDOWN seconds so that timer noise on very short results isn't flagged
+TOLERANCE = 1.5
+MIN_SLOWDOWN = 0.05
+
+RANDOM_STATE = 42
+
+
+# a 48 kHz 16-bit mono wav that looks like speech to the extractor: voiced syllables of about
+# 4 per second with a wandering f0 between 120 and 220 Hz, pauses between phrases and a noise floor
+def synthetic_speech(path, seconds, sr=48000, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    x = rng.standard_normal(n).astype(np.float32) * 0.002
+    t = 0.3
+    while t < seconds - 0.5:
+        # a phrase of 3 to 12 syllables followed by a pause
+        for _ in range(rng.integers(3, 13)):
+            length = rng.uniform(0.12, 0.22)
+            start, end = int(t * sr), int(min(t + length, seconds) * sr)
+            k = np.arange(end - start) / sr
+            f0 = rng.uniform(120, 220) * (1 + 0.08 * np.sin(2 * np.pi * 3 * k))
+            phase = 2 * np.pi * np.cumsum(f0) / sr
+            voiced = sum(np.sin(h * phase) / h for h in range(1, 6))
+            envelope = np.sin(np.pi * k / length) ** 2
+            x[start:end] += 0.3 * envelope * voiced
+            t += length + rng.uniform(0.03, 0.12)
+        t += rng.uniform(0.3, 1.2)
+
+    pcm = (np.clip(x, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+
+
+# a mysptotal output with a header line and a "metric value" line per feature
+def mysptotal_output():
+    lines = ["                                  0"]
+    lines += [f"{metric} {i * 1.25 + 0.5}" for i, metric in enumerate(FEATURE_COLUMNS)]
+    return "\n".join(lines) + "\n"
+
+
+# best of repeat runs of fn in seconds, the output fn prints is dropped
+def best_time(fn, repeat=1):
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# the cross-validation cache and the saved random forest params are pointed to tmp, so every
+# benchmark starts with an empty cache and the ones in data/ are never touched, the searched params
+# are shared by the benchmarks of a run
+@contextlib.contextmanager
+def isolated(tmp):
+    saved = cv.CACHE_DIR, randomforest.PARAMS_PATH
+    randomforest.PARAMS_PATH = os.path.join(tmp, "randomforest_params.json")
+    try:
+        yield
+    finally:
+        cv.CACHE_DIR, randomforest.PARAMS_PATH = saved
+
+
+def bench_analyze_file(c):
+    os.makedirs(os.path.join(c, "dataset", "audioFiles"))
+    results = {}
+    for seconds in DURATIONS:
+        wav = f"synthetic_{seconds}s.wav"
+        synthetic_speech(os.path.join(c, "dataset", "audioFiles", wav), seconds)
+        # the first run also pays for the imports and FFT plans, so the best of two is taken
+        results[f"analyze_file {seconds}s"] = best_time(
+            lambda: analyze_file(wav, c), repeat=2
+        )
+    return results
+
+
+def bench_parse_mysptotal_output(tmp, calls=1000):
+    output = mysptotal_output()
+    seconds = best_time(
+        lambda: [parse_mysptotal_output(output, "talk.wav") for _ in range(calls)],
+        repeat=3,
+    )
+    return {f"parse_mysptotal_output x{calls}": seconds}
+
+
+def bench_models(tmp):
+    def construct(model_class):
+        dataset._load.cache_clear()
+        model_class(random_state=RANDOM_STATE)
+
+    return {
+        "LogReg()": best_time(lambda: construct(LogReg), repeat=3),
+        # the first RandomForest runs the hyperparameter search, the second one loads its params
+        "RandomForest() search": best_time(
+            lambda: construct(randomforest.RandomForest)
+        ),
+        "RandomForest() saved params": best_time(
+            lambda: construct(randomforest.RandomForest), repeat=3
+        ),
+    }
+
+
+def bench_cross_validate(tmp):
+    logreg = LogReg(random_state=RANDOM_STATE)
+    rf = randomforest.RandomForest(random_state=RANDOM_STATE)
+
+    # cold fits every fold, warm loads them from the cache the cold run filled
+    return {
+        "LogReg.cross_validate cold": best_time(logreg.cross_validate),
+        "LogReg.cross_validate warm": best_time(logreg.cross_validate, repeat=3),
+        "RandomForest.cross_validate cold": best_time(rf.cross_validate),
+        "RandomForest.cross_validate warm": best_time(rf.cross_validate, repeat=3),
+    }
+
+
+# the plots are written to tmp and the results store is kept there, cold computes the results of
+# every model (with the random forest search done beforehand) and warm only renders the figures
+def bench_generate_plots_and_stats(tmp):
+    import generate_plots_and_stats as plots
+
+    best_time(lambda: randomforest.RandomForest(random_state=RANDOM_STATE))
+    saved = plots.results_memory
+    plots.results_memory = Memory(os.path.join(tmp, "plot_results"), verbose=0)
+    images_dir = os.path.join(tmp, "images")
+    try:
+        dataset._load.cache_clear()
+        cold = best_time(
+            lambda: plots.generate_plots_and_stats(RANDOM_STATE, images_dir)
+        )
+        warm = best_time(
+            lambda: plots.generate_plots_and_stats(RANDOM_STATE, images_dir), repeat=3
+        )
+    finally:
+        plots.results_memory = saved
+    return {
+        "generate_plots_and_stats cold": cold,
+        "generate_plots_and_stats warm": warm,
+    }
+
+
+BENCHMARKS = {
+    "analyze_file": bench_analyze_file,
+    "parse_mysptotal_output": bench_parse_mysptotal_output,
+    "models": bench_models,
+    "cross_validate": bench_cross_validate,
+    "generate_plots_and_stats": bench_generate_plots_and_stats,
+}
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)["results"]
+
+
+# compares every result with its baseline, returns the rows of the table and the names of the
+# regressed results
+def compare(results, baseline):
+    rows = []
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        row = {"benchmark": name, "seconds": round(seconds, 4), "baseline": base}
+        if base:
+            row["ratio"] = round(seconds / base, 2)
+            if seconds > base * TOLERANCE and seconds - base > MIN_SLOWDOWN:
+                row["status"] = "REGRESSION"
+                regressions.append(name)
+            else:
+                row["status"] = "ok"
+        else:
+            row["ratio"] = None
+            row["status"] = "new"
+        rows.append(row)
+    return rows, regressions
+
+
+# writes the results as the new baseline, results of benchmarks that weren't run are kept
+def save_baseline(results, path=BASELINE_PATH):
+    merged = load_baseline(path)
+    merged.update({name: round(seconds, 4) for name, seconds in results.items()})
+    data = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": merged,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+    return path
+
+
+# runs the benchmarks in names (all of them by default) and compares them with the baseline,
+# with save the results become the new baseline, returns the results and the regressed names
+def run(names=None, save=False):
+    from tabulate import tabulate
+
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(
+            f"Unknown benchmarks {unknown}, use some of {list(BENCHMARKS)}"
+        )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, isolated(tmp):
+        for name in names:
+            print(f">>> Benchmarking {name}")
+            os.makedirs(os.path.join(tmp, name))
+            cv.CACHE_DIR = os.path.join(tmp, name, "cv_cache")
+            results.update(BENCHMARKS[name](os.path.join(tmp, name)))
+
+    rows, regressions = compare(results, load_baseline())
+    print(tabulate(rows, headers="keys"))
+    if save:
+        print(f"Baseline written to {save_baseline(results)}")
+    elif regressions:
+        print(f"{len(regressions)} regressions against {BASELINE_PATH}: {regressions}")
+    return results, regressions
+
+
+# Usage: python benchmarks/run.py [benchmarks: str (any of analyze_file, parse_mysptotal_output, models, cross_validate, generate_plots_and_stats, default all)] [--save (record the results as the new baseline)]
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if arg != "--save"]
+    _, regressions = run(args, save="--save" in sys.argv[1:])
+    sys.exit(1 if regressions else 0)
@@ -4,16 +4,27 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
+import glob
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from joblib import Memory
+from models.dataset import base_dir
 from models.logreg import LogReg
 from models.randomforest import RandomForest
+from models.baselines import ESTIMATORS, cross_validate_baseline
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 
+# the models of the plots, the baselines are labeled in upper case in the comparison graph
+MODELS = ["logreg", "randomforest", "svm", "knn"]
+LABELS = {"svm": "SVM", "knn": "KNN"}
+
+# the cross-validation results of every model are stored here, see data_signature
+results_memory = Memory(os.path.join(base_dir, "plot_results"), verbose=0)
+
 
 # generates a coefficients with p-values graph and saves it, only works for logistic regression model
-def generate_coefficients_with_p_values_graph(model):
-    modelname = (model.__class__.__name__).lower()
-    results = model.cv_results
+def generate_coefficients_with_p_values_graph(modelname, results, images_dir):
 
     coef_mean = results["coef_mean"].drop("const", errors="ignore")
     coef_std = results["coef_std"].drop("const", errors="ignore")
@@ -42,29 +53,26 @@ def generate_coefficients_with_p_values_graph(model):
     plt.ylabel("Coefficient (mean ± SD)")
     plt.title("Mean and sd of coefficients across folds, blue if p ≤ 0.05 in all folds")
     plt.tight_layout()
-    plt.savefig(f"../docs/images/{modelname}_coef_pval_graph.png")
+    plt.savefig(f"{images_dir}/{modelname}_coef_pval_graph.png")
     plt.close()
 
 
-# generates a confusion matrix plot and saves it, works for both models
-def generate_confusion_matrix(model):
-    modelname = (model.__class__.__name__).lower()
-    y_true = model.cv_results["y_true_all"]
-    y_pred = model.cv_results["y_pred_all"]
+# generates a confusion matrix plot and saves it, works for every model
+def generate_confusion_matrix(modelname, results, images_dir):
+    y_true = results["y_true_all"]
+    y_pred = results["y_pred_all"]
 
     cm = confusion_matrix(y_true, y_pred, normalize="true")
     disp = ConfusionMatrixDisplay(cm)
     disp.plot(cmap="Blues", values_format=".2f")
     plt.title("Aggregated confusion matrix")
     plt.tight_layout()
-    plt.savefig(f"../docs/images/{modelname}_confusion_matrix.png")
+    plt.savefig(f"{images_dir}/{modelname}_confusion_matrix.png")
     plt.close()
 
 
-# generates a roc curve plot and saves it, works for both models
-def generate_roc_curve(model):
-    modelname = (model.__class__.__name__).lower()
-    results = model.cv_results
+# generates a roc curve plot and saves it, works for every model
+def generate_roc_curve(modelname, results, images_dir):
     mean_fpr = results["mean_fpr"]
     mean_tpr = results["mean_tpr"]
     std_tpr = results["std_tpr"]
@@ -87,46 +95,35 @@ def generate_roc_curve(model):
     plt.title("ROC curve")
     plt.legend()
     plt.tight_layout()
-    plt.savefig(f"../docs/images/{modelname}_roc_curve.png")
+    plt.savefig(f"{images_dir}/{modelname}_roc_curve.png")
     plt.close()
 
 
 # generates a feature importance plot and saves it, only works for random forest model
-def generate_feature_importance_graph(model):
-    modelname = (model.__class__.__name__).lower()
-    results = model.cv_results
-
+def generate_feature_importance_graph(modelname, results, images_dir):
     importances = results["imp_mean"]
     stds = results["imp_std"]
-    features = model.x_playlists.columns
+    features = results["features"]
 
     plt.figure(figsize=(10, 6))
     plt.bar(features, importances, yerr=stds, capsize=5, color="skyblue")
     plt.xlabel("Features")
     plt.ylabel("Feature importance")
     plt.title(f"Feature importances of {modelname}")
-    plt.savefig(f"../docs/images/{modelname}_feature_importance.png")
+    plt.savefig(f"{images_dir}/{modelname}_feature_importance.png")
     plt.close()
 
 
-# generates a model accuracy comparison graph and saves it
-def generate_model_accuracy_comparison_graph(**args):
+# generates a model accuracy comparison graph of the given {model name: results} and saves it
+def generate_model_accuracy_comparison_graph(all_results, images_dir):
     models = []
     accuracies = []
     std = []
 
-    for model in args.values():
-        modelname = (model.__class__.__name__).lower()
-        models.append(modelname)
-        accuracies.append(model.cv_results["accuracy_mean"] * 100)
-        std.append(model.cv_results["accuracy_std"] * 100)
-
-    models.append("SVM")
-    accuracies.append(70.98)
-    std.append(1.44)
-    models.append("KNN")
-    accuracies.append(66.70)
-    std.append(2.80)
+    for modelname, results in all_results.items():
+        models.append(LABELS.get(modelname, modelname))
+        accuracies.append(results["accuracy_mean"] * 100)
+        std.append(results["accuracy_std"] * 100)
 
     ci_lower = [acc - 1.96 * s for acc, s in zip(accuracies, std)]
     ci_upper = [acc + 1.96 * s for acc, s in zip(accuracies, std)]
@@ -180,41 +177,111 @@ def generate_model_accuracy_comparison_graph(**args):
     plt.xlabel("Accuracy (%)")
     plt.ylabel("Model")
 
-    plt.savefig("../docs/images/model_accuracy_comparison.png")
+    plt.savefig(f"{images_dir}/model_accuracy_comparison.png")
+    plt.close()
 
 
-# main function to generate all plots and stats
-def generate_plots_and_stats(random_state):
-    logreg = LogReg(random_state=random_state)
-    logreg.cross_validate()
-    generate_coefficients_with_p_values_graph(logreg)
-    generate_confusion_matrix(logreg)
-    generate_roc_curve(logreg)
-    print("Logistic regression results:")
-    acc = logreg.cv_results["accuracy_mean"]
-    acc_std = logreg.cv_results["accuracy_std"]
-    print(f"Accuracy: {acc:.4f} ± {acc_std:.4f}")
-    r2 = logreg.cv_results["r2_mean"]
-    r2_std = logreg.cv_results["r2_std"]
-    print(f"Pseudo R-squared: {r2:.4f} ± {r2_std:.4f}")
+# computes the cross-validation results of a model, "svm" and "knn" are the baselines of models/
+def compute_results(modelname, random_state):
+    if modelname in ESTIMATORS:
+        return cross_validate_baseline(modelname, random_state)
+    model = {"logreg": LogReg, "randomforest": RandomForest}[modelname](
+        random_state=random_state
+    )
+    results = model.cross_validate()
+    results["features"] = list(model.features)
+    return results
+
+
+# the results are stored by model, random state and the size and modification time of the data,
+# model files and the dtypes the data is read with (analyzers/records.py), so they are only
+# computed again when one of them changes
+def data_signature():
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    paths = glob.glob(os.path.join(base_dir, "csv", "*.csv"))
+    paths += glob.glob(os.path.join(src_dir, "models", "*.py"))
+    paths.append(os.path.join(src_dir, "analyzers", "records.py"))
+    return sorted(
+        (os.path.basename(p), os.path.getsize(p), os.path.getmtime(p)) for p in paths
+    )
+
+
+def stored_results(modelname, random_state, signature):
+    return compute_results(modelname, random_state)
 
-    print("----------------")
 
-    rf = RandomForest(random_state=random_state)
-    rf.cross_validate()
-    generate_confusion_matrix(rf)
-    generate_roc_curve(rf)
-    generate_feature_importance_graph(rf)
-    print("Random forest results:")
-    acc = rf.cv_results["accuracy_mean"]
-    acc_std = rf.cv_results["accuracy_std"]
+# the results of every model, the ones that aren't stored are computed one model at a time, the
+# folds of a model's cross-validation already run in parallel processes on every core
+def all_model_results(random_state):
+    signature = data_signature()
+    return {
+        modelname: results_memory.cache(stored_results)(
+            modelname, random_state, signature
+        )
+        for modelname in MODELS
+    }
+
+
+def render(plot_fn, *args):
+    plot_fn(*args)
+    return plot_fn.__name__
+
+
+# main function to generate all plots and stats, the figures are rendered in a process pool
+def generate_plots_and_stats(random_state, images_dir="../docs/images", workers=None):
+    all_results = all_model_results(random_state)
+    os.makedirs(images_dir, exist_ok=True)
+
+    plots = [
+        (generate_coefficients_with_p_values_graph, "logreg"),
+        (generate_confusion_matrix, "logreg"),
+        (generate_roc_curve, "logreg"),
+        (generate_confusion_matrix, "randomforest"),
+        (generate_roc_curve, "randomforest"),
+        (generate_feature_importance_graph, "randomforest"),
+    ]
+    tasks = [
+        (plot_fn, modelname, all_results[modelname], images_dir)
+        for plot_fn, modelname in plots
+    ]
+    tasks.append((generate_model_accuracy_comparison_graph, all_results, images_dir))
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers == 1:
+        # a pool of one only adds the startup of the worker
+        for task in tasks:
+            render(*task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(render, *task) for task in tasks]:
+                future.result()
+
+    print("Logistic regression results:")
+    acc = all_results["logreg"]["accuracy_mean"]
+    acc_std = all_results["logreg"]["accuracy_std"]
     print(f"Accuracy: {acc:.4f} ± {acc_std:.4f}")
+    r2 = all_results["logreg"]["r2_mean"]
+    r2_std = all_results["logreg"]["r2_std"]
+    print(f"Pseudo R-squared: {r2:.4f} ± {r2_std:.4f}")
 
-    generate_model_accuracy_comparison_graph(logreg=logreg, rf=rf)
+    for modelname, title in (
+        ("randomforest", "Random forest"),
+        ("svm", "SVM"),
+        ("knn", "KNN"),
+    ):
+        print("----------------")
+        print(f"{title} results:")
+        acc = all_results[modelname]["accuracy_mean"]
+        acc_std = all_results[modelname]["accuracy_std"]
+        print(f"Accuracy: {acc:.4f} ± {acc_std:.4f}")
 
 
+# Usage: python generate_plots_and_stats.py [random_state: int (default 42)] [images_dir: str (default ../docs/images)]
 if __name__ == "__main__":
     random_state = 42
+    images_dir = "../docs/images"
     if len(sys.argv) > 1:
         random_state = int(sys.argv[1])
-    generate_plots_and_stats(random_state=random_state)
+    if len(sys.argv) > 2:
+        images_dir = sys.argv[2]
+    generate_plots_and_stats(random_state=random_state, images_dir=images_dir)
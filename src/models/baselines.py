@@ -0,0 +1,105 @@
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+from sklearn.model_selection import train_test_split
+from models.dataset import load
+from models.cv import cross_validate_estimator
+
+# the SVM and KNN baselines are trained on the 4000 popular talks against these playlists, with the
+# duration columns used to drop rows that weren't fully analyzed
+COLUMNS = [
+    "rate_of_speech",
+    "articulation_rate",
+    "balance",
+    "original_duration",
+    "speaking_duration",
+    "f0_std",
+]
+FEATURES = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
+TED_FILES = ["analyzed_speeches_4000_popular.csv"]
+NON_TED_FILES = [
+    "analyzed_playlist_PL_4c34HZDoN6Ysc_Xw1V3V-M9KESB9bJ9.csv",
+    "analyzed_playlist_PLFf_-1kTMSNH8k_G-51W4w09bgl98AR1x.csv",
+    "analyzed_playlist_PLEL2J-7Brhes50MA_1VmohNe4v33UH6Df.csv",
+    "analyzed_playlist_PLgVhcWtOHMTq7_y2VAsfv3sJHDTb8XP9q.csv",
+    "analyzed_playlist_PL_K7XH1AIG8wZtQSM56Tyc-CR9ypvCbrF.csv",
+    "analyzed_playlist_PLnwMNodmyz8VCS4nXtd4qu7wP0U0b9y3I.csv",
+]
+
+
+def add_pause_columns(df):
+    df["Minutes"] = df["original_duration"] / 60
+    df["Pauses_duration"] = df["original_duration"] - df["speaking_duration"]
+    df["Pauses_per_minute"] = df["Pauses_duration"] / df["Minutes"]
+    return df
+
+
+# balanced, standardized train and test sets of the baselines
+# returns x_train, x_test (both scaled with the scaler fit on x_train), y_train and y_test
+def train_test_data(random_state=42):
+    ted_df = load("ted", COLUMNS + ["type_name"], files=TED_FILES)
+    ted_df = ted_df[
+        ~ted_df["type_name"].str.startswith(
+            ("TED-Ed", "Original", "Best of", "TED Salon", "TED Institute")
+        )
+    ]
+    ted_df = ted_df.reset_index(drop=True)
+    ted_df = ted_df.dropna(subset=COLUMNS)
+    ted_df["is_ted"] = 1
+    ted_df = add_pause_columns(ted_df)
+
+    non_ted_all = load("playlist", COLUMNS, files=NON_TED_FILES)
+    non_ted_all = non_ted_all.dropna(subset=COLUMNS)
+    non_ted_all["is_ted"] = 0
+    non_ted_all = add_pause_columns(non_ted_all)
+
+    ted_train, ted_test = train_test_split(
+        ted_df, test_size=0.3, random_state=random_state
+    )
+    non_ted_train, non_ted_test = train_test_split(
+        non_ted_all, test_size=0.3, random_state=random_state
+    )
+
+    min_train = min(len(ted_train), len(non_ted_train))
+    min_test = min(len(ted_test), len(non_ted_test))
+
+    ted_train = ted_train.sample(n=min_train, random_state=random_state)
+    non_ted_train = non_ted_train.sample(n=min_train, random_state=random_state)
+    ted_test = ted_test.sample(n=min_test, random_state=random_state)
+    non_ted_test = non_ted_test.sample(n=min_test, random_state=random_state)
+
+    train_df = pd.concat([ted_train, non_ted_train], ignore_index=True)
+    test_df = pd.concat([ted_test, non_ted_test], ignore_index=True)
+
+    scaler = StandardScaler()
+    x_train = scaler.fit_transform(train_df[FEATURES])
+    x_test = scaler.transform(test_df[FEATURES])
+    return x_train, x_test, train_df["is_ted"], test_df["is_ted"]
+
+
+def knn_estimator(random_state=42):
+    return KNeighborsClassifier(n_neighbors=5)
+
+
+def svm_estimator(random_state=42):
+    return SVC(
+        kernel="rbf",
+        C=1.0,
+        gamma="scale",
+        probability=True,
+        class_weight="balanced",
+        random_state=random_state,
+    )
+
+
+ESTIMATORS = {"knn": knn_estimator, "svm": svm_estimator}
+
+
+# 5-fold cross-validation of the "knn" or "svm" baseline on its training set
+def cross_validate_baseline(name, random_state=42):
+    x_train, _, y_train, _ = train_test_data(random_state)
+    cv_results, _ = cross_validate_estimator(
+        ESTIMATORS[name](random_state), x_train, y_train, k=5, random_state=random_state
+    )
+    return cv_results
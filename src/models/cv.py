@@ -0,0 +1,142 @@
+import functools
+import hashlib
+import inspect
+import os
+import numpy as np
+from joblib import Memory, Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score, roc_curve
+from sklearn.model_selection import StratifiedKFold
+from models.dataset import base_dir
+
+# fold indices and fitted fold models are cached here by a hash of the data, the fit function and
+# its params, so repeated runs only fit the folds that changed, None turns the cache off
+CACHE_DIR = os.path.join(base_dir, "cv_cache")
+
+# the cache is trimmed to this size after every cross-validation
+CACHE_LIMIT = "2G"
+
+
+def fold_indices(y, k, random_state):
+    skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=random_state)
+    return list(skf.split(np.zeros(len(y)), y))
+
+
+# a hash of the source of fit (of the function a partial wraps), joblib pickles functions by name so
+# without it the fold models of a fit function would still be loaded after its code changed, the
+# arguments of a partial (the hyperparameters) are hashed by joblib with the rest of the call
+def fit_version(fit):
+    func = fit.func if isinstance(fit, functools.partial) else fit
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = f"{func.__module__}.{func.__qualname__}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+# version is only part of the cache key, see fit_version
+def fit_fold(fit, version, x_train, y_train):
+    return fit(x_train, y_train)
+
+
+def take(x, idx):
+    return x.iloc[idx] if hasattr(x, "iloc") else x[idx]
+
+
+# fits (or loads) the model of one fold and predicts its test part
+def run_fold(
+    fit, version, predict_proba, predict, x, y, train_idx, test_idx, cache_dir
+):
+    memory = Memory(cache_dir, verbose=0)
+    model = memory.cache(fit_fold)(fit, version, take(x, train_idx), y[train_idx])
+    x_test = take(x, test_idx)
+    y_pred_prob = np.asarray(predict_proba(model, x_test))
+    if predict is None:
+        y_pred = (y_pred_prob >= 0.5).astype(int)
+    else:
+        y_pred = np.asarray(predict(model, x_test))
+    return model, y_pred_prob, y_pred
+
+
+# stratified k-fold cross-validation with the folds run in parallel processes
+# fit(x_train, y_train) returns a fitted model and predict_proba(model, x_test) the probabilities of
+# the positive class, predicted labels are the probabilities thresholded at 0.5 unless predict is given
+# returns the common part of the cv_results dict of the models and the fitted fold models
+def cross_validate(
+    x, y, fit, predict_proba, k=5, random_state=1, predict=None, n_jobs=-1
+):
+    y = np.asarray(y)
+    memory = Memory(CACHE_DIR, verbose=0)
+    folds = memory.cache(fold_indices)(y, k, random_state)
+    version = fit_version(fit)
+    outputs = Parallel(n_jobs=n_jobs)(
+        delayed(run_fold)(
+            fit, version, predict_proba, predict, x, y, train_idx, test_idx, CACHE_DIR
+        )
+        for train_idx, test_idx in folds
+    )
+    if CACHE_DIR:
+        memory.reduce_size(bytes_limit=CACHE_LIMIT)
+
+    accs = []
+    aucs = []
+
+    mean_fpr = np.linspace(0, 1, 100)
+    tprs = []
+
+    y_true_all = []
+    y_pred_all = []
+
+    for (_, test_idx), (_, y_pred_prob, y_pred) in zip(folds, outputs):
+        y_test = y[test_idx]
+
+        acc = np.mean(y_pred == y_test)
+        auc = roc_auc_score(y_test, y_pred_prob)
+        accs.append(acc)
+        aucs.append(auc)
+
+        fpr, tpr, _ = roc_curve(y_test, y_pred_prob)
+        tprs.append(np.interp(mean_fpr, fpr, tpr))
+
+        y_true_all.extend(y_test)
+        y_pred_all.extend(y_pred)
+
+    results = {
+        "accuracies": np.array(accs),
+        "accuracy_mean": np.mean(accs),
+        "accuracy_std": np.std(accs),
+        "auc_mean": np.mean(aucs),
+        "auc_std": np.std(aucs),
+        "mean_fpr": mean_fpr,
+        "mean_tpr": np.mean(tprs, axis=0),
+        "std_tpr": np.std(tprs, axis=0),
+        "y_true_all": np.array(y_true_all),
+        "y_pred_all": np.array(y_pred_all),
+    }
+    return results, [model for model, _, _ in outputs]
+
+
+def fit_estimator(estimator, x_train, y_train):
+    return clone(estimator).fit(x_train, y_train)
+
+
+def estimator_proba(model, x_test):
+    return model.predict_proba(x_test)[:, 1]
+
+
+def estimator_predict(model, x_test):
+    return model.predict(x_test)
+
+
+# cross_validate for an unfitted scikit-learn classifier, labels come from its own predict
+def cross_validate_estimator(estimator, x, y, k=5, random_state=1, n_jobs=-1):
+    return cross_validate(
+        x,
+        y,
+        functools.partial(fit_estimator, clone(estimator)),
+        estimator_proba,
+        k=k,
+        random_state=random_state,
+        predict=estimator_predict,
+        n_jobs=n_jobs,
+    )
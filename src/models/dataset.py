@@ -0,0 +1,119 @@
+import functools
+import glob
+import json
+import os
+import re
+import pandas as pd
+from analyzers.prosody import PRAAT_VERSION
+from analyzers.records import SCHEMA, EXTRACTOR_COLUMN, typed
+
+base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "data")
+csv_dir = os.path.join(base_dir, "csv")
+parquet_dir = os.path.join(base_dir, "parquet")
+
+# the CSV name prefixes of the two partitions
+SOURCES = {"ted": r"^analyzed_speeches", "playlist": r"^analyzed_playlist"}
+
+
+# returns the CSVs of a partition in glob order, the order the models were originally trained in:
+# drop_duplicates and sample keep rows by position, so a different order changes the results
+def csv_files(source):
+    files = glob.glob(os.path.join(csv_dir, "*.csv"))
+    return [f for f in files if re.match(SOURCES[source], os.path.basename(f))]
+
+
+# the parquet file of a partition, holding the rows of all of its CSVs in csv_files order with the
+# name of the CSV of each row in a "file" column
+def partition_path(source):
+    return os.path.join(parquet_dir, f"source={source}", "part.parquet")
+
+
+# the names and modification times of the CSVs a partition is built from, kept in the metadata of
+# its parquet file
+def csv_signature(paths):
+    return json.dumps([[os.path.basename(f), os.path.getmtime(f)] for f in paths])
+
+
+# whether the parquet file out was built from the current versions of the CSVs at paths (in that
+# order) with the current SCHEMA, files written before a column's dtype changed are built again
+def up_to_date(out, paths):
+    import pyarrow.parquet as pq
+
+    if not os.path.exists(out):
+        return False
+    schema = pq.read_schema(out)
+    if (schema.metadata or {}).get(b"csv_files") != csv_signature(paths).encode():
+        return False
+    return all(
+        str(schema.field(c).type) == "float"
+        for c, t in SCHEMA.items()
+        if t == "float32" and c in schema.names
+    )
+
+
+# consolidates the CSVs of a partition into one typed parquet file in
+# ../data/parquet/source=<source>, which is rebuilt when a CSV is added, removed or changed
+# returns False if pyarrow isn't installed, in which case the CSVs are read directly
+def build(source):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+
+    paths = csv_files(source)
+    out = partition_path(source)
+    if up_to_date(out, paths):
+        return True
+
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    dfs = [pd.read_csv(f).assign(file=os.path.basename(f)) for f in paths]
+    df = typed(pd.concat(dfs, ignore_index=True)) if dfs else pd.DataFrame()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b"csv_files": csv_signature(paths)}
+    pq.write_table(table.replace_schema_metadata(metadata), out)
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _load(source, columns, files, extractor):
+    paths = csv_files(source)
+    if files is not None:
+        paths = [os.path.join(csv_dir, f) for f in files]
+    read = columns if EXTRACTOR_COLUMN in columns else (*columns, EXTRACTOR_COLUMN)
+
+    dfs = []
+    if build(source):
+        import pyarrow.parquet as pq
+
+        out = partition_path(source)
+        names = pq.read_schema(out).names
+        df = pd.read_parquet(out, columns=[c for c in read if c in names] + ["file"])
+        if files is None:
+            dfs.append(df)
+        else:
+            dfs = [df[df["file"] == f] for f in files]
+        dfs = [df.drop(columns="file").reindex(columns=list(read)) for df in dfs]
+    else:
+        for f in paths:
+            df = pd.read_csv(f, usecols=lambda c: c in read)
+            dfs.append(typed(df.reindex(columns=list(read))))
+
+    if not dfs:
+        return pd.DataFrame(columns=list(columns))
+    df = pd.concat(dfs, ignore_index=True)
+    if extractor is not None:
+        # the rows of the CSVs from before EXTRACTOR_COLUMN were made with mysptotal
+        made_by = df[EXTRACTOR_COLUMN].astype(object).fillna(PRAAT_VERSION)
+        df = df[made_by == extractor].reset_index(drop=True)
+    return df[list(columns)]
+
+
+# loads the given columns of the "ted" or "playlist" partition, optionally only from the given CSV
+# names in that order, the result is memoized per process so only the first call reads from disk
+# columns a CSV doesn't have (duplicate_of in CSVs from before it) are NaN
+# only the rows made by the extractor version are loaded, the features of mysptotal and the native
+# extractor aren't comparable until their parity is measured, None loads the rows of both
+def load(source, columns, files=None, extractor=PRAAT_VERSION):
+    files = tuple(files) if files is not None else None
+    return _load(source, tuple(columns), files, extractor).copy()
@@ -0,0 +1,117 @@
+import os
+import time
+import warnings
+import joblib
+import numpy as np
+
+# only numpy and joblib are imported here so that scoring doesn't pay for pandas, statsmodels or the
+# training data, a random forest artifact still needs scikit-learn to be unpickled
+
+# bump this whenever the contents of an artifact change
+ARTIFACT_VERSION = 1
+
+MODELS_DIR = os.path.normpath(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "data", "models"
+    )
+)
+
+
+def artifact_path(kind):
+    return os.path.join(MODELS_DIR, f"{kind}.joblib")
+
+
+# writes a model artifact, model is a fitted estimator or None when params are all that is needed
+def write_artifact(
+    kind, features, params, data_hash, metrics, model=None, path=None, **extra
+):
+    path = path or artifact_path(kind)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    artifact = {
+        "version": ARTIFACT_VERSION,
+        "kind": kind,
+        "features": list(features),
+        "params": params,
+        "data_hash": data_hash,
+        "metrics": metrics,
+        "model": model,
+        "created": time.time(),
+        **extra,
+    }
+    joblib.dump(artifact, path)
+    return path
+
+
+# x is a DataFrame or a dict with the features as columns, or an array (or a DataFrame without the
+# feature names, like pd.DataFrame([[4, 5, 0.7, 30.4]])) with the columns in the order of features,
+# returns a float matrix
+def feature_matrix(x, features):
+    if isinstance(x, dict) or all(f in getattr(x, "columns", ()) for f in features):
+        return np.column_stack([np.asarray(x[f], dtype=float) for f in features])
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    if x.shape[1] != len(features):
+        raise ValueError(
+            f"Expected the {len(features)} columns {features}, got {x.shape[1]} columns"
+        )
+    return x
+
+
+# probabilities of a logistic regression for every row of x, with chunk_size rows at a time
+def logistic(x, intercept, coef, chunk_size=None):
+    chunk_size = chunk_size or len(x) or 1
+    out = np.empty(len(x))
+    for i in range(0, len(x), chunk_size):
+        out[i : i + chunk_size] = 1 / (
+            1 + np.exp(-(intercept + x[i : i + chunk_size] @ coef))
+        )
+    return out
+
+
+# positive class probabilities of a fitted forest for every row of x, with chunk_size the rows are
+# scored chunk by chunk so the per-tree buffers stay small for very large inputs
+def forest_proba(model, x, chunk_size=None):
+    chunk_size = chunk_size or len(x) or 1
+    out = np.empty(len(x))
+    # the forest was fit on a DataFrame, the plain array has the same columns in the same order
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        for i in range(0, len(x), chunk_size):
+            out[i : i + chunk_size] = model.predict_proba(x[i : i + chunk_size])[:, 1]
+    return out
+
+
+# a saved LogReg or RandomForest that can only predict
+class Predictor:
+    def __init__(self, artifact):
+        if artifact.get("version") != ARTIFACT_VERSION:
+            raise ValueError(
+                f"Artifact version {artifact.get('version')} isn't supported, save the model again"
+            )
+        self.kind = artifact["kind"]
+        self.features = artifact["features"]
+        self.params = artifact["params"]
+        self.data_hash = artifact["data_hash"]
+        self.metrics = artifact["metrics"]
+        self.model = artifact["model"]
+
+        if self.kind == "logreg":
+            self.intercept = self.params["const"]
+            self.coef = np.array([self.params[f] for f in self.features])
+
+    def predict_proba(self, x, chunk_size=None):
+        x = feature_matrix(x, self.features)
+        if self.kind == "logreg":
+            return logistic(x, self.intercept, self.coef, chunk_size)
+        return forest_proba(self.model, x, chunk_size)
+
+    def predict(self, x, chunk_size=None):
+        return (self.predict_proba(x, chunk_size) >= 0.5).astype(int)
+
+
+# loads the artifact saved by LogReg.save or RandomForest.save, kind is "logreg" or "randomforest"
+# or the path of an artifact
+def load(kind_or_path="logreg"):
+    path = kind_or_path
+    if not os.path.exists(path):
+        path = artifact_path(kind_or_path)
+    return Predictor(joblib.load(path))
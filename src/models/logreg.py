@@ -1,35 +1,30 @@
-import glob
 import pandas as pd
-import re
-import os
 import statsmodels.api as sm
 import numpy as np
+import joblib
+from models.dataset import load
+from models.inference import write_artifact, feature_matrix, logistic
+from models.cv import cross_validate
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, roc_auc_score, roc_curve
-from sklearn.model_selection import StratifiedKFold
+from sklearn.metrics import classification_report
 
 
 # logistic regression model class
 class LogReg:
     def __init__(self, random_state=1):
         self.random_state = random_state
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(base_dir, "..", "..", "data", "csv", "*.csv")
-        csv_files = glob.glob(csv_path)
-        playlists = pd.DataFrame()
-        teds = pd.DataFrame()
-
-        for file in csv_files:
-            if re.match(r"^analyzed_playlist", os.path.basename(file)):
-                playlists = pd.concat([playlists, pd.read_csv(file)], ignore_index=True)
-            elif re.match(r"^analyzed_speeches", os.path.basename(file)):
-                teds = pd.concat([teds, pd.read_csv(file)], ignore_index=True)
+        columns_to_use = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
+        self.features = columns_to_use
+        playlists = load("playlist", columns_to_use + ["url", "duplicate_of"])
+        teds = load("ted", columns_to_use + ["slug", "type_id", "duplicate_of"])
 
+        # a skipped copy has the features of its original, which would count twice
+        playlists = playlists[playlists["duplicate_of"].isna()]
+        teds = teds[teds["duplicate_of"].isna()]
         playlists = playlists.drop_duplicates(subset=["url"])
         teds = teds.drop_duplicates(subset=["slug"])
         teds = teds[teds["type_id"] == 1]
 
-        columns_to_use = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
         self.x_playlists = playlists[columns_to_use]
         self.x_teds = teds[columns_to_use]
 
@@ -49,6 +44,7 @@ class LogReg:
             x, y, test_size=0.2, random_state=self.random_state, stratify=y
         )
 
+        self.data_hash = joblib.hash((x_train, list(y_train)))
         x_train_const = sm.add_constant(x_train)
         x_test_const = sm.add_constant(x_test)
 
@@ -87,76 +83,69 @@ class LogReg:
     def get_metrics(self):
         return classification_report(self.y_test, self.y_pred, output_dict=True)
 
-    def predict(self, x):
-        proba = self.predict_proba(x)
+    # x is a DataFrame with the features as columns or an array with them in the order of features
+    def predict(self, x, chunk_size=None):
+        proba = self.predict_proba(x, chunk_size)
         return (proba >= 0.5).astype(int)
 
-    def predict_proba(self, x):
-        x_const = sm.add_constant(x, has_constant="add")
-        return self.model.predict(x_const)
+    # scores every row of x in one matrix product, or chunk_size rows at a time, returns a Series
+    # indexed like x
+    def predict_proba(self, x, chunk_size=None):
+        params = self.model.params
+        proba = logistic(
+            feature_matrix(x, self.features),
+            params["const"],
+            params[self.features].to_numpy(),
+            chunk_size,
+        )
+        return pd.Series(proba, index=getattr(x, "index", None))
+
+    # saves the coefficients, features, training data hash and metrics, load the artifact with
+    # models.inference.load("logreg") to predict without statsmodels or retraining
+    def save(self, path=None):
+        return write_artifact(
+            "logreg",
+            self.features,
+            {name: float(value) for name, value in self.model.params.items()},
+            self.data_hash,
+            self.get_metrics(),
+            path=path,
+            random_state=self.random_state,
+            pvalues={name: float(value) for name, value in self.model.pvalues.items()},
+            pseudo_r2=float(self.model.prsquared),
+        )
 
     # this function is for creating a dictionary of cross-validated results
     def cross_validate(self, k=5):
         x = pd.concat([self.x_playlists, self.x_teds], ignore_index=True)
         y = np.array([0] * len(self.x_playlists) + [1] * len(self.x_teds))
 
-        skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=self.random_state)
-
-        accs = []
-        aucs = []
-        coefs = []
-        pvals = []
-        r2s = []
-
-        mean_fpr = np.linspace(0, 1, 100)
-        tprs = []
-
-        y_true_all = []
-        y_pred_all = []
-
-        for train_idx, test_idx in skf.split(x, y):
-            x_train, x_test = x.iloc[train_idx], x.iloc[test_idx]
-            y_train, y_test = y[train_idx], y[test_idx]
-
-            x_train_const = sm.add_constant(x_train)
-            x_test_const = sm.add_constant(x_test)
-
-            model = sm.Logit(y_train, x_train_const).fit(disp=False)
-            y_pred_prob = model.predict(x_test_const)
-            y_pred = (y_pred_prob >= 0.5).astype(int)
-
-            acc = np.mean(y_pred == y_test)
-            auc = roc_auc_score(y_test, y_pred_prob)
-            accs.append(acc)
-            aucs.append(auc)
-            r2s.append(model.prsquared)
-
-            coefs.append(model.params)
-            pvals.append(model.pvalues)
-
-            fpr, tpr, _ = roc_curve(y_test, y_pred_prob)
-            tprs.append(np.interp(mean_fpr, fpr, tpr))
-
-            y_true_all.extend(y_test)
-            y_pred_all.extend(y_pred)
-
-        self.cv_results = {
-            "accuracy_mean": np.mean(accs),
-            "accuracy_std": np.std(accs),
-            "auc_mean": np.mean(aucs),
-            "auc_std": np.std(aucs),
-            "r2_mean": np.mean(r2s),
-            "r2_std": np.std(r2s),
-            "coef_mean": pd.DataFrame(coefs).mean(),
-            "coef_std": pd.DataFrame(coefs).std(),
-            "pval_mean": pd.DataFrame(pvals).mean(),
-            "pvals": pd.DataFrame(pvals),
-            "pval_std": pd.DataFrame(pvals).std(),
-            "mean_fpr": mean_fpr,
-            "mean_tpr": np.mean(tprs, axis=0),
-            "std_tpr": np.std(tprs, axis=0),
-            "y_true_all": np.array(y_true_all),
-            "y_pred_all": np.array(y_pred_all),
-        }
+        self.cv_results, models = cross_validate(
+            x, y, fit_logit, predict_logit, k=k, random_state=self.random_state
+        )
+
+        coefs = [model.params for model in models]
+        pvals = [model.pvalues for model in models]
+        r2s = [model.prsquared for model in models]
+        self.cv_results.update(
+            {
+                "r2_mean": np.mean(r2s),
+                "r2_std": np.std(r2s),
+                "coef_mean": pd.DataFrame(coefs).mean(),
+                "coef_std": pd.DataFrame(coefs).std(),
+                "pval_mean": pd.DataFrame(pvals).mean(),
+                "pvals": pd.DataFrame(pvals),
+                "pval_std": pd.DataFrame(pvals).std(),
+            }
+        )
 
         return self.cv_results
+
+
+# fits the logit model of a cross-validation fold
+def fit_logit(x_train, y_train):
+    return sm.Logit(y_train, sm.add_constant(x_train)).fit(disp=False)
+
+
+def predict_logit(model, x_test):
+    return model.predict(sm.add_constant(x_test))
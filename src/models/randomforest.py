@@ -1,34 +1,46 @@
-import glob
-import pandas as pd
-import re
+import functools
+import json
 import os
+import joblib
+import pandas as pd
 import numpy as np
+from models.dataset import load, base_dir
+from models.inference import write_artifact, feature_matrix, forest_proba
+from models.cv import cross_validate, estimator_proba
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV, StratifiedKFold
-from sklearn.metrics import classification_report, roc_auc_score, roc_curve
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV
+from sklearn.metrics import classification_report
+
+
+PARAM_GRID = {
+    "n_estimators": [100, 300, 500],
+    "max_depth": [None, 30, 50],
+}
+
+# tuned params by training data hash, random state and search
+PARAMS_PATH = os.path.join(base_dir, "models", "randomforest_params.json")
 
 
 # random forest model class
+# search is "grow" (the full grid, every forest grown with warm start), "halving" (successive halving
+# on the number of trees) or "grid" (GridSearchCV), the tuned params are saved to PARAMS_PATH and
+# later constructions with the same training data reuse them without searching
 class RandomForest:
-    def __init__(self, random_state=1):
+    def __init__(self, random_state=1, search="grow", n_jobs=-1):
         self.random_state = random_state
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        csv_path = os.path.join(base_dir, "..", "..", "data", "csv", "*.csv")
-        csv_files = glob.glob(csv_path)
-        playlists = pd.DataFrame()
-        teds = pd.DataFrame()
-
-        for file in csv_files:
-            if re.match(r"^analyzed_playlist", os.path.basename(file)):
-                playlists = pd.concat([playlists, pd.read_csv(file)], ignore_index=True)
-            elif re.match(r"^analyzed_speeches", os.path.basename(file)):
-                teds = pd.concat([teds, pd.read_csv(file)], ignore_index=True)
+        self.features = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
+        playlists = load("playlist", self.features + ["url", "duplicate_of"])
+        teds = load("ted", self.features + ["slug", "type_id", "duplicate_of"])
 
+        # a skipped copy has the features of its original, which would count twice
+        playlists = playlists[playlists["duplicate_of"].isna()]
+        teds = teds[teds["duplicate_of"].isna()]
         playlists = playlists.drop_duplicates(subset=["url"])
         teds = teds.drop_duplicates(subset=["slug"])
         teds = teds[teds["type_id"] == 1]
 
-        self.features = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
         self.x_playlists = playlists[self.features]
         self.x_teds = teds[self.features]
 
@@ -48,17 +60,13 @@ class RandomForest:
             x, y, test_size=0.2, random_state=self.random_state, stratify=y
         )
 
-        param_grid = {
-            "n_estimators": [100, 300, 500],
-            "max_depth": [None, 30, 50],
-        }
-
-        grid = GridSearchCV(
-            RandomForestClassifier(random_state=self.random_state), param_grid
+        self.data_hash = joblib.hash((x_train, list(y_train)))
+        self.best_params = tune(
+            x_train, y_train, self.random_state, search=search, n_jobs=n_jobs
         )
-        grid.fit(x_train, y_train)
-        self.model = grid.best_estimator_
-        self.best_params = grid.best_params_
+        self.model = RandomForestClassifier(
+            random_state=self.random_state, n_jobs=n_jobs, **self.best_params
+        ).fit(x_train, y_train)
         self.y_pred = self.model.predict(x_test)
         self.y_pred_prob = self.model.predict_proba(x_test)[:, 1]
 
@@ -68,66 +76,131 @@ class RandomForest:
     def get_metrics(self):
         return classification_report(self.y_test, self.y_pred, output_dict=True)
 
-    def predict_proba(self, x):
-        return pd.Series(self.model.predict_proba(x)[:, 1][0])
+    # scores every row of x, a DataFrame with the features as columns or an array with them in the
+    # order of features, with chunk_size rows at a time, returns a Series indexed like x
+    def predict_proba(self, x, chunk_size=None):
+        proba = forest_proba(self.model, feature_matrix(x, self.features), chunk_size)
+        return pd.Series(proba, index=getattr(x, "index", None))
 
-    def predict(self, x):
-        proba = self.predict_proba(x)
+    def predict(self, x, chunk_size=None):
+        proba = self.predict_proba(x, chunk_size)
         return (proba >= 0.5).astype(int)
 
+    # saves the fitted forest, its params, features, training data hash and metrics, load the artifact
+    # with models.inference.load("randomforest") to predict without the data or a search
+    def save(self, path=None):
+        return write_artifact(
+            "randomforest",
+            self.features,
+            self.best_params,
+            self.data_hash,
+            self.get_metrics(),
+            model=self.model,
+            path=path,
+            random_state=self.random_state,
+        )
+
     # this function is for creating a dictionary of cross-validated results
     def cross_validate(self, k=5):
         x = pd.concat([self.x_playlists, self.x_teds], ignore_index=True)
         y = np.array([0] * len(self.x_playlists) + [1] * len(self.x_teds))
 
-        skf = StratifiedKFold(n_splits=k, shuffle=True, random_state=self.random_state)
+        self.cv_results, models = cross_validate(
+            x,
+            y,
+            functools.partial(fit_forest, self.random_state, self.best_params),
+            estimator_proba,
+            k=k,
+            random_state=self.random_state,
+        )
+
+        importances = [model.feature_importances_ for model in models]
+        self.cv_results.update(
+            {
+                "imp_mean": np.mean(importances, axis=0),
+                "imp_std": np.std(importances, axis=0),
+            }
+        )
+
+        return self.cv_results
 
-        accs = []
-        aucs = []
-        importances = []
 
-        mean_fpr = np.linspace(0, 1, 100)
-        tprs = []
+# fits the forest of a cross-validation fold
+def fit_forest(random_state, params, x_train, y_train):
+    return RandomForestClassifier(random_state=random_state, **params).fit(
+        x_train, y_train
+    )
 
-        y_true_all = []
-        y_pred_all = []
 
-        for train_idx, test_idx in skf.split(x, y):
-            x_train, x_test = x.iloc[train_idx], x.iloc[test_idx]
-            y_train, y_test = y[train_idx], y[test_idx]
+# the grid search with every forest grown tree by tree: a forest of one max_depth is fit with the
+# fewest trees and then grown to the next size with warm start instead of being refit, warm start
+# keeps the trees identical to a fresh fit so the result is the same as GridSearchCV's
+def grow_search(x, y, random_state, cv=5, n_jobs=-1):
+    y = np.asarray(y)
+    sizes = sorted(PARAM_GRID["n_estimators"])
+    folds = list(StratifiedKFold(n_splits=cv).split(x, y))
 
+    scores = {}
+    for max_depth in PARAM_GRID["max_depth"]:
+        for train_idx, test_idx in folds:
             model = RandomForestClassifier(
-                random_state=self.random_state, **self.best_params
+                random_state=random_state,
+                max_depth=max_depth,
+                warm_start=True,
+                n_jobs=n_jobs,
             )
-            model.fit(x_train, y_train)
-            y_pred_prob = model.predict_proba(x_test)[:, 1]
-            y_pred = (y_pred_prob >= 0.5).astype(int)
-
-            acc = np.mean(y_pred == y_test)
-            auc = roc_auc_score(y_test, y_pred_prob)
-            accs.append(acc)
-            aucs.append(auc)
-
-            importances.append(model.feature_importances_)
-
-            fpr, tpr, _ = roc_curve(y_test, y_pred_prob)
-            tprs.append(np.interp(mean_fpr, fpr, tpr))
-
-            y_true_all.extend(y_test)
-            y_pred_all.extend(y_pred)
-
-        self.cv_results = {
-            "accuracy_mean": np.mean(accs),
-            "accuracy_std": np.std(accs),
-            "auc_mean": np.mean(aucs),
-            "auc_std": np.std(aucs),
-            "imp_mean": np.mean(importances, axis=0),
-            "imp_std": np.std(importances, axis=0),
-            "mean_fpr": mean_fpr,
-            "mean_tpr": np.mean(tprs, axis=0),
-            "std_tpr": np.std(tprs, axis=0),
-            "y_true_all": np.array(y_true_all),
-            "y_pred_all": np.array(y_pred_all),
-        }
-
-        return self.cv_results
+            for n_estimators in sizes:
+                model.set_params(n_estimators=n_estimators)
+                model.fit(x.iloc[train_idx], y[train_idx])
+                score = model.score(x.iloc[test_idx], y[test_idx])
+                scores.setdefault((max_depth, n_estimators), []).append(score)
+
+    # ties go to the first params in GridSearchCV's order
+    best = max(scores, key=lambda params: np.mean(scores[params]))
+    return {"max_depth": best[0], "n_estimators": best[1]}
+
+
+# successive halving with the number of trees as the resource, the max_depths that do best with
+# few trees get more of them
+def halving_search(x, y, random_state, n_jobs=-1):
+    search = HalvingGridSearchCV(
+        RandomForestClassifier(random_state=random_state),
+        {"max_depth": PARAM_GRID["max_depth"]},
+        resource="n_estimators",
+        min_resources=min(PARAM_GRID["n_estimators"]),
+        max_resources=max(PARAM_GRID["n_estimators"]),
+        random_state=random_state,
+        n_jobs=n_jobs,
+    )
+    search.fit(x, y)
+    return search.best_params_
+
+
+def grid_search(x, y, random_state, n_jobs=-1):
+    grid = GridSearchCV(
+        RandomForestClassifier(random_state=random_state), PARAM_GRID, n_jobs=n_jobs
+    )
+    grid.fit(x, y)
+    return grid.best_params_
+
+
+# returns the tuned params of the training data, searching only if they aren't saved yet
+def tune(x, y, random_state, search="grow", n_jobs=-1):
+    key = f"{joblib.hash((x, list(y), PARAM_GRID))}_{random_state}_{search}"
+    saved = {}
+    if os.path.exists(PARAMS_PATH):
+        with open(PARAMS_PATH, "r") as f:
+            saved = json.load(f)
+    if key in saved:
+        return saved[key]
+
+    searches = {"grow": grow_search, "halving": halving_search, "grid": grid_search}
+    if search not in searches:
+        raise ValueError(f"Unknown search {search}, use one of {list(searches)}")
+    params = searches[search](x, y, random_state, n_jobs=n_jobs)
+
+    saved[key] = params
+    os.makedirs(os.path.dirname(PARAMS_PATH), exist_ok=True)
+    with open(PARAMS_PATH, "w") as f:
+        json.dump(saved, f, indent=4)
+    return params
@@ -1,72 +1,18 @@
+import sys
 from pathlib import Path
-import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-from sklearn.model_selection import train_test_split, StratifiedKFold, cross_val_score
 from sklearn.inspection import permutation_importance
 
-base_path = Path(__file__).resolve().parent.parent.parent
-ted_df = pd.read_csv(base_path / "data/csv/analyzed_speeches_4000_popular.csv")
-ted_df = ted_df[~ted_df['type_name'].str.startswith(
-    ('TED-Ed', 'Original', 'Best of', 'TED Salon', 'TED Institute'))]
-ted_df = ted_df.reset_index(drop=True)
-ted_df = ted_df.dropna(subset=['rate_of_speech', 'articulation_rate', 'balance',
-                               'original_duration', 'speaking_duration', 'f0_std'])
-ted_df['is_ted'] = 1
-ted_df['Minutes'] = ted_df['original_duration'] / 60
-ted_df['Pauses_duration'] = ted_df['original_duration'] - ted_df['speaking_duration']
-ted_df['Pauses_per_minute'] = ted_df['Pauses_duration'] / ted_df['Minutes']
+# makes models.baselines importable when this file is run directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from models.baselines import FEATURES, train_test_data, svm_estimator  # noqa: E402
+from models.cv import cross_validate_estimator  # noqa: E402
 
-non_ted_files = [
-    "data/csv/analyzed_playlist_PL_4c34HZDoN6Ysc_Xw1V3V-M9KESB9bJ9.csv",
-    "data/csv/analyzed_playlist_PLFf_-1kTMSNH8k_G-51W4w09bgl98AR1x.csv",
-    "data/csv/analyzed_playlist_PLEL2J-7Brhes50MA_1VmohNe4v33UH6Df.csv",
-    "data/csv/analyzed_playlist_PLgVhcWtOHMTq7_y2VAsfv3sJHDTb8XP9q.csv",
-    "data/csv/analyzed_playlist_PL_K7XH1AIG8wZtQSM56Tyc-CR9ypvCbrF.csv",
-    "data/csv/analyzed_playlist_PLnwMNodmyz8VCS4nXtd4qu7wP0U0b9y3I.csv"
-]
+features = FEATURES
+X_train_scaled, X_test_scaled, y_train, y_test = train_test_data(random_state=42)
 
-non_ted_dfs = []
-for f in non_ted_files:
-    df = pd.read_csv(base_path / f)
-    df = df.dropna(subset=['rate_of_speech', 'articulation_rate', 'balance',
-                           'original_duration', 'speaking_duration', 'f0_std'])
-    df['is_ted'] = 0
-    df['Minutes'] = df['original_duration'] / 60
-    df['Pauses_duration'] = df['original_duration'] - df['speaking_duration']
-    df['Pauses_per_minute'] = df['Pauses_duration'] / df['Minutes']
-    non_ted_dfs.append(df)
-
-non_ted_all = pd.concat(non_ted_dfs, ignore_index=True)
-
-ted_train, ted_test = train_test_split(ted_df, test_size=0.3, random_state=42)
-non_ted_train, non_ted_test = train_test_split(non_ted_all, test_size=0.3, random_state=42)
-
-min_train = min(len(ted_train), len(non_ted_train))
-min_test = min(len(ted_test), len(non_ted_test))
-
-ted_train = ted_train.sample(n=min_train, random_state=42)
-non_ted_train = non_ted_train.sample(n=min_train, random_state=42)
-ted_test = ted_test.sample(n=min_test, random_state=42)
-non_ted_test = non_ted_test.sample(n=min_test, random_state=42)
-
-train_df = pd.concat([ted_train, non_ted_train], ignore_index=True)
-test_df = pd.concat([ted_test, non_ted_test], ignore_index=True)
-
-features = ['rate_of_speech', 'articulation_rate', 'balance', 'f0_std']
-X_train = train_df[features]
-y_train = train_df['is_ted']
-X_test = test_df[features]
-y_test = test_df['is_ted']
-
-scaler = StandardScaler()
-X_train_scaled = scaler.fit_transform(X_train)
-X_test_scaled = scaler.transform(X_test)
-
-svm_model = SVC(kernel='rbf', C=1.0, gamma='scale', probability=True,
-                class_weight='balanced', random_state=42)
+svm_model = svm_estimator(random_state=42)
 svm_model.fit(X_train_scaled, y_train)
 
 y_pred = svm_model.predict(X_test_scaled)
@@ -79,22 +25,25 @@ print("--- Confusion matrix ---")
 print(confusion_matrix(y_test, y_pred))
 
 print("\n--- Feature Importances ---")
-perm_importance = permutation_importance(svm_model, X_test_scaled, y_test,
-                                         n_repeats=10, random_state=42)
+perm_importance = permutation_importance(
+    svm_model, X_test_scaled, y_test, n_repeats=10, random_state=42
+)
 importances = perm_importance.importances_mean
 percent_importances = 100 * importances / importances.sum()
 
 for i, feat in enumerate(features):
     print(f"{feat}: {percent_importances[i]:.2f}%")
 
-cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-scores = cross_val_score(svm_model, X_train_scaled, y_train, cv=cv, scoring='accuracy')
+cv_results, _ = cross_validate_estimator(
+    svm_model, X_train_scaled, y_train, k=5, random_state=42
+)
+scores = cv_results["accuracies"]
 
 print("\n--- 5-Fold Cross Validation ---")
 for i, score in enumerate(scores, start=1):
-    print(f"Fold {i}: {score*100:.2f}%")
+    print(f"Fold {i}: {score * 100:.2f}%")
 
 mean_score = np.mean(scores) * 100
 std_score = np.std(scores) * 100
 print(f"\nMean accuracy: {mean_score:.2f}%")
-print(f"Standard deviation: {std_score:.2f}%")
\ No newline at end of file
+print(f"Standard deviation: {std_score:.2f}%")
@@ -2,58 +2,85 @@ import sys
 import glob
 import os
 import pandas as pd
-import json
-import re
 from analyzers.playlist_analyze import analyze
+from analyzers.merge import MergedOutput, load_metadata, finish_merged, merge_shards
+from analyzers.shard import shard_arg, shard_path
+from analyzers.run_report import report
 
 
-# merges the csv files created by the analyze function, and joins the playlist data collected into playlist_data.json, saves everything into analyzed_playlist.csv
-def merge_and_join(url):
+# finalizes analyzed_playlist_{id}.csv, which analyze fills batch by batch with the analysis results
+# joined with the playlist data in playlist_data.json, and removes the intermediate CSVs
+# if there is no merged CSV the analysis CSVs are joined one at a time
+# with shard the CSV is the shard's analyzed_playlist_{id}_shard{i}of{N}.csv
+def merge_and_join(url, shard=None):
     playlist_id = url.split("list=")[-1]
-    csv_files = glob.glob(os.path.join("../data/csv", "*.csv"))
-    if not csv_files:
-        print("No CSVs to merge")
-        return
+    merged_csv_path = shard_path(
+        os.path.join("../data/csv", f"analyzed_playlist_{playlist_id}.csv"), shard
+    )
+    csv_files = glob.glob(os.path.join("../data/csv", "analysis_*.csv"))
     try:
-        dfs = []
-        for f in csv_files:
-            if re.match(r"^analysis_", os.path.basename(f)):
+        if not finish_merged(merged_csv_path):
+            if not csv_files:
+                print("No CSVs to merge")
+                return
+            # older analysis CSVs have no url, then the title is the only key there is
+            key = "url"
+            if "url" not in pd.read_csv(csv_files[0], nrows=0).columns:
+                key = "title"
+            merged = MergedOutput(
+                merged_csv_path, load_metadata("../data/playlist_data.json", key), key
+            )
+            for f in csv_files:
                 df = pd.read_csv(f, index_col=False)
-                df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-                dfs.append(df)
-        merged_df = pd.concat(dfs, ignore_index=True)
-        with open("../data/playlist_data.json", "r", encoding="utf-8") as f:
-            json_data = json.load(f)
-        json_df = pd.DataFrame(json_data)
-        merged_df = pd.merge(merged_df, json_df, on="title", how="left")
-        merged_csv_path = os.path.join(
-            "../data/csv", f"analyzed_playlist_{playlist_id}.csv"
-        )
-        merged_df.to_csv(merged_csv_path, index=False)
-        print(
-            f"Merged CSVs and wrote to ../data/csv/analyzed_playlist_{playlist_id}.csv"
-        )
+                merged.append(df.loc[:, ~df.columns.str.contains("^Unnamed")])
+            merged.finish()
+
+        print(f"Merged CSVs and wrote to {merged_csv_path}")
         for f in csv_files:
-            filename = os.path.basename(f)
-            if not re.match(r"^analyzed_", filename):
-                os.remove(f)
+            os.remove(f)
     except Exception as e:
         print("Error merging:", e)
         return
 
 
-def main(url, n_per_time):
-    analyze(url, n_per_time)
-    merge_and_join(url)
+# the timings of every stage are written to ../data/reports/run_playlist_*.json and summarized at the end
+# with shard (i, N) only the i:th of N disjoint shards of the videos is analyzed, so N machines can
+# split a playlist, see merge_shards
+# with reanalyze the videos that only have the Praat features of the existing CSVs are analyzed again
+def main(url, n_per_time, shard=None, reanalyze=False):
+    report.clear()
+    analyze(url, n_per_time, shard=shard, reanalyze=reanalyze)
+    with report.stage("merge", url):
+        merge_and_join(url, shard)
+    report.write("playlist")
+
+
+# combines the shard CSVs of a playlist analyzed with --shard on N machines, copied to ../data/csv,
+# into analyzed_playlist_{id}.csv
+def merge_shard_csvs(url):
+    playlist_id = url.split("list=")[-1]
+    merge_shards(
+        os.path.join("../data/csv", f"analyzed_playlist_{playlist_id}.csv"), "url"
+    )
 
 
-# Usage: python playlist_scrape_and_analyze.py [url: str (playlist url to analyze)] [n_per_time: int (amount of vids to download and analyze at once)]
+# Usage: python playlist_scrape_and_analyze.py [url: str (playlist url to analyze)] [n_per_time: int (amount of analyzed vids per saved CSV)] [--shard i/N (only the i:th of N shards of the vids)] [--reanalyze (don't reuse the Praat features of the existing CSVs)]
+#        python playlist_scrape_and_analyze.py --merge-shards [url: str] (merge the shard CSVs of a sharded run)
 if __name__ == "__main__":
+    shard, sys.argv = shard_arg(sys.argv)
+    reanalyze = "--reanalyze" in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg != "--reanalyze"]
+    if "--merge-shards" in sys.argv:
+        sys.argv.remove("--merge-shards")
+        if len(sys.argv) < 2:
+            raise ValueError("Provide the URL of the playlist to merge!")
+        merge_shard_csvs(sys.argv[1])
+        sys.exit(0)
     n_per_time = 4
     if len(sys.argv) > 1:
         url = str(sys.argv[1])  # url of playlist
     if len(sys.argv) > 2:
-        n_per_time = int(sys.argv[2])  # how many vids are processed at once
+        n_per_time = int(sys.argv[2])  # how many analyzed vids go to one CSV
     else:
         raise ValueError("Provide the URL for the playlist to analyze!")
-    main(url, n_per_time)
+    main(url, n_per_time, shard, reanalyze)
@@ -0,0 +1,56 @@
+import sys
+import os
+import pandas as pd
+from analyzers.prosody import FEATURE_COLUMNS, extract_file, audio_name
+
+
+# compares the native extractor against the mysptotal values stored in an analyzed_*.csv
+def compare(csv_path, audio_dir):
+    expected = pd.read_csv(csv_path)
+    key = "slug" if "slug" in expected.columns else "title"
+    expected = expected.drop_duplicates(subset=[key]).set_index(key)
+
+    rows = []
+    for f in sorted(os.listdir(audio_dir)):
+        name = audio_name(f)
+        if not f.lower().endswith(".wav") or name not in expected.index:
+            continue
+        # mysptotal analyzed the whole recording, so nothing is trimmed here
+        features = extract_file(os.path.join(audio_dir, f), vad=False)
+        if features is None:
+            print(f"Native extractor failed on {f}")
+            continue
+        features[key] = name
+        rows.append(features)
+
+    if not rows:
+        print("No audio files matching the CSV found")
+        return None
+
+    native = pd.DataFrame(rows).set_index(key)
+    stored = expected.loc[native.index, FEATURE_COLUMNS].astype(float)
+    diff = (native[FEATURE_COLUMNS] - stored).abs()
+    rel = diff / stored.abs().where(stored != 0)
+
+    summary = pd.DataFrame(
+        {
+            "mean_abs_diff": diff.mean(),
+            "max_abs_diff": diff.max(),
+            "mean_rel_diff": rel.mean(),
+        }
+    )
+    print(f"Compared {len(native)} files against {csv_path}")
+    print(summary.to_string(float_format="{:.4f}".format))
+    return summary
+
+
+# Usage: python prosody_parity.py [csv: str (analyzed_*.csv to compare against)] [audio_dir: str (directory of wavs named by slug/title)]
+if __name__ == "__main__":
+    audio_dir = "../myprosody/dataset/audioFiles"
+    if len(sys.argv) > 1:
+        csv_path = sys.argv[1]
+    else:
+        raise ValueError("Provide the analyzed CSV to compare against!")
+    if len(sys.argv) > 2:
+        audio_dir = sys.argv[2]
+    compare(csv_path, audio_dir)
@@ -0,0 +1,168 @@
+import sys
+import os
+import csv
+import json
+import tempfile
+import yt_dlp
+from analyzers.pipeline import stream
+from analyzers.scheduler import scheduler
+from analyzers.records import FeatureRecord
+from analyzers.prosody import (
+    extract_file,
+    extract_features,
+    read_pcm,
+    decode_pcm,
+    warm_up,
+    FEATURE_COLUMNS,
+    TRIM_COLUMNS,
+    PCM_RATE,
+)
+from models.inference import load
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".mp4", ".m4a", ".webm", ".ogg", ".opus", ".flac")
+
+OUTPUT_COLUMNS = [
+    "name",
+    "source",
+    *FEATURE_COLUMNS,
+    *TRIM_COLUMNS,
+    "probability",
+    "prediction",
+    "error",
+]
+
+
+# turns the inputs (audio files, directories of them, URLs or text files with one URL per line)
+# into (source, name) jobs
+def collect_jobs(inputs):
+    jobs = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for f in sorted(files):
+                    if f.lower().endswith(AUDIO_EXTENSIONS):
+                        path = os.path.join(root, f)
+                        jobs.append((path, os.path.relpath(path, item)))
+        elif os.path.isfile(item) and item.lower().endswith(".txt"):
+            with open(item, "r") as f:
+                jobs.extend((line.strip(), line.strip()) for line in f if line.strip())
+        else:
+            jobs.append((item, item))
+    return jobs
+
+
+# local files are read by the analysis worker itself, URLs are downloaded with yt-dlp and decoded
+# to an in-memory pcm buffer
+def fetch(source, name):
+    if os.path.exists(source):
+        return name, source
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "audio")
+        yt_opts = {"format": "bestaudio", "outtmpl": out_path, "quiet": True}
+        with scheduler.slot("download"), yt_dlp.YoutubeDL(yt_opts) as ydl:
+            ydl.download([source])
+        with scheduler.slot("convert"):
+            return name, decode_pcm(out_path)
+
+
+# extracts the features of a pcm buffer or a local audio file to a FeatureRecord, runs in the
+# process pool
+def extract(name, audio):
+    if isinstance(audio, bytes):
+        features = extract_features(read_pcm(audio), PCM_RATE)
+    elif audio.lower().endswith(".wav"):
+        features = extract_file(audio)
+    else:
+        features = extract_features(read_pcm(decode_pcm(audio)), PCM_RATE)
+    return None if features is None else FeatureRecord.from_features(name, features)
+
+
+# appends rows to a CSV or, if the path ends with .jsonl, to a JSON lines file
+class ScoreWriter:
+    def __init__(self, path):
+        self.jsonl = path.endswith(".jsonl")
+        self.f = open(path, "w", newline="")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.f, fieldnames=OUTPUT_COLUMNS)
+            self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.f.write(json.dumps(row) + "\n")
+            else:
+                self.writer.writerow(row)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+# extracts the features of every input in a process pool and scores them with a saved model in
+# batches of batch_size, rows are written to out_path as soon as their batch is scored
+def score(
+    inputs, model="logreg", out_path="../data/scores.csv", batch_size=256, workers=None
+):
+    predictor = load(model)
+    jobs = collect_jobs(inputs)
+    workers = workers or scheduler.cpus
+    writer = ScoreWriter(out_path)
+
+    batch = []
+
+    def flush():
+        if batch:
+            scored = [row for row in batch if row["error"] is None]
+            if scored:
+                proba = predictor.predict_proba(
+                    {f: [row[f] for row in scored] for f in predictor.features}
+                )
+                for row, p in zip(scored, proba):
+                    row["probability"] = round(float(p), 4)
+                    row["prediction"] = int(p >= 0.5)
+            writer.write(batch)
+            batch.clear()
+
+    n_scored = 0
+    try:
+        for (source, name), record in stream(
+            jobs,
+            fetch,
+            extract,
+            None,
+            workers,
+            workers * 2,
+            initializer=warm_up,
+        ):
+            row = {"name": name, "source": source, "error": None}
+            if record is None:
+                row["error"] = "no features could be extracted"
+            else:
+                row.update(record.to_dict())
+                n_scored += 1
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        writer.close()
+
+    print(f"Scored {n_scored}/{len(jobs)} audios with {model}, results in {out_path}")
+    return out_path
+
+
+# Usage: python score.py [inputs: str (audio files, directories of audio files, URLs or .txt files of URLs)] [--model=logreg|randomforest|path (a model saved with save())] [--out=path (.csv or .jsonl)]
+if __name__ == "__main__":
+    model = "logreg"
+    out_path = "../data/scores.csv"
+    inputs = []
+    for arg in sys.argv[1:]:
+        if arg.startswith("--model="):
+            model = arg.split("=", 1)[1]
+        elif arg.startswith("--out="):
+            out_path = arg.split("=", 1)[1]
+        else:
+            inputs.append(arg)
+    if not inputs:
+        raise ValueError("Provide the audio files, directories or URLs to score!")
+    score(inputs, model, out_path)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# how long a cached response is used without asking the server, after that it's revalidated with
+# its ETag/Last-Modified so an unchanged response costs a 304 instead of the whole body
+TTL = 7 * 24 * 3600
+
+# the least recently used responses are evicted once the cache grows past this
+MAX_BYTES = 512 * 1024**2
+
+
+# a request's cache key, the url and the json payload of a POST
+def request_key(method, url, payload=None):
+    key = f"{method} {url}"
+    if payload is not None:
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        key += f" {digest}"
+    return key
+
+
+# sqlite cache of json responses with their validators, keyed by the request or by a key the
+# caller picks when the url isn't stable (e.g. TED's talk data urls contain the site's build id)
+class HttpCache:
+    def __init__(self, path="../data/http_cache.sqlite", ttl=TTL, max_bytes=MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT, body BLOB, size INTEGER, stored REAL, used REAL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_used ON responses (used)"
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    # the cached response of key as a dict, or None
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT url, etag, last_modified, body, stored FROM responses WHERE key = ?",
+            [key],
+        ).fetchone()
+        if row is None:
+            return None
+        url, etag, last_modified, body, stored = row
+        return {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+            "stored": stored,
+        }
+
+    # whether the response of key can be used without revalidating it, ttl overrides the default
+    def fresh(self, key, ttl=None):
+        entry = self.get(key)
+        return entry is not None and self.is_fresh(entry, ttl)
+
+    def is_fresh(self, entry, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() - entry["stored"] < ttl
+
+    # the validators to send with a request for the response of entry
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    # the decoded json of entry, marks it as used for the eviction
+    def use(self, key, entry):
+        self.conn.execute(
+            "UPDATE responses SET used = ? WHERE key = ?", [time.time(), key]
+        )
+        self.conn.commit()
+        return json.loads(entry["body"])
+
+    # the server answered 304, so the response of key starts a new ttl
+    def refresh(self, key):
+        now = time.time()
+        self.conn.execute(
+            "UPDATE responses SET stored = ?, used = ? WHERE key = ?", [now, now, key]
+        )
+        self.conn.commit()
+
+    def put(self, key, url, body, etag=None, last_modified=None):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [key, url, etag, last_modified, body, len(body), now, now],
+        )
+        self.conn.commit()
+        self.evict()
+
+    # deletes the least recently used responses until the cache fits in max_bytes
+    def evict(self):
+        total = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY used"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.conn.commit()
+
+    def summary(self):
+        return f"HTTP cache: {self.hits} fresh, {self.revalidated} revalidated, {self.misses} fetched"
+
+    def close(self):
+        self.conn.close()
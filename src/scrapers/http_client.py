@@ -0,0 +1,200 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from analyzers.run_report import report
+from scrapers.http_cache import request_key
+
+# responses that are worth retrying, 429 also lowers the concurrency
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    pass
+
+
+# limits the amount of requests in flight, grows the limit by one after every `limit` successful
+# requests and halves it when the server rate limits us (additive increase, multiplicative decrease)
+class AdaptiveLimiter:
+    def __init__(self, initial=16, minimum=1, maximum=64):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+
+# asyncio http client for the metadata requests, the blocking requests calls run in a thread pool
+# sized to the concurrency limit and share one session whose connection pool is capped per host
+# failed requests (connection errors, 429/5xx, invalid json) are retried with jittered exponential
+# backoff, Retry-After is respected when the server sends it
+# with an HttpCache, GET responses (and POSTs given a cache_key) are served from it while fresh and
+# revalidated with their ETag/Last-Modified once the ttl has passed
+class Fetcher:
+    def __init__(
+        self,
+        cache=None,
+        concurrency=16,
+        max_concurrency=64,
+        per_host=20,
+        retries=5,
+        backoff=0.5,
+        max_backoff=30,
+        timeout=30,
+    ):
+        self.cache = cache
+        self.limiter = AdaptiveLimiter(concurrency, maximum=max_concurrency)
+        self.per_host = per_host
+        self.host_slots = {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8, pool_maxsize=per_host, pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_slots:
+            self.host_slots[host] = asyncio.Semaphore(self.per_host)
+        return self.host_slots[host]
+
+    def delay(self, attempt, res=None):
+        if res is not None and res.headers.get("Retry-After", "").isdigit():
+            return min(int(res.headers["Retry-After"]), self.max_backoff)
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        return delay * random.uniform(0.5, 1.5)
+
+    # sends a request and returns the decoded json, raises FetchError once the retries run out
+    # the request and its retries are one item of the metadata stage of the run report
+    # cache_key replaces the request as the key of the response in the cache and ttl overrides the
+    # cache's default for it
+    async def json(self, method, url, cache_key=None, ttl=None, **kwargs):
+        with report.stage("metadata", url) as item:
+            key = None
+            entry = None
+            if self.cache is not None and (method == "GET" or cache_key):
+                key = cache_key or request_key(method, url, kwargs.get("json"))
+                entry = self.cache.get(key)
+            if entry is not None:
+                if self.cache.is_fresh(entry, ttl):
+                    self.cache.hits += 1
+                    return self.cache.use(key, entry)
+                kwargs["headers"] = {
+                    **kwargs.get("headers", {}),
+                    **self.cache.conditional_headers(entry),
+                }
+
+            loop = asyncio.get_running_loop()
+            kwargs.setdefault("timeout", self.timeout)
+            error = None
+            res = None
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self.delay(attempt - 1, res))
+                res = None
+                throttled = False
+                await self.limiter.acquire()
+                try:
+                    async with self.host_slot(url):
+                        res = await loop.run_in_executor(
+                            self.executor,
+                            lambda: self.session.request(method, url, **kwargs),
+                        )
+                    if res.status_code in RETRY_STATUSES:
+                        throttled = res.status_code == 429
+                        error = f"HTTP {res.status_code}"
+                        continue
+                    if res.status_code == 304 and entry is not None:
+                        self.cache.revalidated += 1
+                        self.cache.refresh(key)
+                        return self.cache.use(key, entry)
+                    res.raise_for_status()
+                    data = res.json()
+                    item["bytes"] = len(res.content)
+                    if key is not None:
+                        self.cache.misses += 1
+                        self.cache.put(
+                            key,
+                            url,
+                            res.content,
+                            res.headers.get("ETag"),
+                            res.headers.get("Last-Modified"),
+                        )
+                    return data
+                except requests.HTTPError as e:
+                    # other 4xx responses won't get better by retrying
+                    raise FetchError(f"{url}: {e}") from e
+                except (requests.RequestException, ValueError) as e:
+                    error = e
+                finally:
+                    await self.limiter.release(throttled)
+            raise FetchError(f"{url}: {error} after {self.retries + 1} attempts")
+
+    async def get_json(self, url, **kwargs):
+        return await self.json("GET", url, **kwargs)
+
+    async def post_json(self, url, **kwargs):
+        return await self.json("POST", url, **kwargs)
+
+
+# runs coro_fn(fetcher, item) for every item concurrently and returns the results in item order,
+# an item whose request failed or whose response coro_fn couldn't handle (unexpected json) gives
+# None instead of aborting the others
+def fetch_all(coro_fn, items, **fetcher_kwargs):
+    async def run():
+        async with Fetcher(**fetcher_kwargs) as fetcher:
+
+            async def one(item):
+                try:
+                    return await coro_fn(fetcher, item)
+                except FetchError as e:
+                    print(f"Skipping {item}: {e}")
+                    return None
+                except Exception as e:
+                    print(f"Skipping {item}: {type(e).__name__}: {e}")
+                    return None
+
+            results = await asyncio.gather(*(one(item) for item in items))
+            if fetcher.cache is not None:
+                print(fetcher.cache.summary())
+            return results
+
+    return asyncio.run(run())
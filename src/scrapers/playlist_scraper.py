@@ -6,21 +6,36 @@ import os
 import subprocess
 import re
 import glob
+from analyzers.prosody import decode_pcm
+from analyzers.run_report import report
+from analyzers.scheduler import scheduler
+from analyzers.shard import in_shard
 
 
 class PlaylistScraper:
-    def __init__(self, playlist_url):
+    # videos longer than max_duration seconds are skipped, myprosody freezes with long videos
+    # with shard (i, N) only the videos of the i:th of N disjoint shards are kept, see analyzers/shard.py
+    def __init__(self, playlist_url, max_duration=None, shard=None):
         opts = {"quiet": True, "force_generic_extractor": True, "extract_flat": True}
 
         data = []
-        with yt_dlp.YoutubeDL(opts) as ydl:
-            playlist_info = ydl.extract_info(playlist_url, download=False)
-            vids = playlist_info.get("entries", [])
+        with report.stage("metadata", playlist_url):
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                playlist_info = ydl.extract_info(playlist_url, download=False)
+                vids = playlist_info.get("entries") or []
 
         for video in vids:
-            if (
-                video.get("duration") < 3601
-            ):  # Ignore vids longer than 1 hour because myprosody freezes with long vids
+            # unavailable videos can come without a url, there is nothing to download or shard
+            if not video or not video.get("url"):
+                title = video.get("title") if video else None
+                print(f"Skipping {title}: no url")
+                continue
+            duration = video.get("duration")
+            if max_duration and duration and duration > max_duration:
+                print(f"Skipping {video.get('title')}: longer than {max_duration} s")
+            elif not in_shard(video.get("url"), shard):
+                continue
+            else:
                 title = video.get("title")
                 if title not in ("[Deleted video]", "[Private video]"):
                     data.append(
@@ -51,41 +66,90 @@ class PlaylistScraper:
         }
 
         try:
-            with yt_dlp.YoutubeDL(yt_opts) as ydl:
-                ydl.download([url])
+            with scheduler.slot("download"), report.stage("download", title) as item:
+                with yt_dlp.YoutubeDL(yt_opts) as ydl:
+                    ydl.download([url])
+                item["bytes"] = os.path.getsize(out_path)
         except Exception as e:
             print(f"Skipping {title}: {e}")
+            return None
 
         try:
-            subprocess.run(
-                [
-                    "ffmpeg",
-                    "-y",
-                    "-i",
-                    out_path,
-                    "-ar",
-                    "48000",
-                    "-acodec",
-                    "pcm_s32le",
-                    wav_path,
-                ],
-                check=True,
-            )
+            with scheduler.slot("convert"), report.stage("convert", title) as item:
+                subprocess.run(
+                    [
+                        "ffmpeg",
+                        "-y",
+                        "-i",
+                        out_path,
+                        "-ar",
+                        "48000",
+                        "-acodec",
+                        "pcm_s32le",
+                        wav_path,
+                    ],
+                    check=True,
+                )
+                item["bytes"] = os.path.getsize(wav_path)
         except Exception as e:
             print(f"Skipping {title}: ffmpeg conversion failed: {e}")
+            wav_path = None
 
         try:
             os.remove(out_path)
         except OSError:
             pass
 
+        return wav_path
+
+    # downloads a single video and decodes it to an in-memory pcm buffer, no wav is written
+    def decode_audio(self, title, url):
+        out_path = os.path.join("../myprosody", "dataset", "audioFiles", title + ".mp4")
+
+        yt_opts = {
+            "format": "bestaudio",
+            "outtmpl": out_path,
+            "overwrites": True,
+            "nopart": True,
+        }
+
+        try:
+            with scheduler.slot("download"), report.stage("download", title) as item:
+                with yt_dlp.YoutubeDL(yt_opts) as ydl:
+                    ydl.download([url])
+                item["bytes"] = os.path.getsize(out_path)
+        except Exception as e:
+            print(f"Skipping {title}: {e}")
+            return None
+
+        try:
+            with scheduler.slot("convert"), report.stage("convert", title) as item:
+                pcm = decode_pcm(out_path)
+                item["bytes"] = len(pcm)
+        except Exception as e:
+            print(f"Skipping {title}: ffmpeg decoding failed: {e}")
+            pcm = None
+
+        try:
+            os.remove(out_path)
+        except OSError:
+            pass
+
+        return (title, pcm) if pcm else None
+
+    # returns the (title, url) pairs of the videos in the playlist
+    def audio_jobs(self):
+        return list(zip(self.df["title"], self.df["url"])) if len(self.df) else []
+
     def get_audios(self, n):
         if self.curr_idx >= self.last_idx:
             return
 
         end_idx = min(self.curr_idx + n, self.last_idx)
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with ThreadPoolExecutor(
+            max_workers=scheduler.max_workers("download")
+        ) as executor:
             futures = [
                 executor.submit(self.download_audio, vid["title"], vid["url"])
                 for _, vid in self.df.iloc[self.curr_idx : end_idx].iterrows()
@@ -5,19 +5,43 @@ import math
 import os
 import subprocess
 import glob
+import asyncio
+import threading
 from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
+from analyzers.prosody import decode_pcm
+from analyzers.run_report import report
+from analyzers.scheduler import scheduler
+from analyzers.shard import in_shard
+from scrapers.http_client import fetch_all
+from scrapers.http_cache import HttpCache
+
+# search results change as talks are published and viewed, so they are only reused for an hour
+SEARCH_TTL = 3600
+
+# the delta crawl gives up after this many search pages without reaching a known talk
+MAX_DELTA_PAGES = 20
 
 
 class Scraper:
-    def __init__(self, n_speeches=10, sorting="popular"):
+    # with fetch=False the slugs and speech data previously saved to slugs.json and speeches.json are used
+    # with http_cache the metadata responses are cached in ../data/http_cache.sqlite
+    # with shard (i, N) only the talks of the i:th of N disjoint shards are kept, see analyzers/shard.py
+    def __init__(
+        self, n_speeches=10, sorting="popular", fetch=True, http_cache=True, shard=None
+    ):
         self.n_speeches = n_speeches
+        self.shard = shard
         self.current_speech_idx = 0
-        self.get_slugs(int(n_speeches), sorting)
-        self.get_speech_data()
+        self.cache = HttpCache() if http_cache else None
+        self.build_id = None
+        self.build_id_lock = threading.Lock()
+        if fetch:
+            self.get_slugs(int(n_speeches), sorting)
+            self.get_speech_data()
 
     # this function is responsible for fetching the slugs (presenter + title) of a single search page
-    def fetch_page(self, page, sorting):
+    async def fetch_page(self, fetcher, page, sorting, ttl=SEARCH_TTL):
         payload = [
             {
                 "indexName": sorting,
@@ -34,55 +58,138 @@ class Scraper:
                 },
             }
         ]
-        res = requests.post(
-            "https://zenith-prod-alt.ted.com/api/search", json=payload
-        ).json()
+        res = await fetcher.post_json(
+            "https://zenith-prod-alt.ted.com/api/search",
+            cache_key=f"search {sorting} {page}",
+            ttl=ttl,
+            json=payload,
+        )
         hits = res["results"][0]["hits"]
         return page, [hit["slug"] for hit in hits], res["results"][0]["nbPages"]
 
     # gets the slugs of the n first speeches sorted by the given criteria, and saves them to a json
     def get_slugs(self, n_speeches, sorting):
-        first_page = self.fetch_page(0, sorting)
+        first_page = fetch_all(
+            lambda fetcher, page: self.fetch_page(fetcher, page, sorting),
+            [0],
+            cache=self.cache,
+        )[0]
+        if first_page is None:
+            raise RuntimeError("Couldn't fetch the first search page")
         slugs = first_page[1]
         last_page_index = int(first_page[2])
         if n_speeches < last_page_index * 24:
             last_page_index = math.ceil(n_speeches / 24)
 
+        page_results = {}
         if last_page_index != 0:
-            with ThreadPoolExecutor(max_workers=20) as executor:
-                futures = [
-                    executor.submit(self.fetch_page, i, sorting)
-                    for i in range(1, last_page_index + 1)
-                ]
-                page_results = {}
-                for future in futures:
-                    page_num, page_slugs, _ = future.result()
+            pages = fetch_all(
+                lambda fetcher, page: self.fetch_page(fetcher, page, sorting),
+                range(1, last_page_index + 1),
+                cache=self.cache,
+                concurrency=scheduler.network_workers(),
+            )
+            for page in pages:
+                # a page that failed after all retries only leaves a gap in the slugs
+                if page:
+                    page_num, page_slugs, _ = page
                     page_results[page_num] = page_slugs
 
         for i in range(1, last_page_index + 1):
-            slugs.extend(page_results[i])
+            slugs.extend(page_results.get(i, []))
 
+        slugs = [slug for slug in slugs[:n_speeches] if in_shard(slug, self.shard)]
         with open("../data/slugs.json", "w") as f:
-            json.dump(slugs[:n_speeches], f, indent=4)
+            json.dump(slugs, f, indent=4)
 
+        if self.shard is not None:
+            print(
+                f"Shard {self.shard[0]}/{self.shard[1]} has {len(slugs)} of the talks"
+            )
         print("Fetched slugs")
 
+    # pages forward through the newest talks until a page has a talk in known, returns the slugs
+    # of the talks newer than it, newest first, the pages are always requested again
+    async def crawl_new(self, fetcher, known, max_pages=MAX_DELTA_PAGES):
+        new = []
+        for page in range(max_pages):
+            _, page_slugs, n_pages = await self.fetch_page(
+                fetcher, page, "newest", ttl=0
+            )
+            for slug in page_slugs:
+                if slug in known:
+                    return new
+                if slug not in new:
+                    new.append(slug)
+            if page + 1 >= n_pages:
+                return new
+        print(f"No known talk in the {max_pages} newest pages, stopping there")
+        return new
+
+    # saves the slugs of the talks published since the newest talk in known to slugs.json,
+    # returns how many there are
+    def get_new_slugs(self, known, max_pages=MAX_DELTA_PAGES):
+        new = fetch_all(
+            lambda fetcher, _: self.crawl_new(fetcher, set(known), max_pages),
+            [None],
+            cache=self.cache,
+        )[0]
+        if new is None:
+            raise RuntimeError("Couldn't fetch the newest talks")
+
+        with open("../data/slugs.json", "w") as f:
+            json.dump(new, f, indent=4)
+        self.n_speeches = len(new)
+
+        print(f"Found {len(new)} new talks")
+        return len(new)
+
+    # the build id of ted.com, which is part of the talk data urls, only looked up once a talk
+    # actually has to be requested
+    def get_build_id(self):
+        with self.build_id_lock:
+            if self.build_id is None:
+                res = requests.get("https://www.ted.com")
+                soup = bs4.BeautifulSoup(res.text, "lxml")
+                next_data_tag = soup.find("script", id="__NEXT_DATA__")
+                self.build_id = json.loads(next_data_tag.string)["buildId"]
+        return self.build_id
+
+    # fetches the talk or dubbing data of a slug, cached by the slug so that a new build id doesn't
+    # invalidate it
+    async def fetch_talk_json(self, fetcher, kind, slug):
+        key = f"{kind} {slug}"
+        build_id = self.build_id
+        if build_id is None and not (self.cache and self.cache.fresh(key)):
+            build_id = await asyncio.to_thread(self.get_build_id)
+        url = f"https://www.ted.com/_next/data/{build_id}/{kind}/{slug}.json"
+        return await fetcher.get_json(url, cache_key=key)
+
     # fetches the speech data (like the audio stream url, title, views, etc.) of a single given speech
-    def fetch_speech_data(self, slug, build_id, session):
-        url = f"https://www.ted.com/_next/data/{build_id}/talks/{slug}.json"
-        res = session.get(url).json()
-        res_data = res.get("pageProps", {}).get("videoData", {})
+    async def fetch_speech_data(self, fetcher, slug):
+        res = await self.fetch_talk_json(fetcher, "talks", slug)
+        res_data = (res.get("pageProps") or {}).get("videoData", {})
 
         if not res_data:
-            redirect = res.get("pageProps", {}).get("__N_REDIRECT", None)
+            redirect = (res.get("pageProps") or {}).get("__N_REDIRECT", None)
             if redirect:
-                url = f"https://www.ted.com/_next/data/{build_id}/dubbing/{slug}.json"
-                res = session.get(url).json()
-                res_data = res.get("pageProps", {}).get("videoData", {})
+                res = await self.fetch_talk_json(fetcher, "dubbing", slug)
+                res_data = (res.get("pageProps") or {}).get("videoData", {})
             else:
                 print(slug)
                 return None
 
+        # a talk with malformed data is skipped instead of failing the whole run
+        try:
+            data = self.parse_speech_data(res_data)
+        except (KeyError, TypeError, ValueError):
+            print(slug)
+            return None
+
+        return data
+
+    # picks the fields we use from the videoData of a talk
+    def parse_speech_data(self, res_data):
         data = {}
         data["streamUrl"] = json.loads(res_data["playerData"])["resources"]["hls"][
             "stream"
@@ -111,27 +218,16 @@ class Scraper:
 
     # gets the speech data of all of the associated slugs in the previously saved slugs.json
     def get_speech_data(self):
-        url = "https://www.ted.com"
-        with requests.Session() as session:
-            res = session.get(url)
-            soup = bs4.BeautifulSoup(res.text, "lxml")
-            next_data_tag = soup.find("script", id="__NEXT_DATA__")
-            data = json.loads(next_data_tag.string)
-            build_id = data["buildId"]
-
-            with open("../data/slugs.json") as slug_file:
-                slugs = json.load(slug_file)
-
-            speeches = []
-            with ThreadPoolExecutor(max_workers=50) as executor:
-                futures = [
-                    executor.submit(self.fetch_speech_data, slug, build_id, session)
-                    for slug in slugs
-                ]
-                for future in futures:
-                    speech_data = future.result()
-                    if speech_data:
-                        speeches.append(speech_data)
+        with open("../data/slugs.json") as slug_file:
+            slugs = json.load(slug_file)
+
+        results = fetch_all(
+            self.fetch_speech_data,
+            slugs,
+            cache=self.cache,
+            concurrency=scheduler.network_workers(),
+        )
+        speeches = [speech_data for speech_data in results if speech_data]
 
         with open("../data/speeches.json", "w") as f:
             json.dump(speeches, f, indent=4)
@@ -150,25 +246,64 @@ class Scraper:
             "nopart": True,
         }
 
-        with yt_dlp.YoutubeDL(yt_opts) as ydl:
-            ydl.download(url)
-
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",
-                "-i",
-                out_path,
-                "-ar",
-                "48000",
-                "-acodec",
-                "pcm_s32le",
-                wav_path,
-            ],
-            check=True,
-        )
+        with scheduler.slot("download"), report.stage("download", slug) as item:
+            with yt_dlp.YoutubeDL(yt_opts) as ydl:
+                ydl.download(url)
+            item["bytes"] = os.path.getsize(out_path)
+
+        with scheduler.slot("convert"), report.stage("convert", slug) as item:
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",
+                    "-i",
+                    out_path,
+                    "-ar",
+                    "48000",
+                    "-acodec",
+                    "pcm_s32le",
+                    wav_path,
+                ],
+                check=True,
+            )
+            item["bytes"] = os.path.getsize(wav_path)
 
         os.remove(out_path)
+        return wav_path
+
+    # downloads a single speech and decodes it to an in-memory pcm buffer, no wav is written
+    def decode_audio(self, url, slug):
+        out_path = os.path.join("../myprosody", "dataset", "audioFiles", slug + ".mp4")
+
+        yt_opts = {
+            "format": "bestaudio",
+            "outtmpl": out_path,
+            "overwrites": True,
+            "nopart": True,
+        }
+
+        with scheduler.slot("download"), report.stage("download", slug) as item:
+            with yt_dlp.YoutubeDL(yt_opts) as ydl:
+                ydl.download(url)
+            item["bytes"] = os.path.getsize(out_path)
+
+        try:
+            with scheduler.slot("convert"), report.stage("convert", slug) as item:
+                pcm = decode_pcm(out_path)
+                item["bytes"] = len(pcm)
+        finally:
+            os.remove(out_path)
+        return slug, pcm
+
+    # returns the (stream url, slug) pairs of the speeches in the previously saved speeches.json
+    def audio_jobs(self):
+        with open("../data/speeches.json", "r") as f:
+            speech_data = json.load(f)
+        return [
+            (speech["streamUrl"], speech["slug"])
+            for speech in speech_data[: self.n_speeches]
+            if "streamUrl" in speech and speech["streamUrl"]
+        ]
 
     # gets the audios of all of the associated speeches in the previously saved speeches.json
     def get_audios(self, n_speeches):
@@ -182,7 +317,9 @@ class Scraper:
         with open("../data/speeches.json", "r") as f:
             speech_data = json.load(f)
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with ThreadPoolExecutor(
+            max_workers=scheduler.max_workers("download")
+        ) as executor:
             futures = [
                 executor.submit(
                     self.download_audio, speech["streamUrl"], speech["slug"]
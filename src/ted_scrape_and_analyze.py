@@ -1,60 +1,136 @@
 import sys
 import glob
 import os
+import time
 import pandas as pd
-import json
 import re
 from analyzers.ted_analyze import analyze
+from analyzers.manifest import load_manifest
+from analyzers.merge import MergedOutput, load_metadata, finish_merged, merge_shards
+from analyzers.shard import shard_arg
+from analyzers.run_report import report
 
 
-# merges the csv files created by the analyze function, and joins the speech data collected into speeches.json, saves everything into analysis.csv
-def merge_and_join(n_speeches, sorting):
-    csv_files = glob.glob(os.path.join("../data/csv", "*.csv"))
-    if not csv_files:
-        print("No CSVs to merge")
-        return
+# finalizes analyzed_speeches_{name}.csv, which analyze fills batch by batch with the analysis
+# results joined with the speech data in speeches.json, and removes the intermediate CSVs
+# if there is no merged CSV (e.g. the run was made with an older version) the analysis CSVs are
+# joined one at a time, only the CSVs recorded in the crawl's manifest are merged when there is one
+def merge_and_join(name):
+    merged_csv_path = os.path.join("../data/csv", f"analyzed_speeches_{name}.csv")
+    manifest = load_manifest()
     try:
-        dfs = []
-        for f in csv_files:
-            if re.match(r"^analysis_", os.path.basename(f)):
+        if not finish_merged(merged_csv_path):
+            if manifest is not None:
+                csv_files = [f for f in manifest.csvs if os.path.exists(f)]
+            else:
+                csv_files = glob.glob(os.path.join("../data/csv", "analysis_*.csv"))
+            if not csv_files:
+                print("No CSVs to merge")
+                return
+            merged = MergedOutput(
+                merged_csv_path, load_metadata("../data/speeches.json", "slug"), "slug"
+            )
+            for f in csv_files:
                 df = pd.read_csv(f, index_col=False)
-                df = df.loc[:, ~df.columns.str.contains("^Unnamed")]
-                dfs.append(df)
-        merged_df = pd.concat(dfs, ignore_index=True)
-        with open("../data/speeches.json", "r", encoding="utf-8") as f:
-            json_data = json.load(f)
-        json_df = pd.DataFrame(json_data)
-        merged_df = pd.merge(merged_df, json_df, on="slug", how="left")
-        merged_csv_path = os.path.join(
-            "../data/csv", f"analyzed_speeches_{n_speeches}_{sorting}.csv"
-        )
-        merged_df.to_csv(merged_csv_path, index=False)
-        print(
-            f"Merged CSVs and wrote to ../data/csv/analyzed_speeches__{n_speeches}_{sorting}.csv"
-        )
-        for f in csv_files:
+                merged.append(df.loc[:, ~df.columns.str.contains("^Unnamed")])
+            merged.finish()
+
+        print(f"Merged CSVs and wrote to {merged_csv_path}")
+        for f in glob.glob(os.path.join("../data/csv", "*.csv")):
             filename = os.path.basename(f)
             if not re.match(r"^analyzed_", filename):
                 os.remove(f)
+        if manifest is not None:
+            manifest.remove()
     except Exception as e:
         print("Error merging:", e)
         return
 
 
-def main(n_speeches, n_per_time, sorting):
-    analyze(n_speeches, n_per_time, sorting)
-    merge_and_join(n_speeches, sorting)
+# the timings of every stage are written to ../data/reports/run_ted_*.json and summarized at the end
+# with delta only the talks published since the newest talk in the dataset are analyzed
+# with shard (i, N) only the i:th of N disjoint shards of the talks is analyzed, so N machines can
+# split a crawl, see merge_shards
+# with reanalyze the talks that only have the Praat features of the existing CSVs are analyzed again
+def main(
+    n_speeches,
+    n_per_time,
+    sorting,
+    resume=False,
+    delta=False,
+    shard=None,
+    reanalyze=False,
+):
+    report.clear()
+    name = analyze(
+        n_speeches,
+        n_per_time,
+        sorting,
+        resume=resume,
+        delta=delta,
+        shard=shard,
+        reanalyze=reanalyze,
+    )
+    if name is not None:
+        with report.stage("merge", name):
+            merge_and_join(name)
+    report.write("ted_delta" if delta else "ted")
+
+
+# runs a delta crawl every interval seconds, so only new talks are ever fetched and analyzed
+def watch(n_per_time, interval):
+    while True:
+        try:
+            main(None, n_per_time, "newest", delta=True)
+        except Exception as e:
+            print(f"Delta crawl failed: {e}, retrying in {interval} s")
+        time.sleep(interval)
+
+
+# combines the shard CSVs of a crawl made with --shard on N machines, copied to ../data/csv, into
+# analyzed_speeches_{n}_{sorting}.csv
+def merge_shard_csvs(n_speeches, sorting):
+    merge_shards(
+        os.path.join("../data/csv", f"analyzed_speeches_{n_speeches}_{sorting}.csv"),
+        "slug",
+    )
 
 
-# Usage: python ted_scrape_and_analyze.py [n: int (amount of speeches to download)] [n_per_time: int (amount of speeches to download and analyze at once)] [sorting :string (sort by "popular" or "newest" speeches)]
+# Usage: python ted_scrape_and_analyze.py [n: int (amount of speeches to download)] [n_per_time: int (amount of analyzed speeches per saved CSV)] [sorting :string (sort by "popular" or "newest" speeches)] [--resume (continue an interrupted run)] [--shard i/N (only the i:th of N shards of the speeches)] [--reanalyze (don't reuse the Praat features of the existing CSVs)]
+#        python ted_scrape_and_analyze.py --delta [n_per_time: int] [--resume] (only the talks published since the newest talk in the dataset)
+#        python ted_scrape_and_analyze.py --watch[=seconds] [n_per_time: int] (a delta crawl every 6 hours or the given seconds)
+#        python ted_scrape_and_analyze.py --merge-shards [n: int] [sorting: str] (merge the shard CSVs of a sharded crawl)
 if __name__ == "__main__":
+    shard, sys.argv = shard_arg(sys.argv)
+    resume = "--resume" in sys.argv
+    reanalyze = "--reanalyze" in sys.argv
+    delta = "--delta" in sys.argv
+    interval = None
+    for arg in sys.argv:
+        if arg.startswith("--watch"):
+            interval = int(arg.split("=", 1)[1]) if "=" in arg else 6 * 3600
+    merge = "--merge-shards" in sys.argv
+    sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
+    if (delta or interval) and shard is not None:
+        raise ValueError("--shard can't be combined with --delta or --watch")
+    if delta or interval:
+        n_per_time = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+        if interval:
+            watch(n_per_time, interval)
+        else:
+            main(None, n_per_time, "newest", resume, delta=True, reanalyze=reanalyze)
+        sys.exit(0)
+    if merge:
+        n_speeches = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+        merge_shard_csvs(n_speeches, sys.argv[2] if len(sys.argv) > 2 else "popular")
+        sys.exit(0)
     n_speeches = 10
     n_per_time = 5
     sorting = "popular"
     if len(sys.argv) > 1:
         n_speeches = int(sys.argv[1])  # number of speeches
     if len(sys.argv) > 2:
-        n_per_time = int(sys.argv[2])  # how many speeches are processed at once
+        n_per_time = int(sys.argv[2])  # how many analyzed speeches go to one CSV
     if len(sys.argv) > 3:
         sorting = sys.argv[3]  # "popular" for popular and "newest" for newest
-    main(n_speeches, n_per_time, sorting)
+    main(n_speeches, n_per_time, sorting, resume, shard=shard, reanalyze=reanalyze)
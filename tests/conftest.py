@@ -0,0 +1,44 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+
+# a local http server for the scraper tests, serve(handle) starts one whose GET and POST requests
+# are answered by handle(request) -> (status, headers, body) and returns its base url, every request
+# is recorded in serve.requests
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(handle):
+        class Handler(BaseHTTPRequestHandler):
+            def respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.body = self.rfile.read(length) if length else b""
+                with lock:
+                    start.requests.append(self)
+                status, headers, body = handle(self)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = respond
+            do_POST = respond
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    lock = threading.Lock()
+    start.requests = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,69 @@
+import functools
+import importlib
+import sys
+import numpy as np
+from models import cv
+
+FIT_SOURCE = """
+def fit(x_train, y_train):
+    return {{"mean": float(y_train.mean()), "version": {version}}}
+
+
+def fit_scaled(scale, x_train, y_train):
+    return {{"mean": scale * float(y_train.mean()), "version": {version}}}
+
+
+def proba(model, x_test):
+    return [model["mean"]] * len(x_test)
+"""
+
+
+# writes the fit functions of a model module with the given version and imports it
+def fit_module(tmp_path, version):
+    (tmp_path / "fits.py").write_text(FIT_SOURCE.format(version=version))
+    sys.path.insert(0, str(tmp_path))
+    try:
+        sys.modules.pop("fits", None)
+        importlib.invalidate_caches()
+        return importlib.import_module("fits")
+    finally:
+        sys.path.remove(str(tmp_path))
+
+
+def data():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((40, 2)), np.tile([0, 1], 20)
+
+
+# the cached fold models of a fit function are refit once its code changes, not loaded
+def test_fit_code_is_part_of_the_cache_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(cv, "CACHE_DIR", str(tmp_path / "cache"))
+    x, y = data()
+
+    fits = fit_module(tmp_path, 1)
+    _, models = cv.cross_validate(x, y, fits.fit, fits.proba, k=2, n_jobs=1)
+    assert [m["version"] for m in models] == [1, 1]
+
+    fits = fit_module(tmp_path, 2)
+    _, models = cv.cross_validate(x, y, fits.fit, fits.proba, k=2, n_jobs=1)
+    assert [m["version"] for m in models] == [2, 2]
+
+
+# so is the code of the function a partial wraps, and its arguments
+def test_partial_code_and_arguments_are_part_of_the_cache_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(cv, "CACHE_DIR", str(tmp_path / "cache"))
+    x, y = data()
+
+    fits = fit_module(tmp_path, 1)
+    fit = functools.partial(fits.fit_scaled, 1.0)
+    _, models = cv.cross_validate(x, y, fit, fits.proba, k=2, n_jobs=1)
+    assert [m["version"] for m in models] == [1, 1]
+
+    fit = functools.partial(fits.fit_scaled, 2.0)
+    _, models = cv.cross_validate(x, y, fit, fits.proba, k=2, n_jobs=1)
+    assert [m["mean"] for m in models] == [1.0, 1.0]
+
+    fits = fit_module(tmp_path, 2)
+    fit = functools.partial(fits.fit_scaled, 2.0)
+    _, models = cv.cross_validate(x, y, fit, fits.proba, k=2, n_jobs=1)
+    assert [m["version"] for m in models] == [2, 2]
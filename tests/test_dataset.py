@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+from analyzers.prosody import EXTRACTOR_VERSION, PRAAT_VERSION
+from models import dataset
+
+
+# a CSV from before the extractor column (mysptotal rows) and one of a native crawl
+@pytest.fixture(params=[True, False], ids=["parquet", "csv"])
+def csvs(tmp_path, monkeypatch, request):
+    if request.param:
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(dataset, "csv_dir", str(tmp_path / "csv"))
+    monkeypatch.setattr(dataset, "parquet_dir", str(tmp_path / "parquet"))
+    if not request.param:
+        monkeypatch.setattr(dataset, "build", lambda source: False)
+    dataset._load.cache_clear()
+    (tmp_path / "csv").mkdir()
+    pd.DataFrame({"slug": ["a", "b"], "f0_std": [1.0, 2.0]}).to_csv(
+        tmp_path / "csv" / "analyzed_speeches_old.csv", index=False
+    )
+    pd.DataFrame(
+        {"slug": ["c"], "f0_std": [3.0], "extractor": [EXTRACTOR_VERSION]}
+    ).to_csv(tmp_path / "csv" / "analyzed_speeches_new.csv", index=False)
+    yield
+    dataset._load.cache_clear()
+
+
+# the models get the mysptotal rows unless they ask for the native ones, rows aren't mixed
+def test_rows_of_one_extractor(csvs):
+    def slugs(**kwargs):
+        return sorted(dataset.load("ted", ["slug", "f0_std"], **kwargs)["slug"])
+
+    assert slugs() == ["a", "b"]
+    assert slugs(extractor=PRAAT_VERSION) == ["a", "b"]
+    assert slugs(extractor=EXTRACTOR_VERSION) == ["c"]
+    assert slugs(extractor=None) == ["a", "b", "c"]
+    assert list(dataset.load("ted", ["slug", "f0_std"]).columns) == ["slug", "f0_std"]
@@ -0,0 +1,28 @@
+import pytest
+from analyzers.feature_store import FeatureStore
+from analyzers.prosody import EXTRACTOR_VERSION, FEATURE_COLUMNS, PRAAT_VERSION
+from analyzers.records import FeatureRecord
+
+
+def record(name, value):
+    return FeatureRecord.from_features(name, {c: value for c in FEATURE_COLUMNS})
+
+
+# a key gets the features of the first version that has them, a key without any is left out
+def test_get_first(tmp_path):
+    store = FeatureStore(str(tmp_path / "features.sqlite"))
+    store.put("a", PRAAT_VERSION, record("a", 1.0))
+    store.put("b", PRAAT_VERSION, record("b", 2.0))
+    store.put("b", EXTRACTOR_VERSION, record("b", 3.0))
+
+    df = store.get_first(["a", "b", "c"], [EXTRACTOR_VERSION, PRAAT_VERSION])
+    df = df.set_index("key")
+    assert sorted(df.index) == ["a", "b"]
+    assert df.loc["a", "f0_std"] == pytest.approx(1.0)
+    assert df.loc["a", "extractor"] == PRAAT_VERSION
+    assert df.loc["b", "f0_std"] == pytest.approx(3.0)
+    assert df.loc["b", "extractor"] == EXTRACTOR_VERSION
+
+    assert store.get_first(["a", "b"], [EXTRACTOR_VERSION])["key"].tolist() == ["b"]
+    assert len(store.get_first(["c"], [EXTRACTOR_VERSION, PRAAT_VERSION])) == 0
+    store.close()
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+from analyzers import fingerprint, prosody
+from analyzers.fingerprint import Deduplicator, FingerprintIndex, bit_error
+from analyzers.prosody import FEATURE_COLUMNS, PCM_RATE
+from analyzers.records import FeatureRecord
+
+SR = PCM_RATE
+VERSION = "test"
+
+
+# synthetic running speech that differs with the seed: phrases of 3 to 12 syllables with a random
+# f0 and formants, some followed by a fricative, over a quiet room tone
+def talk(seconds, seed):
+    rng = np.random.default_rng(seed)
+    x = rng.standard_normal(int(seconds * SR)).astype(np.float32) * 0.003
+    t = 0.3
+    while t < seconds - 0.5:
+        for _ in range(rng.integers(3, 13)):
+            length = rng.uniform(0.12, 0.25)
+            start, end = int(t * SR), int(min(t + length, seconds) * SR)
+            k = np.arange(end - start) / SR
+            f0 = rng.uniform(100, 220)
+            formants = [
+                rng.uniform(300, 850),
+                rng.uniform(900, 2300),
+                rng.uniform(2400, 3200),
+            ]
+            phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.08 * np.sin(6 * np.pi * k))) / SR
+            for h in range(1, int(5000 / f0)):
+                amp = 0.02 / h + sum(
+                    np.exp(-(((h * f0 - f) / 120) ** 2)) / 2**i
+                    for i, f in enumerate(formants)
+                )
+                x[start:end] += (
+                    0.2 * amp * np.sin(np.pi * k / length) ** 2 * np.sin(h * phase)
+                )
+            if rng.random() < 0.3:
+                n = len(x[end : end + int(rng.uniform(0.05, 0.1) * SR)])
+                x[end : end + n] += (
+                    0.05 * np.diff(rng.standard_normal(n + 1)) * np.hanning(n)
+                )
+            t += length + rng.uniform(0.03, 0.12)
+        t += rng.uniform(0.3, 1.2)
+    return x
+
+
+# a re-encoded copy: other leading silence, gain, amplitude jitter and noise floor
+def copy_of(x, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.concatenate([rng.standard_normal(2 * SR) * 0.01, 0.7 * x])
+    jitter, noise = rng.standard_normal((2, len(x)))
+    return (x * (1 + 0.05 * jitter) + 0.001 * noise).astype(np.float32)
+
+
+def pcm_of(x):
+    return (np.clip(x, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+# three talks that open with the same 10 s intro
+@pytest.fixture(scope="module")
+def talks():
+    intro = talk(10, seed=99)
+    return [np.concatenate([intro, talk(90, seed)]) for seed in range(3)]
+
+
+# a copy matches its original, another talk with the same intro matches nothing
+def test_copy_matches_and_shared_intro_does_not(tmp_path, talks):
+    a, b, c = talks
+    index = FingerprintIndex(str(tmp_path / "fingerprints.sqlite"))
+    index.add("a", fingerprint.fingerprint(a, SR)[0])
+    index.add("b", fingerprint.fingerprint(b, SR)[0])
+
+    key, error = index.match(*fingerprint.fingerprint(copy_of(a), SR))
+    assert key == "a"
+    assert error < fingerprint.MAX_BIT_ERROR
+    assert index.match(*fingerprint.fingerprint(c, SR)) is None
+    index.close()
+
+
+# without the lead-in the shared intro is fingerprinted, its blocks agree but not enough of them
+def test_shared_intro_is_not_enough_to_match(monkeypatch, talks):
+    a, b, _ = talks
+    monkeypatch.setattr(fingerprint, "FINGERPRINT_LEAD_IN", 0)
+    _, agreement = bit_error(
+        fingerprint.fingerprint(a, SR)[0], fingerprint.fingerprint(b, SR)[0], 0
+    )
+    assert 0 < agreement < fingerprint.MIN_AGREEMENT
+
+
+# an audio is only a match target once its features are stored, not when its analysis failed
+def test_only_stored_audios_are_indexed(tmp_path, talks):
+    a = talks[0]
+    dedup = Deduplicator(
+        VERSION,
+        str(tmp_path / "fingerprints.sqlite"),
+        str(tmp_path / "features.sqlite"),
+    )
+    copy = ("a_copy", pcm_of(copy_of(a)))
+    assert dedup.skip("a", ("a", pcm_of(a))) is None
+    assert dedup.skip("a_copy", copy) is None
+    dedup.discard("a")
+    dedup.discard("a_copy")
+    assert dedup.skip("a_copy", copy) is None
+    dedup.discard("a_copy")
+
+    assert dedup.skip("a", ("a", pcm_of(a))) is None
+    features = {c: float(i) for i, c in enumerate(FEATURE_COLUMNS)}
+    dedup.store.put("a", VERSION, FeatureRecord.from_features("a", features))
+    dedup.indexed("a")
+    record = dedup.skip("a_copy", copy)
+    assert record.duplicate_of == "a"
+    assert record.values == tuple(features.values())
+    dedup.close()
+
+
+# only the seconds fingerprint looks at are read from a long recording, with the same fingerprint
+def test_only_the_fingerprinted_part_is_read(monkeypatch, talks):
+    x = np.concatenate([talks[0], talks[1]])
+    lengths = []
+
+    def read_pcm(pcm, seconds=None):
+        x = prosody.read_pcm(pcm, seconds)
+        lengths.append(len(x))
+        return x
+
+    monkeypatch.setattr(fingerprint, "read_pcm", read_pcm)
+    fp, weak = fingerprint.audio_fingerprint(("talk", pcm_of(x)))
+    seconds = (
+        fingerprint.FINGERPRINT_SEARCH
+        + fingerprint.FINGERPRINT_LEAD_IN
+        + fingerprint.FINGERPRINT_SECONDS
+    )
+    assert lengths == [seconds * SR] and seconds * SR < len(x)
+    expected, _ = fingerprint.fingerprint(prosody.read_pcm(pcm_of(x)), SR)
+    assert np.array_equal(fp, expected)
@@ -0,0 +1,90 @@
+import json
+import time
+from scrapers.http_cache import HttpCache
+from scrapers.http_client import fetch_all
+
+
+# a server whose responses have an ETag, answers 304 to a request that sends the current one
+def etag_server(serve, version):
+    def handle(request):
+        etag = f'"{version[0]}"'
+        if request.headers.get("If-None-Match") == etag:
+            return 304, {"ETag": etag}, b""
+        body = json.dumps(
+            {"path": request.path, "version": version[0], "pad": "x" * 900}
+        )
+        return 200, {"ETag": etag, "Content-Type": "application/json"}, body.encode()
+
+    return serve(handle)
+
+
+def fetch(base, items, cache):
+    return fetch_all(
+        lambda fetcher, i: fetcher.get_json(f"{base}/talk/{i}.json"),
+        items,
+        cache=cache,
+    )
+
+
+# a second run within the ttl is served from the cache without a single request
+def test_second_run_makes_no_requests(serve, tmp_path):
+    base = etag_server(serve, [1])
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    first = fetch(base, range(20), cache)
+    assert len(serve.requests) == 20
+
+    cache.close()
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    second = fetch(base, range(20), cache)
+    assert second == first
+    assert len(serve.requests) == 20
+    assert cache.hits == 20 and cache.misses == 0
+
+
+# once the ttl has passed a response is revalidated, an unchanged one costs a 304 and a changed one
+# is fetched again
+def test_expired_responses_are_revalidated(serve, tmp_path):
+    version = [1]
+    base = etag_server(serve, version)
+    cache = HttpCache(str(tmp_path / "cache.sqlite"), ttl=0.2)
+    fetch(base, range(5), cache)
+
+    time.sleep(0.3)
+    assert fetch(base, range(5), cache)[0]["version"] == 1
+    assert cache.revalidated == 5
+    assert [r.headers.get("If-None-Match") for r in serve.requests[5:]] == ['"1"'] * 5
+
+    # a revalidated response starts a new ttl
+    fetch(base, range(5), cache)
+    assert len(serve.requests) == 10
+
+    time.sleep(0.3)
+    version[0] = 2
+    assert fetch(base, range(5), cache)[0]["version"] == 2
+    assert cache.misses == 10
+    assert len(serve.requests) == 15
+
+
+# the least recently used responses are evicted to keep the cache within max_bytes
+def test_lru_eviction_keeps_max_bytes(serve, tmp_path):
+    base = etag_server(serve, [1])
+    cache = HttpCache(str(tmp_path / "cache.sqlite"))
+    for i in range(8):
+        fetch(base, [i], cache)
+        time.sleep(0.01)
+    size = cache.conn.execute("SELECT MAX(size) FROM responses").fetchone()[0]
+    cache.max_bytes = 8 * size + size // 2
+
+    # 0 becomes the most recently used, so 1 and 2 are the ones evicted for 8 and 9
+    fetch(base, [0], cache)
+    for i in [8, 9]:
+        time.sleep(0.01)
+        fetch(base, [i], cache)
+
+    total = cache.conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    assert total <= cache.max_bytes
+    kept = {
+        url.rsplit("/", 1)[1]
+        for (url,) in cache.conn.execute("SELECT url FROM responses")
+    }
+    assert kept == {f"{i}.json" for i in [0, 3, 4, 5, 6, 7, 8, 9]}
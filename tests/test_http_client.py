@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from scrapers.http_client import fetch_all
+
+FAST = {"backoff": 0.001, "max_backoff": 0.01}
+
+
+def ok(body):
+    return 200, {"Content-Type": "application/json"}, json.dumps(body).encode()
+
+
+# transient failures (rate limits, 5xx and truncated json) are retried until the response is good
+def test_retries_until_success(serve):
+    attempts = {}
+
+    def handle(request):
+        n = attempts[request.path] = attempts.get(request.path, 0) + 1
+        if n == 1:
+            return 429, {"Retry-After": "0"}, b""
+        if n == 2:
+            return 503, {}, b""
+        if n == 3:
+            return 200, {}, b"{not json"
+        return ok({"path": request.path})
+
+    base = serve(handle)
+    results = fetch_all(
+        lambda fetcher, i: fetcher.get_json(f"{base}/{i}"), range(20), **FAST
+    )
+    assert results == [{"path": f"/{i}"} for i in range(20)]
+    assert all(n == 4 for n in attempts.values())
+
+
+# an item whose requests keep failing, that gets a 4xx or whose response the caller can't parse
+# gives None, and the other items still get their results
+def test_one_bad_item_doesnt_abort_the_others(serve):
+    def handle(request):
+        if request.path == "/down":
+            return 500, {}, b""
+        if request.path == "/missing":
+            return 404, {}, b""
+        if request.path == "/null":
+            return ok({"pageProps": None})
+        return ok({"pageProps": {"slug": request.path[1:]}})
+
+    async def fetch(fetcher, item):
+        res = await fetcher.get_json(f"{base}/{item}")
+        return res["pageProps"]["slug"]
+
+    base = serve(handle)
+    items = ["a", "down", "b", "missing", "null", "c"]
+    results = fetch_all(fetch, items, retries=2, **FAST)
+    assert results == ["a", None, "b", None, None, "c"]
+    # a 4xx isn't retried, the 5xx is tried retries + 1 times
+    paths = [request.path for request in serve.requests]
+    assert paths.count("/missing") == 1
+    assert paths.count("/down") == 3
+
+
+# no more requests than per_host are in flight to one host
+def test_per_host_limit(serve):
+    lock = threading.Lock()
+    state = {"in_flight": 0, "max": 0}
+
+    def handle(request):
+        with lock:
+            state["in_flight"] += 1
+            state["max"] = max(state["max"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        return ok({})
+
+    base = serve(handle)
+    results = fetch_all(
+        lambda fetcher, i: fetcher.get_json(f"{base}/{i}"),
+        range(60),
+        concurrency=32,
+        per_host=4,
+    )
+    assert len(results) == 60 and all(r == {} for r in results)
+    assert 1 < state["max"] <= 4
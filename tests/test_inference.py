@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+from models import inference
+from models.logreg import LogReg
+
+FEATURES = ["rate_of_speech", "articulation_rate", "balance", "f0_std"]
+
+
+@pytest.fixture(scope="module")
+def logreg():
+    return LogReg()
+
+
+# the README's call: a DataFrame without the feature names has them in the order of features
+def test_readme_predict(logreg):
+    data = pd.DataFrame([[4, 5, 0.7, 30.4]])
+    named = pd.DataFrame([[4, 5, 0.7, 30.4]], columns=FEATURES)
+    assert logreg.predict(data).tolist() == logreg.predict(named).tolist()
+    assert logreg.predict_proba(data).tolist() == logreg.predict_proba(named).tolist()
+    assert logreg.predict_proba(data).tolist() == pytest.approx(
+        logreg.model.predict([[1, 4, 5, 0.7, 30.4]]).tolist()
+    )
+
+
+# named columns are picked by name whatever their order, a wrong amount of unnamed ones is an error
+def test_feature_matrix():
+    row = dict(zip(FEATURES, [4, 5, 0.7, 30.4]))
+    expected = [[4, 5, 0.7, 30.4]]
+    assert inference.feature_matrix(row, FEATURES).tolist() == expected
+    shuffled = pd.DataFrame([row])[FEATURES[::-1]]
+    assert inference.feature_matrix(shuffled, FEATURES).tolist() == expected
+    with pytest.raises(ValueError):
+        inference.feature_matrix(pd.DataFrame([[4, 5, 0.7]]), FEATURES)
+
+
+# scoring in chunks gives the probabilities of scoring at once, also from the saved artifact
+def test_chunked_predict_proba(logreg, tmp_path):
+    x = np.random.default_rng(0).uniform([2, 3, 0.4, 10], [6, 7, 1, 60], (101, 4))
+    proba = logreg.predict_proba(x)
+    assert logreg.predict_proba(x, chunk_size=7).tolist() == pytest.approx(
+        proba.tolist()
+    )
+
+    predictor = inference.load(logreg.save(str(tmp_path / "logreg.joblib")))
+    assert predictor.predict_proba(x, chunk_size=7).tolist() == pytest.approx(
+        proba.tolist()
+    )
@@ -0,0 +1,75 @@
+import pytest
+import pandas as pd
+from analyzers.manifest import Manifest
+from analyzers.merge import MergedOutput
+
+
+def metadata():
+    return pd.DataFrame(
+        {"title": ["A", "B", "C"], "views": [1, 2, 3]},
+        index=pd.Index(["a", "b", "c"], name="slug"),
+    )
+
+
+# a column that only a later batch has widens the merged CSV instead of being dropped, and the
+# rows written before keep their values
+def test_later_batch_adds_columns(tmp_path):
+    path = str(tmp_path / "merged.csv")
+    merged = MergedOutput(path, metadata(), "slug")
+    merged.append(pd.DataFrame({"slug": ["a"], "f0_mean": [0.1 + 0.2]}))
+    merged.append(
+        pd.DataFrame(
+            {"slug": ["b", "c"], "f0_mean": [2.5, 3.5], "duplicate_of": [None, "a"]}
+        )
+    )
+    merged.append(pd.DataFrame({"slug": ["d"], "f0_mean": [4.5]}))
+    assert merged.finish()
+
+    df = pd.read_csv(path, float_precision="round_trip")
+    assert list(df.columns) == ["slug", "f0_mean", "title", "views", "duplicate_of"]
+    assert df["slug"].tolist() == ["a", "b", "c", "d"]
+    assert df["f0_mean"].tolist() == [0.1 + 0.2, 2.5, 3.5, 4.5]
+    assert df["duplicate_of"].isna().tolist() == [True, True, False, True]
+    assert df.loc[2, "duplicate_of"] == "a"
+    assert df["title"].tolist()[:3] == ["A", "B", "C"]
+
+
+# a resumed run cuts off what was written after the checkpoint and continues with its columns
+def test_resume_truncates_to_the_checkpoint(tmp_path):
+    path = str(tmp_path / "merged.csv")
+    merged = MergedOutput(path, metadata(), "slug")
+    size = merged.append(pd.DataFrame({"slug": ["a"], "f0_mean": [1.5]}))
+    merged.append(pd.DataFrame({"slug": ["b"], "f0_mean": [2.5]}))
+
+    resumed = MergedOutput(path, metadata(), "slug", size)
+    resumed.append(pd.DataFrame({"slug": ["c"], "f0_mean": [3.5]}))
+    resumed.finish()
+    assert pd.read_csv(path)["slug"].tolist() == ["a", "c"]
+
+
+# a batch that widens the file after a checkpoint rewrites the rows before it, a resumed run keeps
+# them whether it stopped after the batch was appended or between the widening and its checkpoint
+@pytest.mark.parametrize("appended", [True, False])
+def test_resume_after_widen(tmp_path, appended):
+    path = str(tmp_path / "merged.csv")
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    merged = MergedOutput(path, metadata(), "slug", on_widen=manifest.set_merged)
+    size = merged.append(pd.DataFrame({"slug": ["a", "b"], "f0_mean": [1.5, 2.5]}))
+    manifest.add_csv("batch0.csv", ["a", "b"], 1, size, merged.columns)
+    batch = pd.DataFrame({"slug": ["c"], "f0_mean": [3.5], "trimmed_seconds": [0.5]})
+    if appended:
+        merged.append(batch)
+    else:
+        merged.on_widen = None
+        merged.widen(["trimmed_seconds"])
+
+    manifest = Manifest(manifest.path, resume=True)
+    resumed = MergedOutput(
+        path, metadata(), "slug", manifest.merged_size, manifest.merged_columns
+    )
+    resumed.append(batch)
+    resumed.finish()
+    df = pd.read_csv(path)
+    assert df["slug"].tolist() == ["a", "b", "c"]
+    assert df["f0_mean"].tolist() == [1.5, 2.5, 3.5]
+    assert df["trimmed_seconds"].isna().tolist() == [True, True, False]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from analyzers import pipeline, prosody
+from analyzers.pipeline import Split, analyze_pcm, split_audio, stream
+from test_prosody import synthetic_speech
+
+
+def pcm_of(x):
+    return (np.clip(x, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+# runs a Split like stream does, in this process
+def run_split(plan):
+    while isinstance(plan, Split):
+        plan = plan.merge([fn(*args) for fn, args in plan.tasks])
+    return plan
+
+
+# counts the VAD passes
+@pytest.fixture
+def vad_calls(monkeypatch):
+    calls = []
+    trim = prosody.trim_non_speech
+
+    def counted(x, sr):
+        calls.append(len(x))
+        return trim(x, sr)
+
+    monkeypatch.setattr(prosody, "trim_non_speech", counted)
+    return calls
+
+
+# an audio shorter than CHUNK_SECONDS is left to analyze_fn without being read
+def test_short_audio_is_not_split(vad_calls):
+    x, _ = synthetic_speech(6, 5, 150)
+    assert split_audio(("talk", pcm_of(x))) is None
+    assert vad_calls == []
+
+
+# a long audio is trimmed once, in its first task, and its windows give the features of analyzing
+# it whole
+def test_long_audio_is_trimmed_once(monkeypatch, vad_calls):
+    x, _ = synthetic_speech(12, 5, 150)
+    # 3 s of silence before the speech is trimmed
+    x = np.concatenate([np.zeros(3 * 16000, dtype=np.float32), x])
+    audio = ("talk", pcm_of(x))
+    whole = analyze_pcm(*audio).to_dict()
+    vad_calls.clear()
+
+    monkeypatch.setattr(pipeline, "CHUNK_SECONDS", 10)
+    monkeypatch.setattr(prosody, "CHUNK_SECONDS", 10)
+    monkeypatch.setattr(prosody, "CHUNK_OVERLAP", 2)
+    plan = split_audio(audio)
+    assert vad_calls == []
+    assert [fn for fn, _ in plan.tasks] == [pipeline.speech_windows]
+
+    windows = plan.merge([fn(*args) for fn, args in plan.tasks])
+    assert len(windows.tasks) > 1
+    windowed = run_split(windows).to_dict()
+    assert len(vad_calls) == 1
+    assert windowed["trimmed_seconds"] == whole["trimmed_seconds"] > 2
+    assert abs(windowed["number_ of_syllables"] - whole["number_ of_syllables"]) <= 1
+    assert windowed["f0_median"] == whole["f0_median"]
+
+
+# an audio whose speech fits in one window once trimmed is analyzed by the first task itself
+def test_long_audio_with_short_speech(monkeypatch, vad_calls):
+    x, _ = synthetic_speech(4, 5, 150)
+    x = np.concatenate([x, np.zeros(10 * 16000, dtype=np.float32)])
+    monkeypatch.setattr(pipeline, "CHUNK_SECONDS", 15)
+    monkeypatch.setattr(prosody, "CHUNK_SECONDS", 15)
+    plan = split_audio(("talk", pcm_of(x)))
+    record = run_split(plan)
+    assert record.name == "talk" and record.trimmed_seconds > 9
+    assert len(vad_calls) == 1
+
+
+def download(url, key):
+    return key, pcm_of(synthetic_speech(2, 4, 150)[0])
+
+
+# stream runs the tasks of every round of a Split in the pool and yields what the last merge gives
+def test_stream_runs_splits_in_rounds():
+    def split(audio):
+        if audio[0] != "long":
+            return None
+        return Split(
+            [(sum, ([1, 2],)), (sum, ([3, 4],))],
+            lambda sums: Split([(sum, (sums,))], lambda total: ("total", total[0])),
+        )
+
+    results = dict(
+        stream(
+            [("url", "short"), ("url", "long")],
+            download,
+            analyze_pcm,
+            None,
+            1,
+            2,
+            split=split,
+        )
+    )
+    assert results[("url", "long")] == ("total", 10)
+    assert results[("url", "short")].name == "short"
@@ -0,0 +1,56 @@
+import json
+import pytest
+from scrapers import playlist_scraper
+from scrapers.playlist_scraper import PlaylistScraper
+
+ENTRIES = [
+    {"title": "First", "url": "https://www.youtube.com/watch?v=a", "duration": 60},
+    {"title": "[Private video]", "url": None, "duration": None},
+    None,
+    {"title": "Second", "url": "https://www.youtube.com/watch?v=b", "duration": 90},
+    {"title": "No url"},
+    {"title": "Third", "url": "https://www.youtube.com/watch?v=c", "duration": 30},
+]
+
+
+class FakeYoutubeDL:
+    def __init__(self, opts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=False):
+        return {"entries": ENTRIES}
+
+
+# the scraper writes to ../data and ../myprosody like the scripts in src/
+@pytest.fixture
+def playlist_dir(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "src").mkdir()
+    monkeypatch.chdir(tmp_path / "src")
+    monkeypatch.setattr(playlist_scraper.yt_dlp, "YoutubeDL", FakeYoutubeDL)
+    return tmp_path
+
+
+def saved_urls(playlist_dir):
+    with open(playlist_dir / "data" / "playlist_data.json") as f:
+        return [video["url"] for video in json.load(f)]
+
+
+# entries without a url are skipped instead of crashing the shard test, and the shards split the
+# other videos between them
+def test_entries_without_url_are_skipped_in_every_shard(playlist_dir):
+    urls = [e["url"] for e in ENTRIES if e and e.get("url")]
+    PlaylistScraper("https://www.youtube.com/playlist?list=x")
+    assert saved_urls(playlist_dir) == urls
+
+    sharded = []
+    for i in (1, 2):
+        PlaylistScraper("https://www.youtube.com/playlist?list=x", shard=(i, 2))
+        sharded += saved_urls(playlist_dir)
+    assert sorted(sharded) == sorted(urls)
@@ -0,0 +1,98 @@
+import wave
+import numpy as np
+import pytest
+from analyzers import prosody
+from analyzers.prosody import extract_features, extract_file
+
+SR = 16000
+
+# syllables and pauses of the synthetic speech, in seconds
+SYLLABLE = 0.2
+SYLLABLE_GAP = 0.12
+PAUSE = 1.0
+LEAD = 0.5
+
+
+# synthetic speech with a known answer: phrases of syllables of a constant f0 (a harmonic tone
+# with a raised-sine envelope, so every syllable is one intensity peak) separated by PAUSE seconds
+# of a quiet noise floor, returns the signal and its speaking time
+def synthetic_speech(phrases, syllables, f0, gain=0.3, sr=SR, seed=0):
+    rng = np.random.default_rng(seed)
+    phrase = syllables * (SYLLABLE + SYLLABLE_GAP) - SYLLABLE_GAP
+    seconds = 2 * LEAD + phrases * phrase + (phrases - 1) * PAUSE
+    x = rng.standard_normal(int(seconds * sr)).astype(np.float32) * 0.001
+    k = np.arange(int(SYLLABLE * sr)) / sr
+    syllable = np.sin(np.pi * k / SYLLABLE) ** 2 * sum(
+        np.sin(2 * np.pi * h * f0 * k) / h for h in range(1, 8)
+    )
+    t = LEAD
+    for _ in range(phrases):
+        for _ in range(syllables):
+            start = int(t * sr)
+            x[start : start + len(syllable)] += gain * syllable
+            t += SYLLABLE + SYLLABLE_GAP
+        t += PAUSE - SYLLABLE_GAP
+    return x, phrases * phrase
+
+
+@pytest.mark.parametrize("f0", [120, 150, 200])
+@pytest.mark.parametrize("phrases, syllables", [(6, 5), (4, 8)])
+def test_known_pitch_syllables_and_pauses(f0, phrases, syllables):
+    x, speaking = synthetic_speech(phrases, syllables, f0)
+    features = extract_features(x, SR)
+
+    assert features is not None
+    # like myspsolution.praat, the last intensity peak has no dip after it and isn't counted
+    assert abs(features["number_ of_syllables"] - phrases * syllables) <= 2
+    assert features["number_of_pauses"] == phrases - 1
+    assert features["speaking_duration"] == pytest.approx(speaking, abs=0.3)
+    assert features["original_duration"] == pytest.approx(len(x) / SR, abs=0.1)
+    assert features["f0_median"] == pytest.approx(f0, rel=0.02)
+    assert features["f0_mean"] == pytest.approx(f0, rel=0.02)
+    assert features["f0_std"] < 2
+    assert features["trimmed_seconds"] == 0
+
+
+# the thresholds are relative to the loudness of the recording, so the gain doesn't matter
+def test_gain_invariance():
+    loud = extract_features(synthetic_speech(6, 5, 150, gain=0.5)[0], SR)
+    quiet = extract_features(synthetic_speech(6, 5, 150, gain=0.05)[0], SR)
+    for column in ["number_ of_syllables", "number_of_pauses", "speaking_duration"]:
+        assert loud[column] == quiet[column]
+    assert loud["f0_median"] == pytest.approx(quiet["f0_median"], abs=1)
+
+
+# a 48 kHz 16-bit wav (what mysptotal was run on) gives the features of the 16 kHz signal
+def test_wav_matches_signal(tmp_path):
+    x, _ = synthetic_speech(6, 5, 150, sr=48000)
+    path = tmp_path / "talk.wav"
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(48000)
+        w.writeframes((np.clip(x, -1, 1) * 32767).astype("<i2").tobytes())
+
+    from_wav = extract_file(str(path))
+    from_signal = extract_features(synthetic_speech(6, 5, 150)[0], SR)
+    for column in ["number_ of_syllables", "number_of_pauses", "original_duration"]:
+        assert from_wav[column] == from_signal[column]
+    assert from_wav["speaking_duration"] == pytest.approx(
+        from_signal["speaking_duration"], abs=0.2
+    )
+    assert from_wav["f0_median"] == pytest.approx(from_signal["f0_median"], abs=1)
+
+
+# a recording analyzed in windows gives the features of the whole recording
+def test_windows_match_whole(monkeypatch):
+    x, _ = synthetic_speech(12, 5, 150)
+    whole = extract_features(x, SR)
+    monkeypatch.setattr(prosody, "CHUNK_SECONDS", 10)
+    monkeypatch.setattr(prosody, "CHUNK_OVERLAP", 2)
+    windowed = extract_features(x, SR)
+
+    for column in ["number_ of_syllables", "number_of_pauses"]:
+        assert abs(windowed[column] - whole[column]) <= 1
+    assert windowed["speaking_duration"] == pytest.approx(
+        whole["speaking_duration"], abs=0.3
+    )
+    assert windowed["f0_median"] == whole["f0_median"]
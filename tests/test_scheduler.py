@@ -0,0 +1,51 @@
+from analyzers import scheduler as scheduler_module
+from analyzers.scheduler import Scheduler
+
+GB = 1024**3
+
+
+def limits(monkeypatch, memory, free_disk=100 * GB, cpus=64):
+    monkeypatch.setattr(scheduler_module, "available_memory", lambda: memory)
+    s = Scheduler(cpus=cpus, audio_memory=GB // 2)
+    monkeypatch.setattr(s, "free_disk", lambda: free_disk)
+    with s.cond:
+        s.rebalance()
+    return s
+
+
+# with enough memory every download, conversion and extraction has an audio and every extraction
+# one more waiting, n_per_time has nothing to do with it
+def test_audios_keep_every_stage_busy(monkeypatch):
+    s = limits(monkeypatch, 256 * GB)
+    assert s.limits["extract"] == 48
+    assert s.limits["audio"] == (
+        s.limits["download"] + s.limits["convert"] + 2 * s.limits["extract"]
+    )
+
+
+# the audios are capped by the memory, the ones in flight keep theirs
+def test_audios_are_capped_by_memory(monkeypatch):
+    s = limits(monkeypatch, 10 * GB)
+    assert s.limits["audio"] == 20
+
+    for _ in range(20):
+        s.start("audio")
+    monkeypatch.setattr(scheduler_module, "available_memory", lambda: 1 * GB)
+    s.finish("audio")
+    # 19 audios hold 9.5 GB and 1 GB is left for 2 more
+    assert s.limits["audio"] == 21
+
+
+# with the disk nearly full only one audio waits per extraction
+def test_low_disk(monkeypatch):
+    s = limits(monkeypatch, 256 * GB, free_disk=GB)
+    assert s.limits["download"] == 1
+    assert s.limits["audio"] == s.limits["extract"] + 1
+
+
+# where the memory can't be read the audios are only sized from the stages
+def test_unknown_memory(monkeypatch):
+    s = limits(monkeypatch, None, cpus=4)
+    assert s.limits["audio"] == (
+        s.limits["download"] + s.limits["convert"] + 2 * s.limits["extract"]
+    )